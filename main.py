@@ -8,16 +8,22 @@ import signal
 import threading
 import time
 import yaml
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 # 添加 src 目录到路径
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
-from asr import ASREngine
+from asr import ASREngine, StreamingTranscriber
+from audio_conditioning import TimestampMap, prepare_for_asr
 from llm import LLMProcessor
+from prepolish import PrePolisher
+from model_lifecycle import ModelLifecycleManager
 from audio_recorder import SmartRecorder
-from input_handler import InputHandler
+from input_handler import IncrementalPaster, InputHandler
 from hotkey import HotkeyListener
 from ui import StatusWindow
 
@@ -44,6 +50,7 @@ class TypelessApp:
         logger.info("=" * 60)
         
         # 加载配置
+        self.config_path = config_path
         self.config = self.load_config(config_path)
         
         # 加载环境变量
@@ -52,16 +59,23 @@ class TypelessApp:
         # 初始化组件
         self.asr_engine = None
         self.llm_processor = None
+        self.prepolisher = None
         self.recorder = None
         self.input_handler = None
         self.hotkey_listener = None
         self.status_window = None
+        self.streaming_transcriber = None
+        self.model_lifecycle = None
         
         # 状态
         self.is_recording = False
         self.is_processing = False
+        self._state_lock = threading.Lock()
         self._shutdown_lock = threading.Lock()
         self._is_shutting_down = False
+        self.auto_stop = False
+        self._speculation_generation = 0
+        self._speculation = None  # (generation, thread, holder)
         self._stop_event = threading.Event()
         
         self.initialize_components()
@@ -83,13 +97,7 @@ class TypelessApp:
             # ASR 引擎
             asr_config = self.config['asr']
             logger.info("初始化 ASR 引擎...")
-            self.asr_engine = ASREngine(
-                model_size=asr_config['model_size'],
-                device=asr_config['device'],
-                compute_type=asr_config['compute_type'],
-                language=asr_config['language'],
-                cache_dir=asr_config.get('cache_dir', '~/.cache/whisper')
-            )
+            self.asr_engine = ASREngine.from_config(asr_config, self.config_path)
             preload_strategy = asr_config.get('preload_strategy', 'eager').lower()
             if preload_strategy not in {'lazy', 'background', 'eager'}:
                 logger.warning(f"未知的 ASR preload_strategy: {preload_strategy}，回退为 eager")
@@ -119,6 +127,23 @@ class TypelessApp:
             else:
                 logger.info("ASR 预加载模式: lazy（首次识别时再加载）")
             
+            # 空闲或超出内存预算时卸载模型；按下快捷键时提前重新加载
+            lifecycle_config = asr_config.get('lifecycle', {})
+            self.model_lifecycle = ModelLifecycleManager(
+                self.asr_engine,
+                idle_timeout=lifecycle_config.get('idle_unload_minutes', 0) * 60,
+                memory_budget_mb=lifecycle_config.get('memory_budget_mb', 0)
+            )
+            self.model_lifecycle.start()
+
+            if asr_config.get('streaming', False):
+                logger.info("ASR 流式识别: 已启用（边录边识别）")
+                self.streaming_transcriber = StreamingTranscriber(
+                    self.asr_engine,
+                    sample_rate=self.config['audio']['sample_rate'],
+                    step_seconds=asr_config.get('streaming_step', 1.0)
+                )
+            
             # LLM 处理器
             llm_config = self.config['llm']
             provider = os.getenv('LLM_PROVIDER', llm_config.get('provider', 'openrouter')).lower()
@@ -139,7 +164,9 @@ class TypelessApp:
                     system_prompt=llm_config['system_prompt'],
                     max_tokens=llm_config['max_tokens'],
                     temperature=llm_config['temperature'],
-                    timeout=llm_config['timeout']
+                    timeout=llm_config['timeout'],
+                    pool_size=llm_config.get('pool_size', 2),
+                    cache=llm_config.get('cache')
                 )
             
             elif provider == 'ollama':
@@ -154,13 +181,29 @@ class TypelessApp:
                     system_prompt=llm_config['system_prompt'],
                     max_tokens=llm_config['max_tokens'],
                     temperature=llm_config['temperature'],
-                    timeout=llm_config['timeout']
+                    timeout=llm_config['timeout'],
+                    pool_size=llm_config.get('pool_size', 2),
+                    residency=ollama_config.get('residency'),
+                    cache=llm_config.get('cache')
                 )
             
             else:
                 logger.error(f"不支持的 LLM provider: {provider}")
                 sys.exit(1)
             
+            if not self.config['features']['offline_mode']:
+                # 启动时建立连接；Ollama 模型未加载时在后台加载
+                self.llm_processor.prewarm()
+            
+            prepolish_config = llm_config.get('prepolish') or {}
+            if prepolish_config.get('enabled', False):
+                self.prepolisher = PrePolisher(
+                    fillers=prepolish_config.get('fillers'),
+                    threshold=prepolish_config.get('threshold', 0.35),
+                    sentence_gap=prepolish_config.get('sentence_gap', 0.8)
+                )
+                logger.info(f"本地预润色: 已启用（评分低于 {self.prepolisher.threshold} 时跳过 LLM）")
+            
             # 录音器
             audio_config = self.config['audio']
             logger.info("初始化录音器...")
@@ -169,8 +212,33 @@ class TypelessApp:
                 channels=audio_config['channels'],
                 silence_threshold=audio_config['silence_threshold'],
                 silence_duration=audio_config['silence_duration'],
-                max_duration=audio_config['max_duration']
+                max_duration=audio_config['max_duration'],
+                vad_options=audio_config.get('vad'),
+                persistent_stream=audio_config.get('persistent_stream', False),
+                preroll_ms=audio_config.get('preroll_ms', 300),
+                capture_rate=audio_config.get('capture_rate'),
+                spill_after_seconds=audio_config.get('spill_after_seconds'),
+                spill_dir=audio_config.get('spill_dir'),
+                dtype=audio_config.get('dtype', 'int16')
             )
+            if self.recorder.persistent_stream:
+                # 提前打开设备，按下快捷键时没有打开设备的延迟
+                self.recorder.open_stream()
+            self.auto_stop = audio_config.get('auto_stop', False)
+            if self.auto_stop:
+                logger.info(
+                    f"自动断句: 已启用（静音 {audio_config['silence_duration']}s 后停止，"
+                    f"{audio_config.get('speculative_delay', 0.5)}s 后提前识别）"
+                )
+                self.recorder.set_endpoint_callbacks(
+                    on_endpoint=self.on_endpoint,
+                    on_silence_start=self.on_silence_start,
+                    on_speech_resume=self.on_speech_resume,
+                    speculative_delay=audio_config.get('speculative_delay', 0.5)
+                )
+            else:
+                # 手动停止时录满 max_duration 也自动停止并识别，不覆盖录音开头
+                self.recorder.set_endpoint_callbacks(on_endpoint=self.on_endpoint, silence_stop=False)
             
             # 输入处理器
             logger.info("初始化输入处理器...")
@@ -200,26 +268,139 @@ class TypelessApp:
     
     def on_hotkey_pressed(self):
         """快捷键回调"""
-        if self.is_processing:
-            logger.info("正在处理中，忽略快捷键")
+        with self._state_lock:
+            if self.is_processing:
+                logger.info("正在处理中，忽略快捷键")
+                return
+            
+            if not self.is_recording:
+                # 开始录音
+                self.start_recording()
+            else:
+                # 停止录音并处理
+                self.stop_recording_and_process()
+    
+    def on_endpoint(self):
+        """自动断句回调（音频线程中调用）：说话结束或达到最大录音时长"""
+        def _stop():
+            with self._state_lock:
+                if self.is_recording and not self.is_processing:
+                    logger.info("🔇 自动停止录音")
+                    self.stop_recording_and_process()
+        
+        # 不能在音频回调里停止音频流，交给其他线程处理
+        threading.Thread(target=_stop, daemon=True, name="auto-stop").start()
+    
+    def on_silence_start(self, end_sample: int):
+        """静音开始回调（音频线程中调用）：提前识别已录到的语音"""
+        if self.streaming_transcriber or self.config['features'].get('segment_pipeline', False):
             return
         
-        if not self.is_recording:
-            # 开始录音
-            self.start_recording()
+        self._speculation_generation += 1
+        generation = self._speculation_generation
+        holder = {}
+        thread = threading.Thread(
+            target=self._run_speculation,
+            args=(generation, end_sample, holder),
+            daemon=True,
+            name="asr-speculative"
+        )
+        self._speculation = (generation, thread, holder)
+        thread.start()
+    
+    def on_speech_resume(self):
+        """又开始说话：作废提前识别的结果"""
+        self._speculation_generation += 1
+        self._speculation = None
+        logger.info("检测到继续说话，放弃提前识别结果")
+    
+    def _run_speculation(self, generation: int, end_sample: int, holder: dict):
+        """提前识别 [0, end_sample) 的音频，作废时尽早退出"""
+        try:
+            audio = self.recorder.peek_audio(end_sample)
+            if audio is None or len(audio) < 1000:
+                return
+            audio_float, timestamp_map, options = self._prepare_asr_audio(audio)
+            
+            started_at = time.perf_counter()
+            segments, info = self.asr_engine.iter_segments(audio_float, **options)
+            collected = []
+            for segment in segments:
+                if generation != self._speculation_generation:
+                    logger.info("提前识别已作废，停止解码")
+                    return
+                collected.append(segment.to_dict())
+            timestamp_map.map_segments(collected)
+            
+            holder['result'] = {
+                "text": "".join(segment["text"] for segment in collected).strip(),
+                "language": info["language"],
+                "language_probability": info["language_probability"],
+                "segments": collected
+            }
+            logger.info(f"提前识别完成，耗时 {time.perf_counter() - started_at:.2f}s")
+        except Exception as e:
+            logger.warning(f"提前识别失败，将在停止后重新识别: {e}")
+    
+    def _prepare_asr_audio(self, audio_data):
+        """
+        转换为 Whisper 需要的 float32，并按配置裁掉静音、压缩停顿
+        
+        Returns:
+            (audio_float, timestamp_map, 额外解码参数)
+        """
+        if isinstance(audio_data, np.memmap):
+            # 已转存到磁盘的长录音不整体读入内存，由 ASR 引擎分块读取和转换
+            return audio_data, TimestampMap.identity(len(audio_data), self.recorder.sample_rate), {}
+        if audio_data.dtype == np.float32:
+            # 录音回调中已转换为单声道 float32，这里只是零拷贝的视图
+            audio_float = audio_data.reshape(-1)
         else:
-            # 停止录音并处理
-            self.stop_recording_and_process()
+            # 转换为 float32 格式（Whisper 要求）
+            audio_float = audio_data.flatten().astype('float32') / 32768.0
+        return prepare_for_asr(
+            audio_float,
+            self.recorder.speech_labels(),
+            self.recorder.vad.frame_size,
+            self.config['asr'].get('conditioning'),
+            sample_rate=self.recorder.sample_rate
+        )
+    
+    def _take_speculative_result(self) -> Optional[dict]:
+        """取出仍然有效的提前识别结果（必要时等待其完成）"""
+        speculation = self._speculation
+        self._speculation = None
+        if speculation is None:
+            return None
+        
+        generation, thread, holder = speculation
+        if generation != self._speculation_generation:
+            return None
+        thread.join()
+        if generation != self._speculation_generation:
+            return None
+        return holder.get('result')
     
     def start_recording(self):
         """开始录音"""
         self.is_recording = True
+        self._speculation_generation += 1
+        self._speculation = None
         
         if self.status_window:
             self.status_window.show_recording()
         
         logger.info("🎤 开始录音")
+        if self.streaming_transcriber:
+            self.recorder.attach_queue(self.streaming_transcriber.start())
         self.recorder.start_recording()
+        if self.model_lifecycle:
+            # 模型已被卸载（或 lazy 模式尚未加载）时，与录音并行加载
+            self.model_lifecycle.prewarm()
+        if self.llm_processor and self.config['llm'].get('prewarm', True) \
+                and not self.config['features']['offline_mode']:
+            # 说话期间建立到 LLM API 的连接，润色时直接复用
+            self.llm_processor.prewarm()
     
     def stop_recording_and_process(self):
         """停止录音并处理"""
@@ -240,6 +421,8 @@ class TypelessApp:
         try:
             # 停止录音
             audio_data = self.recorder.stop_recording()
+            if self.streaming_transcriber:
+                self.recorder.detach_queue()
             
             if audio_data is None or len(audio_data) < 1000:
                 logger.warning("录音数据太短，跳过处理")
@@ -248,19 +431,41 @@ class TypelessApp:
                     time.sleep(1)
                     self.status_window.hide()
                 self.is_processing = False
+                if self.streaming_transcriber:
+                    self.streaming_transcriber.cancel()
                 return
             
-            # 转换为 float32 格式（Whisper 要求）
-            audio_float = audio_data.flatten().astype('float32') / 32768.0
-            
             # 语音识别
             if self.status_window:
                 self.status_window.show_processing("识别中")
             
             logger.info("🎯 开始语音识别")
-            asr_result = self.asr_engine.transcribe_numpy(audio_float)
+            if self.streaming_transcriber:
+                # 录音期间已完成大部分解码，这里只需处理尾部
+                asr_result = self.streaming_transcriber.finish()
+            else:
+                audio_float, timestamp_map, options = self._prepare_asr_audio(audio_data)
+                if self.config['features'].get('segment_pipeline', False):
+                    self.process_segments_pipelined(audio_float, timestamp_map, options)
+                    return
+                asr_result = self._take_speculative_result()
+                if asr_result is not None:
+                    logger.info("使用静音期间提前识别的结果")
+                else:
+                    asr_result = self.asr_engine.transcribe_numpy(audio_float, **options)
+                    timestamp_map.map_segments(asr_result['segments'])
             raw_text = asr_result['text']
+            if raw_text:
+                logger.info(f"识别结果: {raw_text}")
+            
+            # 本地预润色：去语气词、重复并补标点，之后的 LLM 也只处理清理过的文本
+            needs_llm = True
+            if raw_text and self.prepolisher:
+                prepolished = self.prepolisher.process(raw_text, asr_result.get('segments'))
+                raw_text, needs_llm = prepolished.text, prepolished.needs_llm
+                logger.info(f"预润色结果（评分 {prepolished.score:.2f}）: {raw_text}")
             
+            # 只有语气词的录音预润色后为空，同样按未识别处理
             if not raw_text:
                 logger.warning("未识别到文本")
                 if self.status_window:
@@ -270,26 +475,33 @@ class TypelessApp:
                 self.is_processing = False
                 return
             
-            logger.info(f"识别结果: {raw_text}")
-            
             # 文本润色
             offline_mode = self.config['features']['offline_mode']
+            auto_paste = self.config['features']['auto_paste']
+            pasted = False
             
             if offline_mode:
                 final_text = raw_text
                 logger.info("离线模式，跳过润色")
+            elif not needs_llm:
+                final_text = raw_text
+                logger.info("预润色后已足够干净，跳过 LLM")
             else:
                 if self.status_window:
-                    self.status_window.show_processing("润色中")
+                    self.status_window.show_processing(self._polish_label())
                 
                 logger.info("🤖 开始文本润色")
-                llm_result = self.llm_processor.polish(raw_text)
-                final_text = llm_result['polished_text']
+                if self.config['llm'].get('stream', False):
+                    pasted = auto_paste and self.config['features'].get('incremental_paste', False)
+                    final_text = self._polish_streaming(raw_text, pasted)
+                else:
+                    llm_result = self.llm_processor.polish(raw_text)
+                    final_text = llm_result['polished_text']
                 
                 logger.info(f"润色结果: {final_text}")
             
             # 自动输入
-            if self.config['features']['auto_paste']:
+            if auto_paste and not pasted:
                 if self.status_window:
                     self.status_window.complete_processing()
                     time.sleep(0.2)
@@ -317,6 +529,112 @@ class TypelessApp:
         finally:
             self.is_processing = False
     
+    def process_segments_pipelined(self, audio_float, timestamp_map, options: dict):
+        """
+        分段流水线：每解码出一个片段就立即交给润色和粘贴，不等待整段识别完成
+        
+        润色和粘贴各用一个单线程执行器，保证片段按识别顺序输出。
+        """
+        offline_mode = self.config['features']['offline_mode']
+        auto_paste = self.config['features']['auto_paste']
+        
+        segments, info = self.asr_engine.iter_segments(audio_float, **options)
+        final_parts = []
+        
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="polish") as polish_pool, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="paste") as paste_pool:
+            for segment in segments:
+                raw_text = segment.text.strip()
+                if not raw_text:
+                    continue
+                
+                start = timestamp_map.to_original(segment.start)
+                end = timestamp_map.to_original(segment.end)
+                logger.info(f"片段识别: [{start:.1f}s - {end:.1f}s] {raw_text}")
+                future = polish_pool.submit(self._polish_segment, raw_text, offline_mode)
+                
+                if auto_paste:
+                    paste_pool.submit(self._paste_segment, future, not final_parts)
+                final_parts.append(future)
+                
+                if self.status_window:
+                    self.status_window.show_processing(f"识别中 {end:.0f}s")
+        
+        final_text = "".join(future.result() for future in final_parts)
+        if not final_text:
+            logger.warning("未识别到文本")
+            if self.status_window:
+                self.status_window.update_message("⚠️ 未识别到内容")
+                time.sleep(1)
+                self.status_window.hide()
+            return
+        
+        logger.info(f"分段处理结果（{len(final_parts)} 段，语言={info['language']}）: {final_text}")
+        
+        if self.status_window:
+            self.status_window.update_message("完成")
+            time.sleep(0.8)
+            self.status_window.hide()
+        
+        logger.info("✅ 处理完成")
+    
+    def _polish_streaming(self, raw_text: str, incremental_paste: bool) -> str:
+        """
+        流式润色：收到的文本实时显示在状态窗口，开启增量粘贴时边收边粘贴
+        
+        Returns:
+            润色后的文本（失败时为原文）
+        """
+        paster = IncrementalPaster(self.input_handler) if incremental_paste else None
+        received = []
+        
+        def on_delta(delta: str):
+            received.append(delta)
+            if paster is not None:
+                paster.feed(delta)
+            if self.status_window:
+                self.status_window.update_message("润色中 " + "".join(received)[-12:])
+        
+        if paster is not None:
+            logger.info("⌨️ 增量输入文本")
+        try:
+            result = self.llm_processor.polish_stream(raw_text, on_delta=on_delta,
+                                                      incremental=paster is not None)
+        finally:
+            if paster is not None:
+                paster.close()
+        return result['polished_text']
+    
+    def _polish_label(self) -> str:
+        """润色阶段的状态文字（Ollama 模型还没加载好时提示用户）"""
+        residency = self.llm_processor.residency
+        if residency is not None and residency.state in ("cold", "loading"):
+            return "润色中（模型加载中）"
+        return "润色中"
+    
+    def _polish_segment(self, raw_text: str, offline_mode: bool = False) -> str:
+        """润色单个片段（离线模式下与整段处理一样只做本地预润色）"""
+        if self.prepolisher:
+            prepolished = self.prepolisher.process(raw_text)
+            if offline_mode or not prepolished.text or not prepolished.needs_llm:
+                # 为空时是只有语气词的片段，不必请求 LLM；整段都为空时按未识别处理
+                return prepolished.text
+            raw_text = prepolished.text
+        if offline_mode:
+            return raw_text
+        llm_result = self.llm_processor.polish(raw_text)
+        return llm_result['polished_text']
+    
+    def _paste_segment(self, future, is_first: bool):
+        """等待片段润色完成后粘贴"""
+        text = future.result()
+        if is_first:
+            time.sleep(0.6)  # 等待快捷键按键释放并回到目标输入焦点
+        if not text:
+            # 只有语气词的片段预润色后为空，不粘贴
+            return
+        self.input_handler.paste_text(text)
+    
     def run(self):
         """运行应用"""
         try:
@@ -366,6 +684,27 @@ class TypelessApp:
             except Exception as e:
                 logger.warning(f"停止快捷键监听失败: {e}")
         
+        if self.model_lifecycle:
+            self.model_lifecycle.stop()
+        
+        if self.asr_engine and self.asr_engine.language_cache:
+            logger.info(f"语言检测缓存统计: {self.asr_engine.language_cache.stats()}")
+        if self.asr_engine and self.asr_engine.transcript_cache:
+            logger.info(f"识别结果缓存统计: {self.asr_engine.transcript_cache.stats()}")
+        
+        if self.llm_processor:
+            if self.llm_processor.residency:
+                logger.info(f"Ollama 模型驻留统计: {self.llm_processor.residency.stats()}")
+            if self.llm_processor.cache:
+                logger.info(f"润色缓存统计: {self.llm_processor.cache.stats()}")
+            self.llm_processor.close()
+        
+        if self.recorder:
+            try:
+                self.recorder.close_stream()
+            except Exception as e:
+                logger.warning(f"关闭输入流失败: {e}")
+        
         if self.status_window:
             try:
                 self.status_window.stop()
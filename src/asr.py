@@ -1,46 +1,237 @@
 """
 ASR 模块 - 使用 faster-whisper 进行本地语音识别
 """
+import gc
 import os
 import logging
+import queue
 import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
 from faster_whisper import WhisperModel
+from faster_whisper.tokenizer import Tokenizer
+
+from asr_client import DEFAULT_SOCKET_PATH, ASRClient
+from audio_conditioning import iter_audio_chunks, speech_windows, to_float_mono
+from calibrate import load_host_profile
+from decoding import DECODING_PROFILES, LanguageCache, LatencyTuner
+from transcript_cache import TranscriptCache, audio_digest
+from vad import VoiceActivityDetector
 
 logger = logging.getLogger(__name__)
 
+# 批量解码只接受一个 Whisper 窗口（30 秒）以内的音频，以及以下解码参数
+BATCH_MAX_SAMPLES = 30 * 16000
+_BATCH_OPTIONS = {
+    "language", "vad_filter", "beam_size", "best_of", "temperature", "patience",
+    "length_penalty", "condition_on_previous_text", "track_latency", "route",
+}
+
+
+class TranscriptionSegment(NamedTuple):
+    """识别片段"""
+    
+    start: float
+    end: float
+    text: str
+    avg_logprob: float = 0.0
+    no_speech_prob: float = 0.0
+    words: Optional[List[Tuple[float, float, str]]] = None
+    
+    def to_dict(self) -> dict:
+        """转换为旧版结果中的片段字典 {start, end, text}"""
+        return {"start": self.start, "end": self.end, "text": self.text}
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "TranscriptionSegment":
+        """从 _asdict() 的结果（经过 JSON 往返）还原片段"""
+        return cls(
+            start=data["start"],
+            end=data["end"],
+            text=data["text"],
+            avg_logprob=data.get("avg_logprob", 0.0),
+            no_speech_prob=data.get("no_speech_prob", 0.0),
+            words=[tuple(word) for word in data["words"]] if data.get("words") else None
+        )
+
 
 class ASREngine:
     """语音识别引擎"""
     
     def __init__(self, model_size: str = "tiny", device: str = "cpu", 
-                 compute_type: str = "int8", language: str = "zh",
-                 cache_dir: str = "~/.cache/whisper"):
+                 compute_type: Optional[str] = None, language: str = "zh",
+                 cache_dir: str = "~/.cache/whisper", chunk_seconds: float = 30.0,
+                 long_form_seconds: float = 120.0, num_workers: int = 1,
+                 cpu_threads: int = 0, profile: str = "accurate",
+                 latency_target: float = 2.0, use_host_profile: bool = True,
+                 routing: Optional[dict] = None, warmup: bool = True,
+                 server: Optional[dict] = None, language_cache: Optional[dict] = None,
+                 transcript_cache: Optional[dict] = None):
         """
         初始化 ASR 引擎
         
         Args:
             model_size: 模型大小 (tiny, base, small, medium, large-v3-turbo, large)
             device: 计算设备 (cpu, cuda)
-            compute_type: 计算类型 (int8, float16, float32)
+            compute_type: 计算类型 (int8, float16, float32)；None 表示使用本机校准结果，未校准时为 int8
             language: 主要语言代码 (zh, en, auto)
             cache_dir: 模型缓存目录
+            chunk_seconds: 长音频分块解码时每块的时长（秒）
+            long_form_seconds: 超过该时长的音频分块解码，内存占用不随时长增长
+            num_workers: 模型并行解码的路数；大于 1 时长音频按 VAD 切成窗口并行解码
+            cpu_threads: 每路解码的 CPU 线程数（0 表示按 CPU 核数平均分配）
+            profile: 解码档位 (realtime, balanced, accurate, auto)；auto 按实测耗时自动切换
+            latency_target: auto 档位下单次识别的耗时目标（秒）
+            use_host_profile: 是否使用 calibrate.py 在本机校准出的 compute_type 和线程数
+                （只填补未显式配置的项：compute_type 为 None、cpu_threads 为 0）
+            routing: 大小模型路由配置 {small_model, max_seconds, min_speech_ratio, escalate,
+                escalate_logprob, escalate_no_speech}；small_model 为空时不启用
+            warmup: 加载后是否用一小段合成音频预热一次（首次识别不再承担惰性分配的开销）
+            server: 常驻 ASR 服务配置 {enabled, socket, autostart, request_timeout, config}；启用时识别
+                请求交给 asr_server.py 进程，服务不可用或超时未响应时回退为本地加载模型
+            language_cache: language 为 auto 时的语言检测缓存配置 {enabled, min_probability,
+                recheck_every, session_minutes, suspect_logprob}
+            transcript_cache: 识别结果缓存配置 {enabled, dir, max_mb}；启用时 transcribe 对同一段
+                音频和相同参数直接返回上次的结果
         """
         self.model_size = model_size
         self.device = device
-        self.compute_type = compute_type
         self.language = None if language == "auto" else language
         self.cache_dir = os.path.expanduser(cache_dir)
+        
+        configured_compute_type = compute_type
+        host_profile = load_host_profile(cache_dir, model_size, device) if use_host_profile else None
+        if host_profile:
+            # 显式配置优先，校准结果只填补未配置的项
+            applied, kept = [], []
+            if compute_type is None:
+                compute_type = host_profile["compute_type"]
+                applied.append(f"compute_type={compute_type}")
+            elif compute_type != host_profile["compute_type"]:
+                kept.append(f"compute_type={compute_type}（校准为 {host_profile['compute_type']}）")
+            if cpu_threads <= 0 and num_workers <= 1:
+                cpu_threads = host_profile["cpu_threads"]
+                applied.append(f"cpu_threads={cpu_threads}")
+            elif cpu_threads > 0 and cpu_threads != host_profile["cpu_threads"]:
+                kept.append(f"cpu_threads={cpu_threads}（校准为 {host_profile['cpu_threads']}）")
+            if applied:
+                logger.info(f"使用本机校准配置: {', '.join(applied)}（校准 RTF {host_profile['rtf']:.3f}）")
+            if kept:
+                logger.info(f"显式配置优先于本机校准结果: {', '.join(kept)}")
+        self.compute_type = compute_type or "int8"
         self.model: Optional[WhisperModel] = None
         self._model_lock = threading.Lock()
+        self.warmup = warmup
+        self.last_used = time.monotonic()
+        self.chunk_seconds = chunk_seconds
+        self.long_form_seconds = long_form_seconds
+        self.num_workers = max(int(num_workers), 1)
+        if cpu_threads <= 0 and self.num_workers > 1:
+            # 多路并行时平分核数，避免线程超订
+            cpu_threads = max((os.cpu_count() or 1) // self.num_workers, 1)
+        self.cpu_threads = cpu_threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        if profile != "auto" and profile not in DECODING_PROFILES:
+            logger.warning(f"未知的解码档位: {profile}，回退为 accurate")
+            profile = "accurate"
+        self.profile = profile
+        self.tuner = LatencyTuner(latency_target) if profile == "auto" else None
+        
+        # 自动语言：检测出的语言置信度高时后续识别沿用
+        language_cache = language_cache or {}
+        self.language_cache: Optional[LanguageCache] = None
+        if self.language is None and language_cache.get("enabled", True):
+            self.language_cache = LanguageCache(
+                min_probability=language_cache.get("min_probability", 0.8),
+                recheck_every=language_cache.get("recheck_every", 20),
+                session_seconds=language_cache.get("session_minutes", 10) * 60,
+                suspect_logprob=language_cache.get("suspect_logprob", -1.0)
+            )
+        
+        transcript_cache = transcript_cache or {}
+        self.transcript_cache: Optional[TranscriptCache] = None
+        if transcript_cache.get("enabled", False):
+            self.transcript_cache = TranscriptCache(
+                transcript_cache.get("dir", "~/.cache/typeless/transcripts"),
+                max_mb=transcript_cache.get("max_mb", 50)
+            )
+        
+        server = server or {}
+        self.client: Optional[ASRClient] = None
+        if server.get("enabled", False):
+            self.client = ASRClient(
+                server.get("socket", DEFAULT_SOCKET_PATH),
+                autostart=server.get("autostart", True),
+                config_path=server.get("config"),
+                request_timeout=server.get("request_timeout", 120.0)
+            )
+        
+        # 大小模型路由：短句交给常驻的小模型，置信度低时再交给大模型
+        self.routing = dict(routing or {})
+        self.small_engine: Optional[ASREngine] = None
+        small_model = self.routing.get("small_model")
+        if small_model and small_model != model_size:
+            self.small_engine = ASREngine(
+                model_size=small_model, device=device, compute_type=configured_compute_type,
+                language=language, cache_dir=cache_dir, profile=profile,
+                use_host_profile=use_host_profile, warmup=warmup
+            )
         
         logger.info(
-            f"初始化 ASR 引擎: model={model_size}, device={device}, cache_dir={self.cache_dir}"
+            f"初始化 ASR 引擎: model={model_size}, device={device}, profile={profile}, "
+            f"cache_dir={self.cache_dir}"
+        )
+    
+    @classmethod
+    def from_config(cls, asr_config: dict, config_path: Optional[str] = None) -> "ASREngine":
+        """
+        按 config.yaml 中的 asr 配置创建引擎
+        
+        Args:
+            asr_config: asr 配置
+            config_path: 配置文件路径（自动启动 ASR 服务时传给服务进程）
+        """
+        server = dict(asr_config.get('server') or {})
+        if config_path:
+            server.setdefault('config', os.path.abspath(config_path))
+        return cls(
+            model_size=asr_config['model_size'],
+            device=asr_config['device'],
+            compute_type=asr_config.get('compute_type'),
+            language=asr_config['language'],
+            cache_dir=asr_config.get('cache_dir', '~/.cache/whisper'),
+            chunk_seconds=asr_config.get('chunk_seconds', 30.0),
+            long_form_seconds=asr_config.get('long_form_seconds', 120.0),
+            num_workers=asr_config.get('num_workers', 1),
+            cpu_threads=asr_config.get('cpu_threads', 0),
+            profile=asr_config.get('profile', 'accurate'),
+            latency_target=asr_config.get('latency_target', 2.0),
+            use_host_profile=asr_config.get('use_host_profile', True),
+            routing=asr_config.get('routing'),
+            warmup=asr_config.get('lifecycle', {}).get('warmup', True),
+            server=server,
+            language_cache=asr_config.get('language_cache'),
+            transcript_cache=asr_config.get('transcript_cache')
         )
     
     def load_model(self):
-        """加载模型（首次使用时会自动下载）"""
+        """加载模型（首次使用时会自动下载；启用路由时同时加载小模型；服务模式下只连接服务）"""
+        if self.client is not None:
+            try:
+                status = self.client.connect()
+                logger.info(
+                    f"已连接 ASR 服务: {self.client.socket_path}"
+                    f"（模型 {status.get('model')}，pid {status.get('pid')}）"
+                )
+                return
+            except OSError as e:
+                logger.warning(f"ASR 服务不可用，改为本地加载模型: {e}")
+                self.client = None
+        if self.small_engine is not None:
+            self.small_engine.load_model()
         if self.model is not None:
             logger.info("模型已加载，跳过")
             return
@@ -59,6 +250,8 @@ class ASREngine:
                         self.model_size,
                         device=self.device,
                         compute_type=self.compute_type,
+                        cpu_threads=self.cpu_threads,
+                        num_workers=self.num_workers,
                         download_root=self.cache_dir,
                         local_files_only=True
                     )
@@ -70,6 +263,8 @@ class ASREngine:
                         self.model_size,
                         device=self.device,
                         compute_type=self.compute_type,
+                        cpu_threads=self.cpu_threads,
+                        num_workers=self.num_workers,
                         download_root=self.cache_dir,
                         local_files_only=False
                     )
@@ -79,51 +274,432 @@ class ASREngine:
                 elapsed = time.perf_counter() - started_at
                 logger.error(f"模型加载失败（耗时 {elapsed:.2f}s）: {e}")
                 raise
+            
+            if self.warmup:
+                self.warm_up()
+            self.last_used = time.monotonic()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """模型是否已加载（服务模式下模型由服务进程持有，视为已加载）"""
+        return self.client is not None or self.model is not None
+    
+    def warm_up(self):
+        """用一秒低噪声合成音频跑一次完整解码，触发模型的惰性分配"""
+        model = self.model
+        if model is None:
+            return
+        started_at = time.perf_counter()
+        audio = np.random.default_rng(0).normal(0, 0.01, 16000).astype(np.float32)
+        options = dict(DECODING_PROFILES[self.active_profile], temperature=[0.0])
+        try:
+            segments, _ = model.transcribe(audio, language=self.language, vad_filter=False, **options)
+            for _ in segments:
+                pass
+        except Exception as e:
+            logger.warning(f"模型预热失败: {e}")
+            return
+        logger.info(f"模型预热完成: {self.model_size}，耗时 {time.perf_counter() - started_at:.2f}s")
+        if self.language_cache is not None and model.model.is_multilingual:
+            # 测一次解码器上的语言检测耗时，用来估算沿用语言省下的时间
+            self._detected_languages(model, self._encode(model, [audio]))
     
-    def transcribe(self, audio_file: str) -> dict:
+    def unload_model(self) -> bool:
         """
-        转录音频文件
+        卸载模型释放内存（下次识别时会重新加载）
+        
+        每次解码开始时取得一次模型引用，分块、并行窗口、语言检测和批量解码都只用这个引用，
+        不会再读 self.model；卸载只是放下引擎自己的引用，正在进行的解码用原模型完成后才真正释放。
+        
+        Returns:
+            是否卸载了模型（大模型或路由用的小模型）
+        """
+        with self._model_lock:
+            unloaded = self.model is not None
+            self.model = None
+        # 只用过小模型（大模型未加载或已卸载）时也要放下小模型
+        small_unloaded = self.small_engine is not None and self.small_engine.unload_model()
+        if unloaded:
+            gc.collect()
+            logger.info(f"模型已卸载: {self.model_size}")
+        return unloaded or small_unloaded
+    
+    @property
+    def active_profile(self) -> str:
+        """当前使用的解码档位（auto 模式下为自动选中的档位）"""
+        return self.tuner.profile if self.tuner else self.profile
+    
+    def iter_segments(self, audio, track_latency: bool = True, route: bool = True,
+                      **options) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        """
+        转录音频，边解码边产出片段
+        
+        片段是惰性解码的：调用方每取一个片段，模型才继续解码下一段，下游可以在后续
+        片段解码完成前就开始处理已产出的片段。
         
         Args:
-            audio_file: 音频文件路径
+            audio: 音频文件路径，或 NumPy 数组 (采样率 16000)；int16、多声道、
+                np.memmap 或超过 long_form_seconds 的数组会分块读取和解码
+            track_latency: 是否计入 auto 档位的耗时统计（流式识别的增量解码不计入）
+            route: 是否允许路由到小模型（流式识别需要前后一致，不路由）
+            **options: 透传给 WhisperModel.transcribe 的解码参数（覆盖档位默认值）
             
         Returns:
-            包含识别结果的字典 {text, language, segments}
+            (片段生成器, 信息字典 {language, language_probability, duration})
         """
-        if self.model is None:
+        self.last_used = time.monotonic()
+        if self.client is not None:
+            try:
+                return self._iter_remote(audio, track_latency=track_latency, route=route, **options)
+            except OSError as e:
+                logger.warning(f"ASR 服务不可用，改为本地识别: {e}")
+                self.client = None
+        model = self._bound_model()
+        
+        decode_options = {
+            "language": self.language,
+            "vad_filter": True,  # 启用 VAD 过滤静音
+        }
+        decode_options.update(DECODING_PROFILES[self.active_profile])
+        decode_options.update(options)
+        
+        started_at = time.perf_counter()
+        cached_language = None
+        if self.language_cache is not None and "language" not in options:
+            cached_language = self.language_cache.lookup()
+            if cached_language is not None:
+                decode_options["language"] = cached_language[0]
+        speech_ratio = None
+        if route and self.small_engine is not None and not isinstance(audio, str):
+            speech_ratio = self._small_route_ratio(audio)
+        
+        if isinstance(audio, str):
+            logger.info(f"开始转录音频: {audio}")
+            segments, info_dict = self._iter_whole(model, audio, decode_options)
+        elif speech_ratio is not None:
+            segments, info_dict = self._iter_routed(model, audio, decode_options, speech_ratio)
+        elif self._needs_chunking(audio):
+            if self.num_workers > 1:
+                segments, info_dict = self._iter_parallel_segments(model, audio, decode_options)
+            else:
+                segments, info_dict = self._iter_chunked_segments(model, audio, decode_options)
+        else:
+            logger.info("开始转录音频数据")
+            segments, info_dict = self._iter_whole(model, audio, decode_options)
+        
+        if self.language_cache is not None and "language" not in options:
+            if cached_language is None:
+                # 由本次解码检测语言（faster-whisper 复用第一个窗口的编码器输出，不多跑编码器），从结果学习
+                self.language_cache.record_detection(info_dict["language"], info_dict["language_probability"])
+            else:
+                language, probability = cached_language
+                # 指定语言时 faster-whisper 报告的概率恒为 1，这里换成检测时的概率
+                info_dict["language_probability"] = probability
+                segments = self._check_cached_language(segments, language)
+        
+        if self.tuner is not None and track_latency:
+            segments = self._track_latency(segments, time.perf_counter() - started_at, info_dict["duration"])
+        return self._mark_used(segments), info_dict
+    
+    def _bound_model(self) -> WhisperModel:
+        """取得本次解码使用的模型（未加载时先加载），整个解码过程只用这一个引用"""
+        model = self.model
+        if model is None:
             self.load_model()
+            model = self.model
+        return model
+    
+    def _check_cached_language(self, segments: Iterator[TranscriptionSegment],
+                               language: str) -> Iterator[TranscriptionSegment]:
+        """沿用语言解码完成后检查结果，疑似换了语言时下次重新检测"""
+        texts = []
+        weighted = total = 0.0
+        for segment in segments:
+            duration = max(segment.end - segment.start, 1e-3)
+            texts.append(segment.text)
+            weighted += segment.avg_logprob * duration
+            total += duration
+            yield segment
+        if total:
+            self.language_cache.check_result(language, "".join(texts), weighted / total)
+    
+    def _mark_used(self, segments: Iterator[TranscriptionSegment]) -> Iterator[TranscriptionSegment]:
+        """解码过程中持续刷新最近使用时间，避免长音频解码期间被判为空闲"""
+        self.last_used = time.monotonic()
+        for segment in segments:
+            self.last_used = time.monotonic()
+            yield segment
+        self.last_used = time.monotonic()
+    
+    def _iter_remote(self, audio, **options) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        """交给 ASR 服务识别（服务返回完整结果，片段不再是惰性的）"""
+        result = self.client.transcribe(audio, **options)
+        segments = [TranscriptionSegment.from_dict(segment) for segment in result["segments"]]
+        info_dict = {
+            "language": result["language"],
+            "language_probability": result["language_probability"],
+            "duration": result["duration"]
+        }
+        return iter(segments), info_dict
+    
+    def _small_route_ratio(self, audio: np.ndarray) -> Optional[float]:
+        """按时长和 VAD 语音占比决定是否交给小模型，交给小模型时返回语音占比，否则返回 None"""
+        duration = len(audio) / 16000
+        max_seconds = self.routing.get("max_seconds", 4.0)
+        if duration > max_seconds:
+            logger.info(f"路由: 大模型（{duration:.1f}s 超过 {max_seconds}s）")
+            return None
+        labels, _ = self._label_speech(audio)
+        ratio = float(labels.mean()) if len(labels) else 0.0
+        if ratio < self.routing.get("min_speech_ratio", 0.3):
+            # 语音稀疏（噪声大或声音轻）时小模型容易出错
+            logger.info(f"路由: 大模型（{duration:.1f}s，语音占比 {ratio:.2f} 过低）")
+            return None
+        return ratio
+    
+    def _iter_routed(self, model: WhisperModel, audio: np.ndarray, decode_options: dict,
+                     speech_ratio: float) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        """小模型解码；置信度低时升级到大模型重新解码"""
+        duration = len(audio) / 16000
+        started_at = time.perf_counter()
+        segments, info_dict = self.small_engine.iter_segments(
+            audio, track_latency=False, route=False, **decode_options
+        )
+        collected = list(segments)
+        small_seconds = time.perf_counter() - started_at
         
-        try:
-            logger.info(f"开始转录音频: {audio_file}")
-            segments, info = self.model.transcribe(
-                audio_file,
-                language=self.language,
-                vad_filter=True,  # 启用 VAD 过滤静音
-                beam_size=5
+        reason = self._escalation_reason(collected) if self.routing.get("escalate", True) else None
+        if reason is None:
+            logger.info(
+                f"路由: 小模型 {self.small_engine.model_size}（{duration:.1f}s，"
+                f"语音占比 {speech_ratio:.2f}），耗时 {small_seconds:.2f}s"
+            )
+            return iter(collected), info_dict
+        
+        logger.info(
+            f"路由: 小模型 {self.small_engine.model_size} 置信度低（{reason}），"
+            f"升级到 {self.model_size}，已耗时 {small_seconds:.2f}s"
+        )
+        segments, info_dict = self._iter_whole(model, to_float_mono(audio), decode_options)
+        return self._log_escalation(segments, started_at, small_seconds), info_dict
+    
+    def _escalation_reason(self, segments: List[TranscriptionSegment]) -> Optional[str]:
+        if not segments or not "".join(segment.text for segment in segments).strip():
+            return "未识别到文本"
+        total = sum(max(segment.end - segment.start, 1e-3) for segment in segments)
+        logprob = sum(s.avg_logprob * max(s.end - s.start, 1e-3) for s in segments) / total
+        no_speech = max(segment.no_speech_prob for segment in segments)
+        if logprob < self.routing.get("escalate_logprob", -0.8):
+            return f"avg_logprob={logprob:.2f}"
+        if no_speech > self.routing.get("escalate_no_speech", 0.6):
+            return f"no_speech_prob={no_speech:.2f}"
+        return None
+    
+    @staticmethod
+    def _log_escalation(segments: Iterator[TranscriptionSegment], started_at: float,
+                        small_seconds: float) -> Iterator[TranscriptionSegment]:
+        yield from segments
+        total = time.perf_counter() - started_at
+        logger.info(f"路由: 升级后总耗时 {total:.2f}s（其中小模型 {small_seconds:.2f}s 被浪费）")
+    
+    def _iter_whole(self, model: WhisperModel, audio,
+                    decode_options: dict) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        segments, info = model.transcribe(audio, **decode_options)
+        
+        info_dict = {
+            "language": info.language,
+            "language_probability": info.language_probability,
+            "duration": info.duration
+        }
+        return self._wrap_segments(segments), info_dict
+    
+    def _track_latency(self, segments: Iterator[TranscriptionSegment], setup_seconds: float,
+                       duration: float) -> Iterator[TranscriptionSegment]:
+        """统计解码耗时（只计模型解码的时间，不含调用方在片段之间的处理时间）"""
+        busy = setup_seconds
+        while True:
+            started_at = time.perf_counter()
+            try:
+                segment = next(segments)
+            except StopIteration:
+                break
+            busy += time.perf_counter() - started_at
+            yield segment
+        busy += time.perf_counter() - started_at
+        # 中途放弃的解码（如作废的提前识别）不计入
+        self.tuner.record(busy, duration)
+    
+    def _needs_chunking(self, audio: np.ndarray) -> bool:
+        return (
+            isinstance(audio, np.memmap)
+            or audio.dtype != np.float32
+            or audio.ndim > 1
+            or len(audio) > self.long_form_seconds * 16000
+        )
+    
+    def _iter_chunked_segments(self, model: WhisperModel, audio: np.ndarray,
+                               decode_options: dict) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        """分块解码长音频，片段时间戳换算为整段音频中的时间"""
+        duration = len(audio) / 16000
+        logger.info(f"开始分块转录音频: {duration:.1f}s，每块最长 {self.chunk_seconds:.0f}s")
+        
+        chunks = iter_audio_chunks(audio, 16000, self.chunk_seconds)
+        offset, first_chunk = next(chunks)
+        segments, info = model.transcribe(first_chunk, **decode_options)
+        
+        # 后续块沿用首块检测到的语言，并用上一块末尾文本作为提示保持上下文
+        options = dict(decode_options, language=info.language)
+        
+        def generate():
+            previous_text = ""
+            chunk_segments, chunk_offset = segments, offset
+            while True:
+                for segment in self._wrap_segments(chunk_segments, chunk_offset / 16000):
+                    previous_text = (previous_text + segment.text)[-200:]
+                    yield segment
+                try:
+                    chunk_offset, chunk = next(chunks)
+                except StopIteration:
+                    return
+                chunk_segments, _ = model.transcribe(
+                    chunk, initial_prompt=previous_text or None, **options
+                )
+        
+        info_dict = {
+            "language": info.language,
+            "language_probability": info.language_probability,
+            "duration": duration
+        }
+        return generate(), info_dict
+    
+    def _iter_parallel_segments(self, model: WhisperModel, audio: np.ndarray,
+                                decode_options: dict) -> Tuple[Iterator[TranscriptionSegment], dict]:
+        """
+        按 VAD 边界切成 chunk_seconds 的窗口，num_workers 路并行解码
+        
+        窗口之间的静音不解码；结果按时间顺序产出，时间戳换算为整段音频中的时间。
+        并行解码时各窗口拿不到前一窗口的文本作为提示。
+        """
+        duration = len(audio) / 16000
+        labels, frame_size = self._label_speech(audio)
+        windows = speech_windows(audio, labels, frame_size, int(self.chunk_seconds * 16000))
+        speech_seconds = sum(end - start for start, end in windows) / 16000
+        logger.info(
+            f"开始并行转录音频: {duration:.1f}s，{len(windows)} 个窗口"
+            f"（语音 {speech_seconds:.1f}s），{self.num_workers} 路并行"
+        )
+        
+        options = dict(decode_options, vad_filter=False)
+        language, probability = options.get("language"), 1.0
+        if not windows:
+            return iter(()), {"language": language, "language_probability": 0.0, "duration": duration}
+        
+        executor = self._get_executor()
+        futures = []
+        if language is None:
+            # 未指定语言时先解码第一个窗口检测语言，其余窗口沿用
+            first = executor.submit(self._decode_window, model, audio, windows[0], options)
+            _, info = first.result()
+            language, probability = info.language, info.language_probability
+            options["language"] = language
+            futures.append(first)
+            windows = windows[1:]
+        futures.extend(executor.submit(self._decode_window, model, audio, window, options) for window in windows)
+        
+        def generate():
+            try:
+                for future in futures:
+                    yield from future.result()[0]
+            finally:
+                for future in futures:
+                    future.cancel()
+        
+        info_dict = {
+            "language": language,
+            "language_probability": probability,
+            "duration": duration
+        }
+        return generate(), info_dict
+    
+    def _decode_window(self, model: WhisperModel, audio: np.ndarray, window: Tuple[int, int], options: dict):
+        """在工作线程中完整解码一个窗口（片段生成器必须在这里消费完）"""
+        start, end = window
+        segments, info = model.transcribe(to_float_mono(audio[start:end]), **options)
+        return list(self._wrap_segments(segments, start / 16000)), info
+    
+    @staticmethod
+    def _label_speech(audio: np.ndarray, block_frames: int = 16000 * 60) -> Tuple[np.ndarray, int]:
+        """分块流式计算 VAD 标签（磁盘上的 memmap 不会被整体读入内存），返回 (标签, 帧长)"""
+        vad = VoiceActivityDetector(sample_rate=16000)
+        labels = [vad.process(audio[i:i + block_frames]) for i in range(0, len(audio), block_frames)]
+        return (np.concatenate(labels) if labels else np.zeros(0, dtype=bool)), vad.frame_size
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="asr-window")
+        return self._executor
+    
+    @staticmethod
+    def _wrap_segments(segments, offset: float = 0.0) -> Iterator[TranscriptionSegment]:
+        for segment in segments:
+            words = None
+            if segment.words:
+                words = [(offset + word.start, offset + word.end, word.word) for word in segment.words]
+            yield TranscriptionSegment(
+                start=offset + segment.start,
+                end=offset + segment.end,
+                text=segment.text,
+                avg_logprob=segment.avg_logprob,
+                no_speech_prob=segment.no_speech_prob,
+                words=words
             )
+    
+    def transcribe(self, audio, **options) -> dict:
+        """
+        转录音频并收集全部片段
+        
+        启用识别结果缓存时，先按音频内容和解码参数查缓存，命中时不再解码。
+        
+        Args:
+            audio: 音频文件路径，或 NumPy 数组 (float32, 采样率 16000)
+            **options: 解码参数（见 iter_segments）
             
-            # 收集所有片段的文本
-            text_parts = []
-            all_segments = []
+        Returns:
+            包含识别结果的字典 {text, language, language_probability, segments}
+        """
+        try:
+            cached = cache_key = None
+            if self.transcript_cache is not None:
+                cache_key = audio_digest(audio, self._cache_params(options))
+                cached = self.transcript_cache.get(cache_key)
             
-            for segment in segments:
-                text_parts.append(segment.text)
-                all_segments.append({
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text
-                })
+            if cached is not None:
+                segments = [TranscriptionSegment.from_dict(segment) for segment in cached["segments"]]
+                info = cached
+                logger.info(f"命中识别缓存，跳过解码（命中率 {self.transcript_cache.stats()['hit_rate']:.0%}）")
+            else:
+                segment_iter, info = self.iter_segments(audio, **options)
+                segments = list(segment_iter)
+                if cache_key is not None:
+                    self.transcript_cache.put(cache_key, {
+                        "language": info["language"],
+                        "language_probability": info["language_probability"],
+                        "duration": info["duration"],
+                        "segments": [segment._asdict() for segment in segments]
+                    })
             
-            full_text = "".join(text_parts).strip()
+            # 收集所有片段的文本
+            all_segments = [segment.to_dict() for segment in segments]
+            full_text = "".join(segment["text"] for segment in all_segments).strip()
             
             result = {
                 "text": full_text,
-                "language": info.language,
-                "language_probability": info.language_probability,
+                "language": info["language"],
+                "language_probability": info["language_probability"],
                 "segments": all_segments
             }
             
-            logger.info(f"转录完成: 语言={info.language}, 文本长度={len(full_text)}")
+            logger.info(f"转录完成: 语言={info['language']}, 文本长度={len(full_text)}")
             logger.debug(f"识别文本: {full_text}")
             
             return result
@@ -132,9 +708,20 @@ class ASREngine:
             logger.error(f"转录失败: {e}")
             raise
     
-    def transcribe_numpy(self, audio_data) -> dict:
+    def _cache_params(self, options: dict) -> dict:
+        """影响识别结果的参数（识别结果缓存的键）"""
+        return {
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "language": self.language,
+            "profile": self.active_profile,
+            "small_model": self.small_engine.model_size if self.small_engine else None,
+            "options": options,
+        }
+    
+    def transcribe_numpy(self, audio_data, **options) -> dict:
         """
-        转录 NumPy 数组格式的音频
+        转录 NumPy 数组格式的音频（兼容旧接口，等同于 transcribe）
         
         Args:
             audio_data: NumPy 数组 (float32, 采样率 16000)
@@ -142,52 +729,366 @@ class ASREngine:
         Returns:
             包含识别结果的字典
         """
-        if self.model is None:
-            self.load_model()
+        return self.transcribe(audio_data, **options)
+    
+    def can_batch(self, audio, options: dict) -> bool:
+        """音频和解码参数是否可以交给 transcribe_batch（30 秒以内的一维 float32 数组）"""
+        return (
+            isinstance(audio, np.ndarray)
+            and audio.ndim == 1
+            and audio.dtype == np.float32
+            and 0 < len(audio) <= BATCH_MAX_SAMPLES
+            and set(options) <= _BATCH_OPTIONS
+        )
+    
+    def transcribe_batch(self, audios: List[np.ndarray],
+                         **options) -> List[Tuple[List[TranscriptionSegment], dict]]:
+        """
+        批量解码多段短音频：所有音频一起过一次编码器，再一起做一次束搜索
         
-        try:
-            logger.info("开始转录音频数据")
-            segments, info = self.model.transcribe(
-                audio_data,
-                language=self.language,
-                vad_filter=True,
-                beam_size=5
-            )
-            
-            text_parts = []
-            all_segments = []
-            
-            for segment in segments:
-                text_parts.append(segment.text)
-                all_segments.append({
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text
-                })
-            
-            full_text = "".join(text_parts).strip()
-            
-            result = {
-                "text": full_text,
-                "language": info.language,
-                "language_probability": info.language_probability,
-                "segments": all_segments
-            }
+        并发请求多时吞吐量远高于逐段解码。代价是不做 VAD 过滤、温度回退和词级时间戳，
+        每段音频最多产出一个覆盖整段的片段。哪些音频和参数可以批量解码见 can_batch。
+        
+        Args:
+            audios: 音频列表（一维 float32，采样率 16000，每段不超过 30 秒）
+            **options: 解码参数（只使用 language、beam_size、patience、length_penalty）
             
-            logger.info(f"转录完成: {full_text}")
-            return result
+        Returns:
+            与 audios 一一对应的 [(片段列表, 信息字典 {language, language_probability, duration})]
+        """
+        self.last_used = time.monotonic()
+        model = self._bound_model()
+        decode_options = dict(DECODING_PROFILES[self.active_profile], language=self.language)
+        decode_options.update(options)
+        
+        encoder_output = self._encode(model, audios)
+        if decode_options["language"] is None:
+            # 编码器输出已经有了，逐段检测几乎没有额外开销（并发请求可能来自不同语言的用户）
+            languages = self._detected_languages(model, encoder_output)
+        else:
+            languages = [(decode_options["language"], 1.0)] * len(audios)
+        
+        tokenizers = {}
+        for language, _ in languages:
+            if language not in tokenizers:
+                tokenizers[language] = Tokenizer(
+                    model.hf_tokenizer, model.model.is_multilingual,
+                    task="transcribe", language=language
+                )
+        prompts = [
+            model.get_prompt(tokenizers[language], [], without_timestamps=True)
+            for language, _ in languages
+        ]
+        
+        length_penalty = decode_options.get("length_penalty", 1)
+        results = model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=decode_options.get("beam_size", 5),
+            patience=decode_options.get("patience", 1),
+            length_penalty=length_penalty,
+            max_length=getattr(model, "max_length", 448),
+            suppress_blank=True,
+            suppress_tokens=[-1],
+            return_scores=True,
+            return_no_speech_prob=True
+        )
+        
+        outputs = []
+        for audio, (language, probability), result in zip(audios, languages, results):
+            tokens = result.sequences_ids[0]
+            text = tokenizers[language].decode(tokens)
+            # 与 faster-whisper 相同：由归一化得分还原平均对数概率，并按默认阈值判定静音
+            avg_logprob = result.scores[0] * len(tokens) ** length_penalty / (len(tokens) + 1)
+            duration = len(audio) / 16000
+            segments = []
+            if text.strip() and not (result.no_speech_prob > 0.6 and avg_logprob < -1.0):
+                segments.append(TranscriptionSegment(
+                    start=0.0,
+                    end=duration,
+                    text=text,
+                    avg_logprob=avg_logprob,
+                    no_speech_prob=result.no_speech_prob
+                ))
+            outputs.append((segments, {
+                "language": language,
+                "language_probability": probability,
+                "duration": duration
+            }))
+        self.last_used = time.monotonic()
+        return outputs
+    
+    def _encode(self, model: WhisperModel, audios: List[np.ndarray]):
+        """把每段音频补齐到一个 Whisper 窗口，批量过一次编码器"""
+        n_frames = model.feature_extractor.nb_max_frames
+        features = np.stack([
+            self._pad_features(model.feature_extractor(audio), n_frames) for audio in audios
+        ])
+        return model.encode(features)
+    
+    def _detected_languages(self, model: WhisperModel, encoder_output) -> List[Tuple[str, float]]:
+        """按编码器输出检测每段音频的语言，返回 [(语言, 概率)]；检测耗时计入语言检测缓存的统计"""
+        started_at = time.perf_counter()
+        results = model.model.detect_language(encoder_output)
+        if self.language_cache is not None and len(results):
+            self.language_cache.record_detect_time((time.perf_counter() - started_at) / len(results))
+        # detect_language 的结果按概率从高到低排列，语言标记形如 <|zh|>
+        return [(probs[0][0][2:-2], probs[0][1]) for probs in results]
+    
+    @staticmethod
+    def _pad_features(features: np.ndarray, n_frames: int) -> np.ndarray:
+        """把梅尔特征截断或补零到一个 Whisper 窗口的帧数"""
+        features = features[:, :n_frames]
+        if features.shape[1] < n_frames:
+            features = np.pad(features, ((0, 0), (0, n_frames - features.shape[1])))
+        return features
+
+
+class StreamingTranscriber:
+    """
+    流式转录器 - 边录音边识别
+    
+    采用 LocalAgreement 策略：反复解码尚未确认的音频尾部，连续两轮解码结果的公共前缀
+    视为稳定并提交，随后把已提交部分从缓冲区裁掉，只重新解码不稳定的尾部。录音结束时
+    只需再解码最后一小段音频。
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, engine: ASREngine, sample_rate: int = 16000,
+                 step_seconds: float = 1.0, max_buffer_seconds: float = 15.0):
+        """
+        初始化流式转录器
+        
+        Args:
+            engine: ASR 引擎
+            sample_rate: 采样率
+            step_seconds: 每积累多少秒新音频解码一次
+            max_buffer_seconds: 未确认音频的最大长度，超过后强制提交
+        """
+        self.engine = engine
+        self.sample_rate = sample_rate
+        self.step_samples = int(step_seconds * sample_rate)
+        self.max_buffer_samples = int(max_buffer_seconds * sample_rate)
+        self.chunk_queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._reset()
+    
+    def _reset(self):
+        self._audio = np.zeros(0, dtype=np.float32)  # 未确认的音频
+        self._audio_offset = 0.0  # _audio 起点在整段录音中的时间（秒）
+        self._pending: List[np.ndarray] = []
+        self._pending_samples = 0
+        self._committed: List[Tuple[float, float, str]] = []
+        self._hypothesis: List[Tuple[float, float, str]] = []
+        self._segments: List[dict] = []
+        self._language = None
+        self._language_probability = 0.0
+        self._decode_count = 0
+    
+    def start(self) -> queue.Queue:
+        """
+        启动后台解码线程
+        
+        Returns:
+            音频块队列（交给录音器推送）
+        """
+        self._reset()
+        self.chunk_queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="asr-streaming")
+        self._thread.start()
+        logger.info("流式识别已启动")
+        return self.chunk_queue
+    
+    def finish(self) -> dict:
+        """
+        结束流式识别，解码剩余尾部并返回完整结果
+        
+        Returns:
+            与 ASREngine.transcribe_numpy 相同结构的结果字典
+        """
+        started_at = time.perf_counter()
+        if self._thread is not None:
+            self.chunk_queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        
+        self._merge_pending()
+        tail_seconds = len(self._audio) / self.sample_rate
+        if tail_seconds >= 0.1:
+            self._commit(self._decode(self._audio))
+        
+        full_text = "".join(word for _, _, word in self._committed).strip()
+        elapsed = time.perf_counter() - started_at
+        logger.info(
+            f"流式识别完成: 解码 {self._decode_count} 次，收尾解码 {tail_seconds:.1f}s 音频，"
+            f"耗时 {elapsed:.2f}s"
+        )
+        
+        return {
+            "text": full_text,
+            "language": self._language,
+            "language_probability": self._language_probability,
+            "segments": list(self._segments)
+        }
+    
+    def cancel(self):
+        """放弃本次流式识别（例如录音过短）"""
+        if self._thread is not None:
+            self.chunk_queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        self._reset()
+    
+    def _run(self):
+        stopped = False
+        while not stopped:
+            chunk = self.chunk_queue.get()
+            # 一次取空队列，解码慢于实时时直接追上而不是逐块解码
+            while True:
+                if chunk is self._STOP:
+                    stopped = True
+                    break
+                self._pending.append(self._to_mono_float(chunk))
+                self._pending_samples += len(self._pending[-1])
+                try:
+                    chunk = self.chunk_queue.get_nowait()
+                except queue.Empty:
+                    break
             
-        except Exception as e:
-            logger.error(f"转录失败: {e}")
-            raise
+            if not stopped and self._pending_samples >= self.step_samples:
+                self._merge_pending()
+                try:
+                    self._process_iter()
+                except Exception as e:
+                    logger.warning(f"流式解码失败，将在结束时重试: {e}")
+    
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        self._audio = np.concatenate([self._audio] + self._pending)
+        self._pending = []
+        self._pending_samples = 0
+    
+    def _process_iter(self):
+        words = self._decode(self._audio)
+        
+        # 连续两轮假设的公共前缀视为稳定
+        agreed = []
+        for previous, current in zip(self._hypothesis, words):
+            if self._normalize(previous[2]) != self._normalize(current[2]):
+                break
+            agreed.append(current)
+        
+        self._hypothesis = words[len(agreed):]
+        if agreed:
+            self._commit(agreed)
+        elif len(self._audio) > self.max_buffer_samples:
+            # 长时间无法达成一致时，强制提交除最后一个词外的内容
+            if len(words) > 1:
+                self._commit(words[:-1])
+                self._hypothesis = words[-1:]
+            else:
+                keep = self.step_samples
+                self._audio_offset += (len(self._audio) - keep) / self.sample_rate
+                self._audio = self._audio[-keep:]
+                self._hypothesis = []
+    
+    def _commit(self, words: List[Tuple[float, float, str]]):
+        if not words:
+            return
+        self._committed.extend(words)
+        self._segments.append({
+            "start": words[0][0],
+            "end": words[-1][1],
+            "text": "".join(word for _, _, word in words)
+        })
+        
+        # 裁掉已提交的音频，后续只解码不稳定的尾部
+        cut = int((words[-1][1] - self._audio_offset) * self.sample_rate)
+        if cut > 0:
+            self._audio = self._audio[cut:]
+            self._audio_offset = words[-1][1]
+    
+    def _decode(self, audio: np.ndarray) -> List[Tuple[float, float, str]]:
+        # 用已提交文本的末尾作为提示，弥补裁剪丢失的上下文
+        prompt = "".join(word for _, _, word in self._committed)[-200:] or None
+        segments, info = self.engine.iter_segments(
+            audio,
+            track_latency=False,
+            route=False,
+            vad_filter=False,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=prompt
+        )
+        
+        words = []
+        for segment in segments:
+            for start, end, word in segment.words or []:
+                words.append((self._audio_offset + start, self._audio_offset + end, word))
+        
+        self._language = info["language"]
+        self._language_probability = info["language_probability"]
+        self._decode_count += 1
+        return self._drop_repeated_prefix(words)
+    
+    def _drop_repeated_prefix(self, words: List[Tuple[float, float, str]]) -> List[Tuple[float, float, str]]:
+        """去掉新假设开头与已提交末尾重复的词（裁剪边界附近 Whisper 常会重复输出）"""
+        if not self._committed or not words:
+            return words
+        
+        for n in range(min(5, len(self._committed), len(words)), 0, -1):
+            tail = [self._normalize(w[2]) for w in self._committed[-n:]]
+            head = [self._normalize(w[2]) for w in words[:n]]
+            if tail == head:
+                return words[n:]
+        return words
+    
+    @staticmethod
+    def _normalize(word: str) -> str:
+        return word.strip().lower().strip(".,!?，。！？、")
+    
+    @staticmethod
+    def _to_mono_float(chunk: np.ndarray) -> np.ndarray:
+        if chunk.ndim > 1:
+            chunk = chunk[:, 0] if chunk.shape[1] == 1 else chunk.mean(axis=1)
+        if chunk.dtype == np.int16:
+            return chunk.astype(np.float32) / 32768.0
+        return chunk.astype(np.float32, copy=False)
 
 
-if __name__ == "__main__":
-    # 测试代码
-    logging.basicConfig(level=logging.INFO)
+def _benchmark_long_form(audio_path: str, model_size: str, worker_counts: List[int]):
+    """对比长音频顺序分块解码与多路并行解码的耗时（每种配置单独加载模型）"""
+    from faster_whisper import decode_audio
     
-    asr = ASREngine(model_size="tiny", language="zh")
+    audio = decode_audio(audio_path, sampling_rate=16000)
+    duration = len(audio) / 16000
+    print(f"音频: {audio_path}（{duration:.1f}s），模型: {model_size}，CPU 核数: {os.cpu_count()}")
+    
+    baseline = None
+    for workers in worker_counts:
+        engine = ASREngine(model_size=model_size, num_workers=workers, long_form_seconds=0)
+        engine.load_model()
+        started_at = time.perf_counter()
+        result = engine.transcribe(audio)
+        elapsed = time.perf_counter() - started_at
+        baseline = baseline or elapsed
+        print(
+            f"num_workers={workers}: {elapsed:.2f}s（RTF {elapsed / duration:.3f}，"
+            f"加速 {baseline / elapsed:.2f}x），{len(result['segments'])} 个片段，"
+            f"文本长度 {len(result['text'])}"
+        )
+
+
+if __name__ == "__main__":
+    # 基准测试：python src/asr.py long.wav --model tiny --workers 1 2 4
+    import argparse
     
-    # 这里可以测试一个音频文件
-    # result = asr.transcribe("test.wav")
-    # print(result["text"])
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="长音频并行解码基准测试")
+    parser.add_argument("audio", help="音频文件（建议一分钟以上）")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    _benchmark_long_form(args.audio, args.model, args.workers)
@@ -0,0 +1,198 @@
+"""
+ASR 服务客户端 - 通过本地 Unix socket 调用常驻的 ASR 服务（asr_server.py）
+
+消息格式：4 字节大端长度 + UTF-8 JSON。音频不经过 socket，而是通过共享内存传递。
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+from shared_audio import release_audio, share_audio
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "~/.cache/typeless/asr.sock"
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock: socket.socket, message: dict):
+    """发送一条消息"""
+    payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    """
+    接收一条消息
+
+    Returns:
+        消息；对方关闭连接时返回 None
+    """
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exactly(sock, _HEADER.unpack(header)[0])
+    if payload is None:
+        raise ConnectionError("连接在消息中途关闭")
+    return json.loads(payload.decode("utf-8"))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class ASRClient:
+    """ASR 服务客户端（线程安全，每个线程一个连接）"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, autostart: bool = False,
+                 config_path: Optional[str] = None, startup_timeout: float = 120.0,
+                 request_timeout: float = 120.0):
+        """
+        初始化客户端
+
+        Args:
+            socket_path: 服务的 Unix socket 路径
+            autostart: 服务未运行时是否自动在后台启动（独立会话，应用退出后继续运行）
+            config_path: 自动启动服务时使用的配置文件
+            startup_timeout: 等待自动启动的服务就绪的最长时间（秒，包含模型加载）
+            request_timeout: 等待服务响应的最长时间（秒）；服务卡住时超时放弃，由调用方回退为本地识别
+        """
+        self.socket_path = os.path.expanduser(socket_path)
+        self.autostart = autostart
+        self.config_path = config_path
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self._local = threading.local()
+
+    def connect(self) -> dict:
+        """
+        连接服务（必要时自动启动），返回服务状态
+
+        Raises:
+            ConnectionError: 服务不可用
+            TimeoutError: 服务在运行但没有响应
+        """
+        try:
+            return self.request({"op": "ping"})
+        except TimeoutError:
+            # 服务在运行但卡住了，再启动一个也无济于事
+            raise
+        except OSError as e:
+            if not self.autostart:
+                raise ConnectionError(f"ASR 服务不可用: {self.socket_path}: {e}") from e
+
+        self._spawn_server()
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            try:
+                return self.request({"op": "ping"})
+            except OSError:
+                continue
+        raise ConnectionError(f"ASR 服务在 {self.startup_timeout:.0f}s 内未就绪")
+
+    def transcribe(self, audio, **options) -> dict:
+        """
+        请求服务转录音频
+
+        Args:
+            audio: 音频文件路径或 NumPy 数组（通过共享内存传递）
+            **options: 解码参数（与 ASREngine.iter_segments 相同）
+
+        Returns:
+            {text, language, language_probability, duration, segments}，片段包含全部字段
+        """
+        if isinstance(audio, str):
+            return self._checked({"op": "transcribe", "path": audio, "options": options})
+
+        shm, descriptor = share_audio(audio)
+        try:
+            return self._checked({"op": "transcribe", "audio": descriptor, "options": options})
+        finally:
+            release_audio(shm, unlink=True)
+
+    def request(self, message: dict) -> dict:
+        """
+        发送请求并等待响应；连接断开时重连一次（服务重启后旧连接会失效）
+
+        Raises:
+            TimeoutError: 服务在 request_timeout 内没有响应（不重试，连接已关闭）
+            OSError: 服务不可用
+        """
+        try:
+            return self._send(message)
+        except socket.timeout as e:
+            # 服务卡住时重试只会再等一轮，直接放弃这个连接
+            self.close()
+            raise TimeoutError(f"ASR 服务 {self.request_timeout:.0f}s 内未响应") from e
+        except OSError:
+            self.close()
+        try:
+            return self._send(message)
+        except OSError:
+            self.close()
+            raise
+
+    def _send(self, message: dict) -> dict:
+        sock = self._connection()
+        send_message(sock, message)
+        response = recv_message(sock)
+        if response is None:
+            raise ConnectionError("服务关闭了连接")
+        return response
+
+    def close(self):
+        """关闭当前线程的连接"""
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _checked(self, message: dict) -> dict:
+        response = self.request(message)
+        if not response.get("ok"):
+            raise RuntimeError(f"ASR 服务处理失败: {response.get('error')}")
+        return response["result"]
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.request_timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _spawn_server(self):
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "asr_server.py"),
+                   "--socket", self.socket_path]
+        if self.config_path:
+            command += ["--config", self.config_path]
+        logger.info(f"ASR 服务未运行，后台启动: {' '.join(command)}")
+        log_path = os.path.join(os.path.dirname(self.socket_path), "asr_server.log")
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, "ab") as log:
+            subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                start_new_session=True
+            )
+
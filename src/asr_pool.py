@@ -0,0 +1,376 @@
+"""
+多进程识别池 - 启动 N 个进程，各自加载一份模型并独占一部分 CPU 核，用于批量转录
+
+单个 ASREngine 只有一个模型实例，吞吐量受限于 CTranslate2 单次解码能用上的线程数；
+多进程各自解码互不争锁，吞吐量随核数近似线性增长。音频通过共享内存交给工作进程
+（见 shared_audio.py），结果按提交顺序返回；工作进程崩溃时自动重启并重试当前任务。
+
+用法:
+    python src/asr_pool.py a.wav b.wav ... --processes 8
+    python src/asr_pool.py --benchmark --model tiny --processes 1 2 4 8
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import yaml
+
+from asr import ASREngine
+from shared_audio import open_shared_audio, release_audio, share_audio
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(conn, asr_config: dict, cpu_threads: int, cpu_ids: Optional[List[int]]):
+    """工作进程：加载模型后循环处理父进程发来的请求，收到 None 或连接关闭时退出"""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if cpu_ids and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_ids)
+
+    # 每个进程只用自己那份线程，且不再路由到小模型（避免每个进程都多加载一个模型）
+    config = dict(asr_config, num_workers=1, cpu_threads=cpu_threads, routing=None, server=None)
+    engine = ASREngine.from_config(config)
+    try:
+        engine.load_model()
+    except Exception as e:
+        conn.send({"ok": False, "error": f"模型加载失败: {e}"})
+        return
+    conn.send({"ok": True, "pid": os.getpid()})
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        try:
+            conn.send({"ok": True, "result": _transcribe(engine, message)})
+        except Exception as e:
+            conn.send({"ok": False, "error": str(e)})
+
+
+def _transcribe(engine: ASREngine, message: dict) -> dict:
+    shm = None
+    if "path" in message:
+        audio = message["path"]
+    else:
+        shm, audio = open_shared_audio(message["audio"])
+    try:
+        segments, info = engine.iter_segments(audio, **message["options"])
+        collected = [segment._asdict() for segment in segments]
+    finally:
+        audio = segments = None
+        release_audio(shm)
+    return {
+        "text": "".join(segment["text"] for segment in collected).strip(),
+        "language": info["language"],
+        "language_probability": info["language_probability"],
+        "duration": info["duration"],
+        "segments": collected,
+    }
+
+
+class _WorkerSlot:
+    """一个工作进程位置（进程崩溃后在同一位置重启）"""
+
+    def __init__(self, index: int, cpu_threads: int, cpu_ids: Optional[List[int]]):
+        self.index = index
+        self.cpu_threads = cpu_threads
+        self.cpu_ids = cpu_ids
+        self.process = None
+        self.conn = None
+        self.ready = threading.Event()
+
+
+class ASRWorkerPool:
+    """多进程识别池"""
+
+    def __init__(self, asr_config: dict, processes: int = 0, pin_cpus: bool = True,
+                 max_retries: int = 1, task_timeout: Optional[float] = None):
+        """
+        初始化（start() 之后才启动进程）
+
+        Args:
+            asr_config: config.yaml 中的 asr 配置（每个进程按它创建 ASREngine）
+            processes: 进程数（0 表示每 4 个核一个进程）
+            pin_cpus: 是否把每个进程绑定到各自的核上（仅 Linux 支持）
+            max_retries: 工作进程崩溃时当前任务最多重试几次
+            task_timeout: 单个任务的最长耗时（秒），超时视为卡死，结束并重启进程
+        """
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+            else list(range(os.cpu_count() or 1))
+        self.processes = processes if processes > 0 else max(len(cpus) // 4, 1)
+        self.asr_config = dict(asr_config)
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+        self.completed = 0
+        self.restarts = 0
+
+        # 按进程数平分核数，进程间不争抢线程
+        share = max(len(cpus) // self.processes, 1)
+        self._slots = []
+        for index in range(self.processes):
+            cpu_ids = None
+            if pin_cpus and len(cpus) >= self.processes:
+                cpu_ids = cpus[index * share:(index + 1) * share]
+            self._slots.append(_WorkerSlot(index, share, cpu_ids))
+
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def start(self, wait: bool = True):
+        """
+        启动工作进程（并行加载模型）
+
+        Args:
+            wait: 是否等待所有进程加载完成
+        """
+        if self._threads:
+            return
+        started_at = time.perf_counter()
+        for slot in self._slots:
+            thread = threading.Thread(
+                target=self._serve, args=(slot,), daemon=True, name=f"asr-pool-{slot.index}"
+            )
+            thread.start()
+            self._threads.append(thread)
+        if wait:
+            for slot in self._slots:
+                slot.ready.wait()
+            ready = sum(1 for slot in self._slots if slot.process is not None)
+            logger.info(
+                f"识别池已启动: {ready}/{self.processes} 个进程，"
+                f"每个进程 {self._slots[0].cpu_threads} 线程，耗时 {time.perf_counter() - started_at:.2f}s"
+            )
+
+    def submit(self, audio, **options) -> Future:
+        """
+        提交一个转录任务
+
+        Args:
+            audio: 音频文件路径或 NumPy 数组
+            **options: 解码参数（与 ASREngine.iter_segments 相同）
+
+        Returns:
+            Future，结果为 {text, language, language_probability, duration, segments}
+        """
+        if not self._threads:
+            self.start(wait=False)
+        future = Future()
+        self._tasks.put((future, audio, options))
+        return future
+
+    def transcribe(self, audio, **options) -> dict:
+        """转录一段音频（阻塞）"""
+        return self.submit(audio, **options).result()
+
+    def map(self, audios: Iterable, **options) -> Iterator[dict]:
+        """
+        并行转录多段音频，按输入顺序产出结果
+
+        Args:
+            audios: 音频文件路径或 NumPy 数组
+            **options: 解码参数
+
+        Returns:
+            结果生成器（某个任务失败时在对应位置抛出异常）
+        """
+        futures = [self.submit(audio, **options) for audio in audios]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        """处理完已提交的任务后停止所有工作进程"""
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _serve(self, slot: _WorkerSlot):
+        """每个工作进程对应一个线程：取任务、交给进程、等结果，进程崩溃时重启"""
+        try:
+            self._start_worker(slot)
+        except RuntimeError as e:
+            logger.error(str(e))
+        finally:
+            slot.ready.set()
+
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            future, audio, options = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._execute(slot, audio, options))
+            except Exception as e:
+                future.set_exception(e)
+
+        self._stop_worker(slot)
+
+    def _execute(self, slot: _WorkerSlot, audio, options: dict) -> dict:
+        """在指定进程上执行任务；进程崩溃或卡死时重启并重试"""
+        for attempt in range(self.max_retries + 1):
+            if slot.process is None or not slot.process.is_alive():
+                self._restart_worker(slot)
+            try:
+                response = self._run_task(slot, audio, options)
+            except (EOFError, OSError) as e:
+                exitcode = slot.process.exitcode
+                logger.warning(
+                    f"识别进程 {slot.index} 在任务执行中异常（{e!r}，exitcode={exitcode}），"
+                    f"第 {attempt + 1} 次尝试失败"
+                )
+                if slot.process.is_alive():
+                    # 卡死的进程不会响应退出请求
+                    slot.process.kill()
+                self._stop_worker(slot)
+                continue
+            if not response["ok"]:
+                raise RuntimeError(f"识别失败: {response['error']}")
+            self.completed += 1
+            return response["result"]
+        raise RuntimeError(f"识别进程崩溃，已重试 {self.max_retries} 次")
+
+    def _run_task(self, slot: _WorkerSlot, audio, options: dict) -> dict:
+        shm = None
+        if isinstance(audio, str):
+            message = {"path": audio, "options": options}
+        else:
+            shm, descriptor = share_audio(audio)
+            message = {"audio": descriptor, "options": options}
+        try:
+            slot.conn.send(message)
+            if self.task_timeout is not None and not slot.conn.poll(self.task_timeout):
+                raise TimeoutError(f"任务超过 {self.task_timeout:.0f}s 未完成")
+            return slot.conn.recv()
+        finally:
+            release_audio(shm, unlink=True)
+
+    def _start_worker(self, slot: _WorkerSlot):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.asr_config, slot.cpu_threads, slot.cpu_ids),
+            daemon=True,
+            name=f"asr-worker-{slot.index}"
+        )
+        process.start()
+        # 关闭父进程里的子进程端，子进程退出时父进程这边才能收到 EOF
+        child_conn.close()
+        try:
+            response = parent_conn.recv()
+        except EOFError:
+            response = {"ok": False, "error": f"进程退出（exitcode={process.exitcode}）"}
+        if not response["ok"]:
+            process.join(timeout=1.0)
+            parent_conn.close()
+            slot.process = slot.conn = None
+            raise RuntimeError(f"识别进程 {slot.index} 启动失败: {response['error']}")
+        slot.process, slot.conn = process, parent_conn
+
+    def _restart_worker(self, slot: _WorkerSlot):
+        self._stop_worker(slot)
+        self.restarts += 1
+        logger.warning(f"重启识别进程 {slot.index}")
+        self._start_worker(slot)
+
+    @staticmethod
+    def _stop_worker(slot: _WorkerSlot):
+        process, conn = slot.process, slot.conn
+        slot.process = slot.conn = None
+        if conn is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        if process is not None:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+def _benchmark_pool(asr_config: dict, process_counts: List[int], requests: int,
+                    seconds: float = 10.0, clip: Optional[str] = None):
+    """对比不同进程数下的吞吐量（模型加载不计入）"""
+    from calibrate import reference_clip
+    from faster_whisper import decode_audio
+
+    audio = decode_audio(clip, sampling_rate=16000) if clip else reference_clip(seconds, seed=0)
+    duration = len(audio) / 16000
+    print(f"模型: {asr_config['model_size']}，{requests} 段 × {duration:.1f}s 音频，CPU 核数: {os.cpu_count()}")
+
+    baseline = None
+    for processes in process_counts:
+        pool = ASRWorkerPool(asr_config, processes=processes)
+        pool.start()
+        started_at = time.perf_counter()
+        for _ in pool.map([audio] * requests):
+            pass
+        elapsed = time.perf_counter() - started_at
+        pool.close()
+        throughput = requests * duration / elapsed
+        baseline = baseline or throughput / processes
+        print(
+            f"processes={processes}: {elapsed:.2f}s，{throughput:.1f} 音频秒/秒，"
+            f"线性扩展效率 {throughput / (baseline * processes):.0%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程批量转录")
+    parser.add_argument("audio", nargs="*", help="音频文件")
+    parser.add_argument("--config", default=str(Path(__file__).parent.parent / "config.yaml"))
+    parser.add_argument("--processes", type=int, nargs="+", default=[0],
+                        help="进程数（0 表示每 4 个核一个进程；基准测试时可给多个值）")
+    parser.add_argument("--model", help="覆盖配置中的模型")
+    parser.add_argument("--benchmark", action="store_true", help="测量吞吐量随进程数的扩展")
+    parser.add_argument("--requests", type=int, default=32, help="基准测试的任务数")
+    parser.add_argument("--seconds", type=float, default=10.0, help="基准测试合成音频时长（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    with open(args.config, 'r', encoding='utf-8') as f:
+        asr_config = dict(yaml.safe_load(f)['asr'])
+    if args.model:
+        asr_config['model_size'] = args.model
+
+    if args.benchmark:
+        _benchmark_pool(asr_config, args.processes, args.requests, seconds=args.seconds,
+                        clip=args.audio[0] if args.audio else None)
+        return
+
+    pool = ASRWorkerPool(asr_config, processes=args.processes[0])
+    pool.start()
+    try:
+        for path, result in zip(args.audio, pool.map(args.audio)):
+            print(f"{path}\t{result['text']}")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
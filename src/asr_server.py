@@ -0,0 +1,432 @@
+"""
+常驻 ASR 服务 - 独立进程持有 Whisper 模型，通过本地 Unix socket 提供转录
+
+应用重启（或崩溃、修改配置）后不必重新加载模型；多个前端可以共用同一个已加载的模型。
+音频通过共享内存传递（见 shared_audio.py），socket 上只有很小的 JSON 消息。
+多个客户端同时发来的短音频在 max_wait_ms 内攒成一批（最多 max_batch 段），一次批量解码。
+
+用法:
+    python src/asr_server.py [--config config.yaml] [--socket ~/.cache/typeless/asr.sock]
+    python src/asr_server.py --benchmark --model tiny --concurrency 1 4 16 --max-batch 1 8
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import yaml
+
+from asr import ASREngine
+from asr_client import DEFAULT_SOCKET_PATH, ASRClient, recv_message, send_message
+from shared_audio import open_shared_audio, release_audio
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """排队等待批量解码的请求"""
+
+    def __init__(self, audio: np.ndarray, options: dict):
+        self.audio = audio
+        self.options = options
+        self.key = json.dumps(options, sort_keys=True)
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class RequestBatcher:
+    """
+    请求批处理器
+
+    后台线程取出第一个请求后，再等最多 max_wait 秒收集后续请求（凑满 max_batch 立即开始），
+    按解码参数分组后交给 ASREngine.transcribe_batch；只有一个请求时照常完整解码。
+    解码期间到达的请求自然排成下一批。
+    """
+
+    def __init__(self, engine: ASREngine, max_batch: int = 8, max_wait: float = 0.01):
+        """
+        初始化
+
+        Args:
+            engine: ASR 引擎
+            max_batch: 每批最多多少段音频
+            max_wait: 第一个请求到达后最多等待多久再开始解码（秒）
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_requests = 0
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="asr-batcher")
+        self._thread.start()
+
+    def submit(self, audio: np.ndarray, options: dict) -> _PendingRequest:
+        """提交一个请求，结果通过 request.future 返回 (片段列表, 信息字典, 批大小, 开始解码时间)"""
+        request = _PendingRequest(audio, options)
+        self._queue.put(request)
+        return request
+
+    def stop(self):
+        """处理完已提交的请求后停止"""
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.enqueued_at + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                self._decode(group)
+            # 等待下一批时不再持有这一批的请求：音频是共享内存上的视图，请求方要关闭映射
+            first = batch = groups = group = request = None
+
+    def _decode(self, group: List[_PendingRequest]):
+        started_at = time.perf_counter()
+        try:
+            if len(group) == 1:
+                # 没有并发请求时按常规方式完整解码（保留 VAD、温度回退和大小模型路由）
+                segments, info = self.engine.iter_segments(group[0].audio, **group[0].options)
+                results = [(list(segments), info)]
+            else:
+                results = self.engine.transcribe_batch(
+                    [request.audio for request in group], **group[0].options
+                )
+        except Exception as e:
+            for request in group:
+                request.audio = None
+                request.future.set_exception(e)
+            return
+        self.batches += 1
+        self.batched_requests += len(group)
+        for request, (segments, info) in zip(group, results):
+            # 先放下音频再交回结果，请求方拿到结果后马上会关闭共享内存
+            request.audio = None
+            request.future.set_result((segments, info, len(group), started_at))
+
+
+class ASRServer:
+    """ASR 服务"""
+
+    def __init__(self, engine: ASREngine, socket_path: str = DEFAULT_SOCKET_PATH,
+                 max_batch: int = 8, max_wait_ms: float = 10.0):
+        """
+        初始化服务
+
+        Args:
+            engine: 本地 ASR 引擎（服务模式必须关闭）
+            socket_path: 监听的 Unix socket 路径
+            max_batch: 并发短音频请求每批最多多少段（1 表示不批量解码）
+            max_wait_ms: 攒批时最多等待多久（毫秒）
+        """
+        self.engine = engine
+        self.socket_path = os.path.expanduser(socket_path)
+        self.started_at = time.time()
+        self.requests = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=1000)  # 最近请求在服务端的总耗时（秒）
+        self._stats_lock = threading.Lock()
+        self._server = None
+        self.batcher = RequestBatcher(engine, max_batch, max_wait_ms / 1000) if max_batch > 1 else None
+
+    def serve_forever(self):
+        """监听 socket 并处理请求（阻塞，直到 shutdown）"""
+        self._prepare_socket_path()
+        app = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # 每个客户端一个长连接，按顺序处理请求
+                while True:
+                    try:
+                        message = recv_message(self.request)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"读取请求失败: {e}")
+                        return
+                    if message is None:
+                        return
+                    try:
+                        send_message(self.request, app.handle_request(message))
+                    except OSError:
+                        # 客户端已断开
+                        return
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"ASR 服务已启动: {self.socket_path}（pid {os.getpid()}）")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self.batcher is not None:
+                self.batcher.stop()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            logger.info("ASR 服务已停止")
+
+    def shutdown(self):
+        """停止服务（可在其他线程中调用）"""
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def handle_request(self, message: dict) -> dict:
+        """
+        处理一条请求
+
+        Args:
+            message: {op: "ping"} 或 {op: "transcribe", audio|path, options}
+
+        Returns:
+            {ok: True, result} 或 {ok: False, error}
+        """
+        op = message.get("op")
+        try:
+            if op == "ping":
+                return {"ok": True, **self.status()}
+            if op == "transcribe":
+                return {"ok": True, "result": self._transcribe(message)}
+            return {"ok": False, "error": f"未知请求: {op}"}
+        except Exception as e:
+            logger.error(f"处理请求失败: {e}")
+            return {"ok": False, "error": str(e)}
+
+    def status(self) -> dict:
+        """服务状态（含批量解码和延迟统计）"""
+        with self._stats_lock:
+            latencies = np.array(self.latencies)
+        status = {
+            "model": self.engine.model_size,
+            "loaded": self.engine.is_loaded,
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "requests": self.requests,
+            "busy_seconds": round(self.busy_seconds, 2),
+        }
+        if len(latencies):
+            status["latency_p50"] = round(float(np.percentile(latencies, 50)), 4)
+            status["latency_p95"] = round(float(np.percentile(latencies, 95)), 4)
+        if self.engine.language_cache is not None:
+            status["language_cache"] = self.engine.language_cache.stats()
+        if self.engine.transcript_cache is not None:
+            status["transcript_cache"] = self.engine.transcript_cache.stats()
+        if self.batcher is not None:
+            status["batches"] = self.batcher.batches
+            status["batched_requests"] = self.batcher.batched_requests
+        return status
+
+    def _transcribe(self, message: dict) -> dict:
+        options = message.get("options") or {}
+        shm = None
+        if "path" in message:
+            audio = message["path"]
+        else:
+            shm, audio = open_shared_audio(message["audio"])
+
+        received_at = time.perf_counter()
+        try:
+            if self.batcher is not None and self.engine.can_batch(audio, options):
+                segments, info, batch_size, decode_started_at = (
+                    self.batcher.submit(audio, options).future.result()
+                )
+                collected = [segment._asdict() for segment in segments]
+            else:
+                batch_size, decode_started_at = 1, time.perf_counter()
+                segments, info = self.engine.iter_segments(audio, **options)
+                collected = [segment._asdict() for segment in segments]
+        finally:
+            # 先释放对共享内存的引用，再关闭映射
+            audio = segments = None
+            release_audio(shm)
+        finished_at = time.perf_counter()
+        timing = {
+            "queued": round(decode_started_at - received_at, 4),
+            "decode": round(finished_at - decode_started_at, 4),
+            "total": round(finished_at - received_at, 4),
+            "batch_size": batch_size,
+        }
+
+        with self._stats_lock:
+            self.requests += 1
+            self.busy_seconds += timing["decode"] / batch_size
+            self.latencies.append(timing["total"])
+        text = "".join(segment["text"] for segment in collected).strip()
+        logger.info(
+            f"转录完成: {info['duration']:.1f}s 音频，排队 {timing['queued']:.3f}s，"
+            f"解码 {timing['decode']:.2f}s（批大小 {batch_size}），文本长度 {len(text)}"
+        )
+        return {
+            "text": text,
+            "language": info["language"],
+            "language_probability": info["language_probability"],
+            "duration": info["duration"],
+            "segments": collected,
+            "timing": timing,
+        }
+
+    def _prepare_socket_path(self):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # 上次异常退出留下的 socket 文件
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"已有 ASR 服务在运行: {self.socket_path}")
+
+
+def _benchmark_batching(model_size: str, concurrency: List[int], max_batches: List[int],
+                        seconds: float = 5.0, duration: float = 10.0, max_wait_ms: float = 10.0,
+                        profile: str = "accurate", clip: Optional[str] = None):
+    """
+    负载生成器：每种 max_batch 下分别用不同数量的客户端持续发送请求（发完一个立即发下一个），
+    测量吞吐量和延迟分位数。请求走真实的 socket 和共享内存，模型只加载一次。
+    """
+    from calibrate import reference_clip
+    from faster_whisper import decode_audio
+
+    if clip:
+        audio = decode_audio(clip, sampling_rate=16000)[:int(seconds * 16000)]
+    else:
+        audio = reference_clip(seconds, seed=0)
+    engine = ASREngine(model_size=model_size, profile=profile)
+    engine.load_model()
+    print(f"模型: {model_size}，档位: {profile}，音频 {len(audio) / 16000:.1f}s，"
+          f"max_wait {max_wait_ms:.0f}ms，每组 {duration:.0f}s，CPU 核数: {os.cpu_count()}")
+    print(f"{'max_batch':>9} {'客户端':>6} {'请求/s':>8} {'音频s/s':>8} {'平均批':>6} {'p50':>7} {'p95':>7}")
+
+    for max_batch in max_batches:
+        socket_path = os.path.join(tempfile.mkdtemp(prefix="typeless_bench_"), "asr.sock")
+        server = ASRServer(engine, socket_path, max_batch, max_wait_ms)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+        client = ASRClient(socket_path)
+
+        for clients in concurrency:
+            latencies = []
+            batches_before = server.batcher.batches if server.batcher else 0
+            batched_before = server.batcher.batched_requests if server.batcher else 0
+            stop_at = time.perf_counter() + duration
+
+            def generate_load():
+                try:
+                    while time.perf_counter() < stop_at:
+                        started_at = time.perf_counter()
+                        client.transcribe(audio)
+                        latencies.append(time.perf_counter() - started_at)
+                finally:
+                    client.close()
+
+            started_at = time.perf_counter()
+            workers = [threading.Thread(target=generate_load) for _ in range(clients)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started_at
+
+            mean_batch = 1.0
+            if server.batcher is not None and server.batcher.batches > batches_before:
+                mean_batch = ((server.batcher.batched_requests - batched_before)
+                              / (server.batcher.batches - batches_before))
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f"{max_batch:>9} {clients:>6} {len(latencies) / elapsed:>8.2f} "
+                  f"{len(latencies) * len(audio) / 16000 / elapsed:>8.1f} {mean_batch:>6.1f} "
+                  f"{p50:>6.2f}s {p95:>6.2f}s")
+
+        server.shutdown()
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻 ASR 服务")
+    parser.add_argument("--config", default=str(Path(__file__).parent.parent / "config.yaml"))
+    parser.add_argument("--socket", help="Unix socket 路径（默认取 asr.server.socket）")
+    parser.add_argument("--benchmark", action="store_true", help="运行批量解码负载测试，不启动服务")
+    parser.add_argument("--model", default="tiny", help="负载测试使用的模型")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="负载测试的并发客户端数")
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 4, 8, 16],
+                        help="负载测试的 max_batch（1 为逐个解码的基线）")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="负载测试的攒批等待时间")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每个请求的音频时长（秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="每组负载持续时间（秒）")
+    parser.add_argument("--clip", help="使用指定录音代替合成音频")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING if args.benchmark else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.benchmark:
+        _benchmark_batching(
+            args.model, args.concurrency, args.max_batch, seconds=args.seconds,
+            duration=args.duration, max_wait_ms=args.max_wait_ms, clip=args.clip
+        )
+        return
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        asr_config = dict(yaml.safe_load(f)['asr'])
+    server_config = asr_config.get('server') or {}
+    socket_path = args.socket or server_config.get('socket', DEFAULT_SOCKET_PATH)
+    # 服务进程自己加载模型
+    asr_config['server'] = None
+
+    engine = ASREngine.from_config(asr_config)
+    engine.load_model()
+
+    server = ASRServer(
+        engine, socket_path,
+        max_batch=server_config.get('max_batch', 8),
+        max_wait_ms=server_config.get('max_wait_ms', 10.0)
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
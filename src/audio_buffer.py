@@ -0,0 +1,395 @@
+"""
+音频缓冲模块 - 预分配环形缓冲区，录音回调直接写入，停止时零拷贝交给 ASR
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    预分配的环形音频缓冲区
+
+    单写者（录音回调线程）+ 多读者。写入位置用累计样本数（绝对位置）表示，
+    写者先写数据再推进计数，读者只需读取一次计数即可拿到一致的快照，无需加锁。
+    overwrite 为 False 时写满后不再回绕，之后写入的数据被丢弃（用于录音，不覆盖开头）。
+    """
+
+    def __init__(self, capacity: int, channels: int = 1, dtype: str = "int16", overwrite: bool = True):
+        """
+        初始化环形缓冲区
+
+        Args:
+            capacity: 容量（样本帧数）
+            channels: 声道数
+            dtype: 样本类型（int16 或 float32）
+            overwrite: 写满后是否覆盖最早的数据；为 False 时丢弃新数据
+        """
+        if capacity <= 0:
+            raise ValueError(f"缓冲区容量必须为正数: {capacity}")
+
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.overwrite = overwrite
+        # np.empty 只保留虚拟内存，实际页面在首次写入时才分配
+        self._data = np.empty((self.capacity, channels), dtype=self.dtype)
+        self._written = 0
+
+    @property
+    def frames_written(self) -> int:
+        """累计写入的样本帧数（绝对写入位置）"""
+        return self._written
+
+    @property
+    def wrapped(self) -> bool:
+        """是否已经回绕（最早的数据已被覆盖）"""
+        return self._written > self.capacity
+
+    @property
+    def full(self) -> bool:
+        """是否已经写满"""
+        return self._written >= self.capacity
+
+    def __len__(self) -> int:
+        return min(self._written, self.capacity)
+
+    def reset(self):
+        """清空缓冲区（不释放内存）"""
+        self._written = 0
+
+    def write(self, block: np.ndarray) -> int:
+        """
+        写入一块音频（录音回调中调用）
+
+        Args:
+            block: 形状为 (frames, channels) 的音频块
+
+        Returns:
+            写入的样本帧数
+        """
+        n = len(block)
+        if not self.overwrite:
+            n = min(n, self.capacity - self._written)
+            block = block[:n]
+        if n <= 0:
+            return 0
+
+        if n > self.capacity:
+            # 超过容量时只保留最后 capacity 帧，绝对位置照常推进
+            skipped = n - self.capacity
+            block = block[skipped:]
+            self._written += skipped
+            n = self.capacity
+
+        pos = self._written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._data[pos:pos + first] = block[:first]
+        if first < n:
+            self._data[:n - first] = block[first:]
+
+        # 数据写完后再发布新的写入位置
+        self._written += n
+        return n
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        按绝对位置读取 [start, end) 区间
+
+        区间未跨越回绕点时返回零拷贝视图，否则返回按时间顺序拼接的副本。
+        已被覆盖的部分会被截掉。
+
+        Args:
+            start: 起始绝对位置
+            end: 结束绝对位置
+
+        Returns:
+            形状为 (frames, channels) 的音频数据
+        """
+        end = min(end, self._written)
+        start = max(start, end - self.capacity, 0)
+        if end <= start:
+            return self._data[:0]
+
+        s = start % self.capacity
+        e = s + (end - start)
+        if e <= self.capacity:
+            return self._data[s:e]
+
+        return np.concatenate((self._data[s:], self._data[:e - self.capacity]), axis=0)
+
+    def latest(self, frames: int) -> np.ndarray:
+        """
+        读取最近写入的若干帧（实时视图，不阻塞写者）
+
+        Args:
+            frames: 帧数
+
+        Returns:
+            最近的音频数据
+        """
+        end = self._written
+        return self.read(end - frames, end)
+
+    def view(self) -> np.ndarray:
+        """
+        读取缓冲区中全部有效数据
+
+        Returns:
+            未回绕时为零拷贝视图
+        """
+        end = self._written
+        return self.read(end - self.capacity, end)
+
+
+INT16_SCALE = np.float32(1.0 / 32768.0)
+
+
+def to_float32_mono(block: np.ndarray) -> np.ndarray:
+    """
+    把一个 int16 采集块一次性缩放为 float32 单声道（录音回调中调用）
+
+    多声道时用一次 (frames, channels) @ (channels, 1) 的矩阵乘法同时完成
+    缩放和求平均，不产生 int16 → float64 之类的中间数组。
+
+    Args:
+        block: 形状为 (frames, channels) 的 int16（或已归一化的浮点）音频块
+
+    Returns:
+        形状为 (frames, 1) 的 float32 块，范围 [-1, 1)
+    """
+    channels = block.shape[1]
+    scale = INT16_SCALE if block.dtype == np.int16 else np.float32(1.0)
+    if channels == 1:
+        if scale == 1.0:
+            return block.astype(np.float32, copy=False)
+        return np.multiply(block, scale, dtype=np.float32)
+    return block @ np.full((channels, 1), scale / channels, dtype=np.float32)
+
+
+SPILL_PREFIX = "typeless-spill-"
+WAV_HEADER_BYTES = 44
+
+
+def wav_header(frames: int, channels: int, sample_rate: int, dtype) -> bytes:
+    """
+    生成 44 字节的 WAV 文件头（int16 为 PCM，float32 为 IEEE float）
+
+    Args:
+        frames: 样本帧数
+        channels: 声道数
+        sample_rate: 采样率
+        dtype: 样本类型
+
+    Returns:
+        文件头字节
+    """
+    dtype = np.dtype(dtype)
+    width = dtype.itemsize
+    format_tag = 3 if dtype.kind == "f" else 1
+    data_bytes = frames * channels * width
+    return b"".join((
+        b"RIFF",
+        (36 + data_bytes).to_bytes(4, "little"),
+        b"WAVEfmt ",
+        (16).to_bytes(4, "little"),
+        format_tag.to_bytes(2, "little"),
+        channels.to_bytes(2, "little"),
+        sample_rate.to_bytes(4, "little"),
+        (sample_rate * channels * width).to_bytes(4, "little"),
+        (channels * width).to_bytes(2, "little"),
+        (width * 8).to_bytes(2, "little"),
+        b"data",
+        data_bytes.to_bytes(4, "little"),
+    ))
+
+
+class SpillBuffer:
+    """
+    可溢出到磁盘的追加式音频缓冲区
+
+    录音先写入内存；超过 memory_frames 后转存到一个 WAV 格式的临时文件，并通过
+    np.memmap 继续追加写入，常驻内存不随录音时长增长。finalize() 之后文件就是
+    一个完整的 WAV，可以直接改名保存而无需再复制一遍数据。
+    """
+
+    def __init__(self, memory_frames: int, max_frames: Optional[int] = None, channels: int = 1,
+                 dtype: str = "int16", sample_rate: int = 16000,
+                 directory: Optional[str] = None, grow_frames: Optional[int] = None):
+        """
+        初始化缓冲区
+
+        Args:
+            memory_frames: 内存中最多保存的帧数，超过后转存到磁盘
+            max_frames: 最大帧数（None 表示不限制）
+            channels: 声道数
+            dtype: 样本类型
+            sample_rate: 采样率（写入 WAV 头）
+            directory: 临时文件目录（默认系统临时目录）
+            grow_frames: 磁盘文件每次扩容的帧数（默认 5 分钟）
+        """
+        self.capacity = int(max_frames) if max_frames else sys.maxsize
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.grow_frames = grow_frames or sample_rate * 300
+        self.path: Optional[str] = None
+        self._data = np.empty((max(int(memory_frames), 1), channels), dtype=self.dtype)
+        self._file = None
+        self._written = 0
+
+    @property
+    def frames_written(self) -> int:
+        return self._written
+
+    @property
+    def wrapped(self) -> bool:
+        return False
+
+    @property
+    def full(self) -> bool:
+        """是否已达到 max_frames"""
+        return self._written >= self.capacity
+
+    @property
+    def spilled(self) -> bool:
+        """是否已经转存到磁盘"""
+        return self.path is not None
+
+    def __len__(self) -> int:
+        return self._written
+
+    def write(self, block: np.ndarray) -> int:
+        """写入一块音频，达到 max_frames 后丢弃多余部分"""
+        n = min(len(block), self.capacity - self._written)
+        if n <= 0:
+            return 0
+
+        end = self._written + n
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._written:end] = block[:n]
+        self._written = end
+        return n
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        end = min(end, self._written)
+        start = min(max(start, 0), end)
+        return self._data[start:end]
+
+    def latest(self, frames: int) -> np.ndarray:
+        end = self._written
+        return self.read(end - frames, end)
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._written]
+
+    def finalize(self) -> np.ndarray:
+        """
+        结束写入
+
+        Returns:
+            未转存时为内存视图；已转存时为指向完整 WAV 文件数据区的只读 np.memmap
+        """
+        if self.path is None:
+            return self.view()
+        if self._file is None:
+            return self._data
+
+        self._data.flush()
+        frame_bytes = self.channels * self.dtype.itemsize
+        self._file.seek(0)
+        self._file.write(wav_header(self._written, self.channels, self.sample_rate, self.dtype))
+        self._file.truncate(WAV_HEADER_BYTES + self._written * frame_bytes)
+        self._file.close()
+        self._file = None
+        self._data = np.memmap(
+            self.path, dtype=self.dtype, mode="r",
+            offset=WAV_HEADER_BYTES, shape=(self._written, self.channels)
+        )
+        logger.info(f"录音已写入磁盘: {self.path}（{self._written / self.sample_rate:.1f}秒）")
+        return self._data
+
+    def _grow(self, needed: int):
+        frames = min(max(needed, len(self._data) + self.grow_frames), self.capacity)
+        frame_bytes = self.channels * self.dtype.itemsize
+
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(prefix=SPILL_PREFIX, suffix=".wav", dir=self.directory)
+            self._file = os.fdopen(fd, "r+b")
+            self._file.write(wav_header(0, self.channels, self.sample_rate, self.dtype))
+            self._file.write(self._data[:self._written].tobytes())
+            logger.info(f"录音超过内存阈值，转存到磁盘: {self.path}")
+        else:
+            self._data.flush()
+
+        self._file.truncate(WAV_HEADER_BYTES + frames * frame_bytes)
+        self._file.flush()
+        # 旧的映射/内存数组仍被已交出的视图引用时保持有效
+        self._data = np.memmap(
+            self.path, dtype=self.dtype, mode="r+",
+            offset=WAV_HEADER_BYTES, shape=(frames, self.channels)
+        )
+
+
+def _benchmark_capture(seconds: float = 60, sample_rate: int = 16000, channels: int = 1,
+                       block_frames: int = 1024):
+    """对比两种输出格式：int16 缓冲 + 停止后整体转换 vs 回调中逐块转换为 float32"""
+    rng = np.random.default_rng(0)
+    blocks = [
+        rng.normal(0, 3000, (block_frames, channels)).astype(np.int16)
+        for _ in range(int(seconds * sample_rate / block_frames))
+    ]
+    frames = len(blocks) * block_frames
+
+    # 旧方式：录音时写 int16，停止后 flatten + astype + 除法
+    legacy = RingBuffer(frames, channels=channels, dtype="int16")
+    started_at = time.perf_counter()
+    for block in blocks:
+        legacy.write(block)
+    legacy_callback = time.perf_counter() - started_at
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    audio = legacy.view()
+    if channels > 1:
+        audio = audio.mean(axis=1)
+    legacy_float = audio.flatten().astype("float32") / 32768.0
+    legacy_stop = time.perf_counter() - started_at
+    legacy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # 新方式：回调中逐块转换写入 float32 缓冲区，停止后零拷贝交出视图
+    fused = RingBuffer(frames, channels=1, dtype="float32")
+    started_at = time.perf_counter()
+    for block in blocks:
+        fused.write(to_float32_mono(block))
+    fused_callback = time.perf_counter() - started_at
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    fused_float = fused.view().reshape(-1)
+    fused_stop = time.perf_counter() - started_at
+    fused_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert np.shares_memory(fused_float, fused._data)
+    error = float(np.abs(fused_float - legacy_float).max())
+    per_block = len(blocks)
+    print(f"{seconds:.0f}s 录音，{channels} 声道，每块 {block_frames} 帧（最大误差 {error:.2e}）")
+    print(f"  int16 + 停止后转换: 回调每块 {legacy_callback / per_block * 1e6:.2f}µs，"
+          f"停止后转换 {legacy_stop * 1000:.2f}ms，临时内存 {legacy_peak / 2**20:.1f}MiB")
+    print(f"  回调中转换 float32: 回调每块 {fused_callback / per_block * 1e6:.2f}µs，"
+          f"停止后转换 {fused_stop * 1000:.3f}ms，临时内存 {fused_peak / 2**20:.3f}MiB")
+
+
+if __name__ == "__main__":
+    # 基准测试：60 秒录音停止后交给 ASR 前的转换耗时与临时内存
+    for channels in (1, 2):
+        _benchmark_capture(channels=channels)
@@ -0,0 +1,287 @@
+"""
+ASR 前置音频整理模块 - 根据 VAD 标签裁掉首尾静音、压缩长停顿
+
+整理后的音频更短，Whisper 不再浪费算力解码静音；同时保留时间戳映射，
+识别结果中的片段时间可以换算回原始录音的时间。
+"""
+import logging
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TimestampMap:
+    """整理后音频时间 → 原始音频时间的分段线性映射"""
+
+    def __init__(self, pieces: List[Tuple[int, int, int]], sample_rate: int = 16000):
+        """
+        初始化时间戳映射
+
+        Args:
+            pieces: [(整理后起始样本, 原始起始样本, 样本数), ...]，按时间顺序
+            sample_rate: 采样率
+        """
+        self.pieces = pieces
+        self.sample_rate = sample_rate
+        self._starts = np.array([piece[0] for piece in pieces], dtype=np.int64)
+
+    @classmethod
+    def identity(cls, length: int, sample_rate: int = 16000) -> "TimestampMap":
+        """未做任何整理时的恒等映射"""
+        return cls([(0, 0, length)], sample_rate)
+
+    def to_original(self, seconds: float) -> float:
+        """
+        把整理后音频中的时间换算为原始音频中的时间
+
+        Args:
+            seconds: 整理后音频中的时间（秒）
+
+        Returns:
+            原始音频中的时间（秒）
+        """
+        if not self.pieces:
+            return seconds
+        sample = int(round(seconds * self.sample_rate))
+        index = max(int(np.searchsorted(self._starts, sample, side="right")) - 1, 0)
+        cond_start, orig_start, length = self.pieces[index]
+        offset = min(sample - cond_start, length)
+        return (orig_start + offset) / self.sample_rate
+
+    def map_segments(self, segments: List[dict]) -> List[dict]:
+        """
+        原地换算片段字典中的 start/end
+
+        Args:
+            segments: [{start, end, text}, ...]
+
+        Returns:
+            同一个列表
+        """
+        for segment in segments:
+            segment["start"] = self.to_original(segment["start"])
+            segment["end"] = self.to_original(segment["end"])
+        return segments
+
+
+def condition_audio(audio: np.ndarray, labels: np.ndarray, frame_size: int,
+                    sample_rate: int = 16000, padding_ms: float = 200,
+                    max_pause_ms: float = 600,
+                    min_saving: float = 0.1) -> Tuple[np.ndarray, TimestampMap, bool]:
+    """
+    裁掉首尾静音，并把长停顿压缩为固定长度
+
+    Args:
+        audio: 一维音频
+        labels: VAD 逐帧语音标签
+        frame_size: 每帧样本数
+        sample_rate: 采样率
+        padding_ms: 首个语音段之前、最后一个语音段之后保留的静音（毫秒）
+        max_pause_ms: 语音段之间的停顿超过该值时压缩到该长度（毫秒）
+        min_saving: 可裁掉的比例低于该值时不做整理（避免无意义的复制）
+
+    Returns:
+        (整理后的音频, 时间戳映射, 是否做了整理)
+    """
+    total = len(audio)
+    intervals = _keep_intervals(labels, frame_size, total,
+                                int(padding_ms * sample_rate / 1000),
+                                int(max_pause_ms * sample_rate / 1000))
+    if not intervals:
+        # VAD 没找到语音时保持原样，交给 Whisper 自己判断
+        return audio, TimestampMap.identity(total, sample_rate), False
+
+    kept = sum(end - start for start, end in intervals)
+    if kept > total * (1.0 - min_saving):
+        return audio, TimestampMap.identity(total, sample_rate), False
+
+    pieces = []
+    position = 0
+    for start, end in intervals:
+        pieces.append((position, start, end - start))
+        position += end - start
+
+    conditioned = np.concatenate([audio[start:end] for start, end in intervals])
+    logger.info(
+        f"音频整理: {total / sample_rate:.1f}s -> {kept / sample_rate:.1f}s "
+        f"（{len(intervals)} 段语音）"
+    )
+    return conditioned, TimestampMap(pieces, sample_rate), True
+
+
+def _keep_intervals(labels: np.ndarray, frame_size: int, total: int,
+                    padding: int, max_pause: int) -> List[Tuple[int, int]]:
+    """计算需要保留的原始音频区间（限制在 [0, total) 内，labels 可以比音频长）"""
+    if len(labels) == 0 or not labels.any():
+        return []
+
+    padded = np.concatenate(([False], labels, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded)) * frame_size
+    intervals: List[List[int]] = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        start, end = int(start), min(int(end), total)
+        if end <= start:
+            # 语音段落在音频之外（提前识别只取到 end_sample，标签已覆盖之后录到的部分）
+            continue
+        if not intervals:
+            start = max(start - padding, 0)
+        elif start - intervals[-1][1] <= max_pause:
+            # 停顿足够短，原样保留
+            intervals[-1][1] = end
+            continue
+        else:
+            # 长停顿压缩为 max_pause：前一段向后、后一段向前各保留一半
+            intervals[-1][1] += max_pause // 2
+            start -= max_pause - max_pause // 2
+        intervals.append([start, end])
+
+    if not intervals:
+        return []
+    intervals[-1][1] = min(intervals[-1][1] + padding, total)
+    return [(start, end) for start, end in intervals]
+
+
+def prepare_for_asr(audio: np.ndarray, labels: Optional[np.ndarray], frame_size: int,
+                    config: Optional[dict], sample_rate: int = 16000) -> Tuple[np.ndarray, TimestampMap, dict]:
+    """
+    按配置整理音频，并给出对应的解码参数
+
+    Args:
+        audio: 一维 float32 音频
+        labels: 录音时得到的 VAD 标签（可为 None）
+        frame_size: VAD 帧长（样本）
+        config: asr.conditioning 配置
+        sample_rate: 采样率
+
+    Returns:
+        (音频, 时间戳映射, 额外解码参数)
+    """
+    config = config or {}
+    if not config.get("enabled", False) or labels is None:
+        return audio, TimestampMap.identity(len(audio), sample_rate), {}
+
+    conditioned, timestamp_map, applied = condition_audio(
+        audio, labels, frame_size,
+        sample_rate=sample_rate,
+        padding_ms=config.get("padding_ms", 200),
+        max_pause_ms=config.get("max_pause_ms", 600)
+    )
+    options = {}
+    if applied and config.get("skip_whisper_vad", True):
+        # 已经用自己的 VAD 切过，不必再让 Whisper 跑一遍 Silero VAD
+        options["vad_filter"] = False
+    return conditioned, timestamp_map, options
+
+
+def to_float_mono(block: np.ndarray) -> np.ndarray:
+    """
+    转换为 Whisper 需要的一维 float32（int16 缩放到 [-1, 1)，多声道取平均）
+
+    Args:
+        block: (frames,) 或 (frames, channels) 的音频
+
+    Returns:
+        float32 一维数组（已是 float32 单声道时不复制）
+    """
+    if block.ndim > 1:
+        block = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+    if np.issubdtype(block.dtype, np.integer):
+        return block.astype(np.float32) * np.float32(1.0 / 32768.0)
+    return block.astype(np.float32, copy=False)
+
+
+def iter_audio_chunks(audio: np.ndarray, sample_rate: int = 16000, chunk_seconds: float = 30.0,
+                      search_seconds: float = 3.0) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    把长音频（可以是磁盘上的 np.memmap）切成块，逐块转换为 float32
+
+    切点选在每块末尾 search_seconds 范围内最安静的位置，尽量不把一个词切断。
+    任一时刻只有一块被读入内存。
+
+    Args:
+        audio: 音频
+        sample_rate: 采样率
+        chunk_seconds: 每块的最大时长（秒）
+        search_seconds: 在块末尾多长范围内寻找切点（秒）
+
+    Yields:
+        (块起点样本位置, float32 一维块)
+    """
+    total = len(audio)
+    chunk = int(chunk_seconds * sample_rate)
+    search = min(int(search_seconds * sample_rate), chunk // 2)
+    frame = max(int(0.02 * sample_rate), 1)
+
+    start = 0
+    while start < total:
+        end = min(start + chunk, total)
+        if end < total and search >= frame:
+            end = _quietest_point(audio, end - search, end, frame)
+        yield start, to_float_mono(audio[start:end])
+        start = end
+
+
+def _quietest_point(audio: np.ndarray, lo: int, hi: int, frame: int) -> int:
+    """返回 [lo, hi) 中能量最低的帧的中心位置"""
+    window = to_float_mono(audio[lo:hi])
+    n_frames = len(window) // frame
+    if n_frames == 0:
+        return hi
+    frames = window[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.einsum("ij,ij->i", frames, frames)
+    return lo + int(np.argmin(energy)) * frame + frame // 2
+
+
+def speech_windows(audio: np.ndarray, labels: np.ndarray, frame_size: int,
+                   window_samples: int, padding: int = 3200) -> List[Tuple[int, int]]:
+    """
+    按 VAD 边界把长音频划分为不超过 window_samples 的解码窗口
+
+    相邻语音段尽量合并到同一个窗口；窗口之间的静音不再解码。单个语音段超过
+    窗口长度时在其末尾附近最安静的位置切开。
+
+    Args:
+        audio: 音频
+        labels: VAD 逐帧语音标签
+        frame_size: 每帧样本数
+        window_samples: 窗口最大长度（样本）
+        padding: 每个语音段前后保留的静音（样本）
+
+    Returns:
+        [(起始样本, 结束样本), ...]，按时间顺序、互不重叠
+    """
+    total = len(audio)
+    if len(labels) == 0 or not labels.any():
+        return []
+
+    padded = np.concatenate(([False], labels, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded)) * frame_size
+    speech: List[List[int]] = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        start, end = max(int(start) - padding, 0), min(int(end) + padding, total)
+        if speech and start <= speech[-1][1]:
+            speech[-1][1] = end
+        else:
+            speech.append([start, end])
+
+    search = window_samples // 10
+    frame = max(frame_size, 1)
+    windows: List[Tuple[int, int]] = []
+    window_start, window_end = speech[0][0], speech[0][0]
+    for start, end in speech:
+        if end - window_start <= window_samples:
+            window_end = end
+            continue
+        if window_end > window_start:
+            windows.append((window_start, window_end))
+            window_start = start
+        # 超长语音段：在窗口末尾附近最安静处切开
+        while end - window_start > window_samples:
+            limit = window_start + window_samples
+            cut = _quietest_point(audio, limit - search, limit, frame) if search >= frame else limit
+            windows.append((window_start, cut))
+            window_start = cut
+        window_end = end
+    windows.append((window_start, window_end))
+    return windows
@@ -3,34 +3,112 @@
 """
 import os
 import logging
+import queue
+import shutil
 import tempfile
 import numpy as np
 import sounddevice as sd
 import wave
-from typing import Optional
+from typing import Callable, Optional
 from threading import Event
 
+from audio_buffer import SPILL_PREFIX, RingBuffer, SpillBuffer, to_float32_mono, wav_header
+from resample import PolyphaseResampler, create_resampler
+from shared_audio import is_whole_file_memmap
+from vad import VoiceActivityDetector
+
 logger = logging.getLogger(__name__)
 
+# max_duration 不限制且未配置 spill_after_seconds 时，录音在内存中最多保留多少秒，之后转存到磁盘
+UNLIMITED_MEMORY_SECONDS = 60
+
 
 class AudioRecorder:
     """音频录制器"""
     
-    def __init__(self, sample_rate: int = 16000, channels: int = 1):
+    def __init__(self, sample_rate: int = 16000, channels: int = 1, max_duration: float = 60,
+                 persistent_stream: bool = False, preroll_ms: float = 300,
+                 capture_rate=None, spill_after_seconds: Optional[float] = None,
+                 spill_dir: Optional[str] = None, dtype: str = "int16"):
         """
         初始化录音器
         
         Args:
             sample_rate: 采样率（Hz）
             channels: 声道数
+            max_duration: 最大录音时长（秒），决定预分配缓冲区大小；0 或 None 表示不限制
+                （录音超过 UNLIMITED_MEMORY_SECONDS 后转存到磁盘）
+            persistent_stream: 是否常开输入流（开始录音无需打开设备，并带预录音）
+            preroll_ms: 常开模式下，录音开始前额外保留的音频（毫秒）
+            capture_rate: 设备采集采样率；None 表示直接按 sample_rate 采集，
+                "native" 表示使用设备默认采样率，再重采样到 sample_rate
+            spill_after_seconds: 录音超过该时长后转存到磁盘（None 表示始终在内存中）
+            spill_dir: 转存文件目录（默认系统临时目录）
+            dtype: 录音数据格式；"float32" 表示在录音回调中逐块转换为 [-1, 1) 的
+                单声道 float32，停止后可直接交给 ASR，无需再整体转换
         """
         self.sample_rate = sample_rate
         self.channels = channels
+        self.max_duration = max_duration
+        self.persistent_stream = persistent_stream
+        self.preroll_ms = preroll_ms if persistent_stream else 0
         self.recording = False
-        self.audio_data = []
         self.stream = None
+        self._buffer: Optional[RingBuffer] = None
+        self._capture_target: Optional[RingBuffer] = None
+        self._preroll: Optional[RingBuffer] = None
+        self.capture_rate = capture_rate
+        self._resampler: Optional[PolyphaseResampler] = None
+        self.spill_after_seconds = spill_after_seconds
+        self.spill_dir = os.path.expanduser(spill_dir) if spill_dir else None
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.int16, np.float32):
+            raise ValueError(f"不支持的录音数据格式: {dtype}")
+        # float32 模式在回调中混成单声道，缓冲区只有一个声道
+        self.buffer_channels = 1 if self.dtype == np.float32 else channels
         
-        logger.info(f"初始化音频录制器: {sample_rate}Hz, {channels}声道")
+        logger.info(f"初始化音频录制器: {sample_rate}Hz, {channels}声道, {self.dtype.name}")
+    
+    def open_stream(self):
+        """
+        打开常开输入流（persistent_stream 模式）
+        
+        设备持续采集到一个小的预录音环形缓冲区；开始录音只是切换写入目标，
+        没有打开设备的延迟，预录音还能补回按下快捷键前后的第一个音节。
+        """
+        if self.stream is not None:
+            return
+        
+        preroll_frames = max(int(self.preroll_ms * self.sample_rate / 1000), 1)
+        self._preroll = RingBuffer(preroll_frames, channels=self.buffer_channels, dtype=self.dtype)
+        preroll = self._preroll
+        
+        def callback(indata, frames, time, status):
+            if status:
+                logger.warning(f"录音状态: {status}")
+            block = self._convert_block(indata)
+            target = self._capture_target
+            if target is not None:
+                if target.frames_written == 0 and len(preroll):
+                    # 录音的第一个块：先补上预录音
+                    head = preroll.view()
+                    target.write(head)
+                    self._on_audio_block(head)
+                target.write(block)
+                self._on_audio_block(block)
+            preroll.write(block)
+        
+        self.stream = self._create_input_stream(callback)
+        self.stream.start()
+        logger.info(f"常开输入流已启动（预录音 {self.preroll_ms:.0f}ms）")
+    
+    def close_stream(self):
+        """关闭常开输入流"""
+        self._capture_target = None
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
     
     def start_recording(self):
         """开始录音"""
@@ -38,23 +116,30 @@ class AudioRecorder:
             logger.warning("已在录音中")
             return
         
+        # 每次录音使用新的缓冲区，上一次 stop_recording 返回的视图不会被覆盖
+        self._buffer = self._create_buffer()
         self.recording = True
-        self.audio_data = []
         
         logger.info("开始录音...")
         
+        if self.persistent_stream:
+            if self.stream is None:
+                self.open_stream()
+            # 常开模式下只需切换写入目标
+            self._capture_target = self._buffer
+            return
+        
+        buffer = self._buffer
+
         def callback(indata, frames, time, status):
             if status:
                 logger.warning(f"录音状态: {status}")
             if self.recording:
-                self.audio_data.append(indata.copy())
+                block = self._convert_block(indata)
+                buffer.write(block)
+                self._on_audio_block(block)
         
-        self.stream = sd.InputStream(
-            samplerate=self.sample_rate,
-            channels=self.channels,
-            callback=callback,
-            dtype='int16'
-        )
+        self.stream = self._create_input_stream(callback)
         self.stream.start()
     
     def stop_recording(self) -> Optional[np.ndarray]:
@@ -70,24 +155,146 @@ class AudioRecorder:
         
         self.recording = False
         
-        if self.stream:
+        if self.persistent_stream:
+            # 常开模式下不关闭设备，只释放本次录音的缓冲区
+            self._capture_target = None
+        elif self.stream:
             self.stream.stop()
             self.stream.close()
             self.stream = None
         
         logger.info("停止录音")
         
-        if not self.audio_data:
+        buffer = self._buffer
+        if buffer is None or len(buffer) == 0:
             logger.warning("没有录制到音频数据")
             return None
         
-        # 合并音频数据
-        audio_array = np.concatenate(self.audio_data, axis=0)
+        if buffer.full:
+            logger.warning(f"录音达到最大时长 {self.max_duration}s，之后的音频未录入")
+        
+        # 直接返回缓冲区视图（零拷贝）；已转存到磁盘时返回 np.memmap
+        audio_array = self._finish_buffer(buffer)
         
         logger.info(f"录音完成: {len(audio_array)} 样本 ({len(audio_array)/self.sample_rate:.1f}秒)")
         
         return audio_array
     
+    def latest_audio(self, duration_ms: float) -> Optional[np.ndarray]:
+        """
+        读取正在录制的最近一段音频（不阻塞录音回调）
+        
+        Args:
+            duration_ms: 时长（毫秒）
+            
+        Returns:
+            最近的音频数据，未在录音时返回 None
+        """
+        buffer = self._buffer
+        if buffer is None:
+            return None
+        return buffer.latest(int(duration_ms * self.sample_rate / 1000))
+    
+    def _resolve_capture_rate(self) -> int:
+        """确定设备采集采样率"""
+        if not self.capture_rate:
+            return self.sample_rate
+        if str(self.capture_rate).lower() == "native":
+            try:
+                return int(sd.query_devices(kind='input')['default_samplerate'])
+            except Exception as e:
+                logger.warning(f"查询输入设备采样率失败，使用 {self.sample_rate}Hz: {e}")
+                return self.sample_rate
+        return int(self.capture_rate)
+    
+    def _create_input_stream(self, callback, blocksize: Optional[int] = None):
+        """
+        按采集采样率创建输入流，必要时准备重采样器
+        
+        Args:
+            callback: 音频回调
+            blocksize: 以 sample_rate 计的块大小（会按采集采样率换算）
+        """
+        rate = self._resolve_capture_rate()
+        self._resampler = create_resampler(rate, self.sample_rate, self.buffer_channels)
+        
+        kwargs = {}
+        if blocksize:
+            kwargs['blocksize'] = int(blocksize * rate / self.sample_rate)
+        
+        return sd.InputStream(
+            samplerate=rate,
+            channels=self.channels,
+            callback=callback,
+            dtype='int16',
+            **kwargs
+        )
+    
+    def _convert_block(self, indata: np.ndarray) -> np.ndarray:
+        """把设备采集的块转换为 sample_rate 下、缓冲区格式的样本（int16 且采样率一致时原样返回）"""
+        if self.dtype == np.float32:
+            # 先混音再重采样，重采样只需处理一个声道
+            block = to_float32_mono(indata)
+            return block if self._resampler is None else self._resampler.process(block)
+        if self._resampler is None:
+            return indata
+        resampled = self._resampler.process(indata)
+        return np.clip(resampled * 32768.0, -32768, 32767).astype(np.int16)
+    
+    def peek_audio(self, end_sample: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        读取本次录音从开头到指定位置的音频（录音进行中也可调用）
+        
+        Args:
+            end_sample: 结束样本位置，默认为当前写入位置
+            
+        Returns:
+            音频数据（未回绕时为零拷贝视图）
+        """
+        buffer = self._buffer
+        if buffer is None:
+            return None
+        end = buffer.frames_written if end_sample is None else end_sample
+        return buffer.read(0, end)
+    
+    def _on_audio_block(self, block: np.ndarray):
+        """录音回调钩子（在音频线程中调用，子类可覆盖，必须足够轻量）"""
+        pass
+    
+    def _create_buffer(self):
+        """按 max_duration（加预录音）预分配录音缓冲区；写满后丢弃新音频，不覆盖录音开头"""
+        self._discard_spill_file()
+        max_seconds = (self.max_duration + self.preroll_ms / 1000) if self.max_duration else None
+        
+        if self.spill_after_seconds or not max_seconds:
+            # 长时间录音（或不限时长）：超过阈值后写入磁盘，常驻内存保持不变
+            return SpillBuffer(
+                int((self.spill_after_seconds or UNLIMITED_MEMORY_SECONDS) * self.sample_rate),
+                max_frames=int(max_seconds * self.sample_rate) if max_seconds else None,
+                channels=self.buffer_channels,
+                dtype=self.dtype,
+                sample_rate=self.sample_rate,
+                directory=self.spill_dir
+            )
+        
+        return RingBuffer(int(max_seconds * self.sample_rate), channels=self.buffer_channels,
+                          dtype=self.dtype, overwrite=False)
+    
+    @staticmethod
+    def _finish_buffer(buffer) -> np.ndarray:
+        if isinstance(buffer, SpillBuffer):
+            return buffer.finalize()
+        return buffer.view()
+    
+    def _discard_spill_file(self):
+        """删除上一次录音未保存的转存文件（已映射的数组在 POSIX 上仍可继续读取）"""
+        buffer = self._buffer
+        if isinstance(buffer, SpillBuffer) and buffer.path and os.path.exists(buffer.path):
+            try:
+                os.remove(buffer.path)
+            except OSError as e:
+                logger.warning(f"删除转存文件失败: {e}")
+    
     def save_audio(self, audio_data: np.ndarray, filename: Optional[str] = None) -> str:
         """
         保存音频到文件
@@ -99,10 +306,30 @@ class AudioRecorder:
         Returns:
             保存的文件路径
         """
+        spill_path = audio_data.filename if is_whole_file_memmap(audio_data) else None
+        if spill_path and os.path.basename(spill_path).startswith(SPILL_PREFIX):
+            # 完整的转存录音本身已是 WAV，直接改名（同一文件系统下不复制数据）；
+            # 切片只保存切出的部分，走下面的常规写入
+            if filename is None:
+                logger.info(f"音频已保存到: {spill_path}")
+                return spill_path
+            shutil.move(spill_path, filename)
+            logger.info(f"音频已保存到: {filename}")
+            return filename
+        
         if filename is None:
             fd, filename = tempfile.mkstemp(suffix='.wav')
             os.close(fd)
         
+        if audio_data.dtype == np.float32:
+            # wave 模块只支持整数 PCM，float32 按 IEEE float 格式写入
+            channels = audio_data.shape[1] if audio_data.ndim > 1 else 1
+            with open(filename, 'wb') as f:
+                f.write(wav_header(len(audio_data), channels, self.sample_rate, audio_data.dtype))
+                f.write(audio_data.tobytes())
+            logger.info(f"音频已保存到: {filename}")
+            return filename
+        
         with wave.open(filename, 'wb') as wf:
             wf.setnchannels(self.channels)
             wf.setsampwidth(2)  # 16-bit
@@ -141,29 +368,157 @@ class SmartRecorder(AudioRecorder):
     
     def __init__(self, sample_rate: int = 16000, channels: int = 1,
                  silence_threshold: float = 500, silence_duration: float = 2.0,
-                 max_duration: float = 60):
+                 max_duration: float = 60, vad_options: Optional[dict] = None,
+                 persistent_stream: bool = False, preroll_ms: float = 300,
+                 capture_rate=None, spill_after_seconds: Optional[float] = None,
+                 spill_dir: Optional[str] = None, dtype: str = "int16"):
         """
         初始化智能录音器
         
         Args:
             sample_rate: 采样率
             channels: 声道数
-            silence_threshold: 静音阈值（音量 RMS）
+            silence_threshold: 初始静音阈值（音量 RMS），之后随环境噪声自适应
             silence_duration: 多少秒静音后自动停止
             max_duration: 最大录音时长
+            vad_options: 传给 VoiceActivityDetector 的其他参数
+            persistent_stream: 是否常开输入流
+            preroll_ms: 常开模式下的预录音时长（毫秒）
+            capture_rate: 设备采集采样率（None 或 "native"）
+            spill_after_seconds: 录音超过该时长后转存到磁盘
+            spill_dir: 转存文件目录
+            dtype: 录音数据格式（int16 或 float32）
         """
-        super().__init__(sample_rate, channels)
+        super().__init__(sample_rate, channels, max_duration, persistent_stream, preroll_ms,
+                         capture_rate, spill_after_seconds, spill_dir, dtype)
         self.silence_threshold = silence_threshold
         self.silence_duration = silence_duration
-        self.max_duration = max_duration
         self.stop_event = Event()
+        self.chunk_queue: Optional[queue.Queue] = None
+        self.vad = VoiceActivityDetector(
+            sample_rate=sample_rate,
+            initial_threshold=silence_threshold,
+            **(vad_options or {})
+        )
+        self._vad_labels = []
+        
+        # 自动断句（endpointing）
+        self.speculative_delay = 0.5
+        self._on_endpoint: Optional[Callable[[], None]] = None
+        self._on_silence_start: Optional[Callable[[int], None]] = None
+        self._on_speech_resume: Optional[Callable[[], None]] = None
+        self.silence_stop = True
+        self._silence_pending = False
+        self._endpoint_fired = False
         
         logger.info(f"智能录音器: 静音阈值={silence_threshold}, 静音时长={silence_duration}s")
     
+    def attach_queue(self, chunk_queue: queue.Queue):
+        """
+        录音时把每个音频块推送到队列（用于流式识别）
+        
+        Args:
+            chunk_queue: 接收音频块的队列
+        """
+        self.chunk_queue = chunk_queue
+    
+    def detach_queue(self):
+        """停止推送音频块"""
+        self.chunk_queue = None
+    
+    def start_recording(self):
+        """开始录音（同时重置 VAD 状态）"""
+        if not self.recording:
+            self._reset_vad()
+        super().start_recording()
+    
+    def set_endpoint_callbacks(self, on_endpoint: Optional[Callable[[], None]],
+                               on_silence_start: Optional[Callable[[int], None]] = None,
+                               on_speech_resume: Optional[Callable[[], None]] = None,
+                               speculative_delay: float = 0.5, silence_stop: bool = True):
+        """
+        启用自动断句：检测到语音后出现持续静音时通知调用方
+        
+        回调在音频线程中执行，必须立即返回（耗时操作请交给其他线程）。
+        
+        Args:
+            on_endpoint: 静音达到 silence_duration 或录音达到 max_duration 时调用（每次录音一次）
+            on_silence_start: 静音持续 speculative_delay 秒时调用，参数为语音结束处的样本位置，
+                可用于提前开始识别
+            on_speech_resume: on_silence_start 之后又检测到语音时调用，提前识别的结果应作废
+            speculative_delay: 静音持续多久后触发 on_silence_start（秒）
+            silence_stop: 为 False 时不按静音断句，只在录音达到 max_duration 时调用 on_endpoint
+                （手动停止模式）
+        """
+        self._on_endpoint = on_endpoint
+        self._on_silence_start = on_silence_start
+        self._on_speech_resume = on_speech_resume
+        self.speculative_delay = speculative_delay
+        self.silence_stop = silence_stop
+    
+    def _reset_vad(self):
+        self.vad.reset()
+        self._vad_labels = []
+        self._silence_pending = False
+        self._endpoint_fired = False
+    
+    def _on_audio_block(self, block: np.ndarray):
+        self._vad_labels.append(self.vad.process(block))
+        chunk_queue = self.chunk_queue
+        if chunk_queue is not None:
+            # PortAudio 会复用 indata 的内存，这里必须复制
+            chunk_queue.put_nowait(block.copy())
+        if self._on_endpoint is not None and not self._endpoint_fired:
+            self._check_endpoint()
+    
+    def _check_endpoint(self):
+        vad = self.vad
+        buffer = self._buffer
+        if buffer is not None and buffer.full:
+            self._fire_endpoint("达到最大录音时长")
+            return
+        
+        # 尚未开口时不断句，避免用户思考时被提前截断
+        if not self.silence_stop or not vad.speech_detected:
+            return
+        
+        silence = vad.trailing_silence_seconds
+        if not self._silence_pending and silence >= self.speculative_delay:
+            self._silence_pending = True
+            if self._on_silence_start:
+                self._on_silence_start(vad.speech_end_sample)
+        elif self._silence_pending and silence < self.speculative_delay:
+            self._silence_pending = False
+            if self._on_speech_resume:
+                self._on_speech_resume()
+        
+        if silence >= self.silence_duration:
+            self._fire_endpoint(f"静音 {silence:.1f}s")
+    
+    def _fire_endpoint(self, reason: str):
+        self._endpoint_fired = True
+        logger.info(f"自动断句: {reason}")
+        self._on_endpoint()
+    
+    @property
+    def is_speaking(self) -> bool:
+        """当前是否检测到语音（供 UI 使用）"""
+        return self.vad.is_speech
+    
+    def speech_labels(self) -> np.ndarray:
+        """
+        本次录音的逐帧语音标签
+        
+        Returns:
+            bool 数组，每个元素对应 vad.frame_size 个样本
+        """
+        if not self._vad_labels:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate(self._vad_labels)
+    
     def is_silent(self, audio_chunk: np.ndarray) -> bool:
-        """判断音频片段是否为静音"""
-        rms = np.sqrt(np.mean(audio_chunk.astype(float) ** 2))
-        return rms < self.silence_threshold
+        """判断音频片段是否为静音（使用当前自适应阈值，不更新 VAD 状态）"""
+        return not self.vad.contains_speech(audio_chunk)
     
     def record_until_silence(self) -> Optional[np.ndarray]:
         """
@@ -174,45 +529,33 @@ class SmartRecorder(AudioRecorder):
         """
         logger.info("开始智能录音（检测静音）...")
         
-        audio_data = []
-        silence_frames = 0
-        silence_threshold_frames = int(self.silence_duration * self.sample_rate / 1024)
-        max_frames = int(self.max_duration * self.sample_rate / 1024)
-        frame_count = 0
+        buffer = self._create_buffer()
+        self._buffer = buffer
+        self._reset_vad()
+        self.stop_event.clear()
         
         def callback(indata, frames, time, status):
-            nonlocal silence_frames, frame_count
-            
             if status:
                 logger.warning(f"录音状态: {status}")
             
-            audio_data.append(indata.copy())
-            frame_count += 1
-            
-            # 检查是否静音
-            if self.is_silent(indata):
-                silence_frames += 1
-            else:
-                silence_frames = 0
+            # 写入缓冲区的同时由 VAD 更新逐帧标签
+            block = self._convert_block(indata)
+            buffer.write(block)
+            self._on_audio_block(block)
             
             # 达到静音阈值或最大时长
-            if silence_frames >= silence_threshold_frames or frame_count >= max_frames:
+            if (self.vad.trailing_silence_seconds >= self.silence_duration
+                    or buffer.full):
                 self.stop_event.set()
         
-        with sd.InputStream(
-            samplerate=self.sample_rate,
-            channels=self.channels,
-            callback=callback,
-            dtype='int16',
-            blocksize=1024
-        ):
+        with self._create_input_stream(callback, blocksize=1024):
             self.stop_event.wait()
         
-        if not audio_data:
+        if len(buffer) == 0:
             logger.warning("没有录制到音频数据")
             return None
         
-        audio_array = np.concatenate(audio_data, axis=0)
+        audio_array = self._finish_buffer(buffer)
         
         logger.info(f"录音完成: {len(audio_array)/self.sample_rate:.1f}秒")
         
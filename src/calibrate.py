@@ -0,0 +1,262 @@
+"""
+主机校准工具 - 在本机上实测 model_size × compute_type × 线程数的组合，保存最快的配置
+
+每个组合在独立子进程中从本地缓存加载模型（完全离线），对固定种子的合成参考音频
+（或指定的录音）做解码，测量加载耗时、实时率（RTF）和峰值内存。结果写入模型缓存
+目录下的主机配置文件，ASREngine 启动时自动读取。
+
+用法:
+    python src/calibrate.py --models large-v3-turbo medium --threads 0 4 8
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import faster_whisper
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+
+from decoding import DECODING_PROFILES
+from vad import synthetic_signal
+
+logger = logging.getLogger(__name__)
+
+HOST_PROFILE_NAME = "typeless_host_profile.json"
+HOST_PROFILE_VERSION = 1
+
+
+def host_profile_path(cache_dir: str) -> str:
+    """主机配置文件路径（与模型缓存放在一起）"""
+    return os.path.join(os.path.expanduser(cache_dir), HOST_PROFILE_NAME)
+
+
+def load_host_profile(cache_dir: str, model_size: str, device: str) -> Optional[dict]:
+    """
+    读取某个模型在本机上校准出的最佳配置
+
+    Args:
+        cache_dir: 模型缓存目录
+        model_size: 模型大小
+        device: 计算设备
+
+    Returns:
+        {compute_type, cpu_threads, rtf, load_seconds, peak_rss_mb}，没有校准结果时返回 None
+    """
+    path = host_profile_path(cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取主机配置失败: {path}: {e}")
+        return None
+
+    if profile.get("version") != HOST_PROFILE_VERSION:
+        return None
+    if profile.get("host", {}).get("machine") != platform.machine():
+        logger.warning(f"主机配置来自其他机器（{profile.get('host')}），忽略")
+        return None
+    return profile.get("best", {}).get(f"{model_size}@{device}")
+
+
+def reference_clip(seconds: float, seed: int) -> np.ndarray:
+    """固定种子的合成参考音频（float32，16 kHz），每次生成的数据完全相同"""
+    audio, _ = synthetic_signal(seconds, seed=seed)
+    return audio.astype(np.float32) / 32768.0
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_candidate(candidate: dict) -> dict:
+    """
+    在当前进程中测量一个组合（由子进程调用，保证峰值内存互不影响）
+
+    Args:
+        candidate: {model_size, compute_type, cpu_threads, device, cache_dir, seconds, seed, clip, repeats, profile}
+
+    Returns:
+        测量结果
+    """
+    if candidate.get("clip"):
+        audio = decode_audio(candidate["clip"], sampling_rate=16000)
+    else:
+        audio = reference_clip(candidate["seconds"], candidate["seed"])
+    duration = len(audio) / 16000
+
+    started_at = time.perf_counter()
+    model = WhisperModel(
+        candidate["model_size"],
+        device=candidate["device"],
+        compute_type=candidate["compute_type"],
+        cpu_threads=candidate["cpu_threads"],
+        download_root=os.path.expanduser(candidate["cache_dir"]),
+        local_files_only=True
+    )
+    load_seconds = time.perf_counter() - started_at
+
+    # 只用 0 温度：温度回退会随机采样，结果不可复现
+    options = dict(DECODING_PROFILES[candidate["profile"]], temperature=[0.0])
+    options.update(language="zh", vad_filter=False)
+
+    def decode() -> float:
+        started_at = time.perf_counter()
+        segments, _ = model.transcribe(audio, **options)
+        for _ in segments:
+            pass
+        return time.perf_counter() - started_at
+
+    decode()  # 预热：第一次解码包含惰性分配
+    timings = sorted(decode() for _ in range(candidate["repeats"]))
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "rtf": round(timings[len(timings) // 2] / duration, 4),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _measure_in_subprocess(candidate: dict, timeout: float) -> dict:
+    env = dict(os.environ, HF_HUB_OFFLINE="1")
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(candidate)],
+            capture_output=True, text=True, timeout=timeout, env=env
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"超时（{timeout:.0f}s）"}
+    if completed.returncode != 0:
+        lines = (completed.stderr or "").strip().splitlines()
+        return {"error": lines[-1] if lines else f"退出码 {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def calibrate(models: List[str], compute_types: List[str], threads: List[int],
+              device: str = "cpu", cache_dir: str = "~/.cache/whisper",
+              seconds: float = 20.0, seed: int = 0, clip: Optional[str] = None,
+              repeats: int = 3, profile: str = "accurate", max_rss_mb: Optional[float] = None,
+              timeout: float = 900.0) -> dict:
+    """
+    测量所有组合，并为每个模型选出 RTF 最低的配置
+
+    Args:
+        models: 候选模型
+        compute_types: 候选计算类型
+        threads: 候选线程数（0 表示 CTranslate2 默认）
+        device: 计算设备
+        cache_dir: 模型缓存目录
+        seconds: 合成参考音频时长（秒）
+        seed: 合成参考音频的随机种子
+        clip: 使用指定录音代替合成音频
+        repeats: 每个组合解码次数（取中位数）
+        profile: 解码档位
+        max_rss_mb: 峰值内存上限，超过的组合不参与选择
+        timeout: 单个组合的超时（秒）
+
+    Returns:
+        主机配置（同时写入文件）
+    """
+    results = []
+    for model_size, compute_type, cpu_threads in itertools.product(models, compute_types, threads):
+        candidate = {
+            "model_size": model_size, "compute_type": compute_type, "cpu_threads": cpu_threads,
+            "device": device, "cache_dir": cache_dir, "seconds": seconds, "seed": seed,
+            "clip": clip, "repeats": repeats, "profile": profile,
+        }
+        print(f"测量 {model_size} / {compute_type} / threads={cpu_threads} ...", flush=True)
+        measured = _measure_in_subprocess(candidate, timeout)
+        if "error" in measured:
+            print(f"  跳过: {measured['error']}")
+        else:
+            print(f"  加载 {measured['load_seconds']:.2f}s，RTF {measured['rtf']:.3f}，"
+                  f"峰值内存 {measured['peak_rss_mb']:.0f}MB")
+        results.append({
+            "model_size": model_size, "compute_type": compute_type, "cpu_threads": cpu_threads,
+            **measured
+        })
+
+    best = {}
+    for result in results:
+        if "error" in result or (max_rss_mb and result["peak_rss_mb"] > max_rss_mb):
+            continue
+        key = f"{result['model_size']}@{device}"
+        if key not in best or result["rtf"] < best[key]["rtf"]:
+            best[key] = {k: v for k, v in result.items() if k != "model_size"}
+
+    # 保留之前校准过、本次没有测量的模型
+    path = host_profile_path(cache_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous.get("host", {}).get("machine") == platform.machine():
+                best = {**previous.get("best", {}), **best}
+        except (OSError, ValueError):
+            pass
+
+    host_profile = {
+        "version": HOST_PROFILE_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "faster_whisper": faster_whisper.__version__,
+        },
+        "reference": {"clip": clip, "seconds": None if clip else seconds, "seed": seed,
+                      "repeats": repeats, "profile": profile},
+        "results": results,
+        "best": best,
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(host_profile, f, ensure_ascii=False, indent=2)
+    print(f"主机配置已写入: {path}")
+    for key, entry in best.items():
+        print(f"  {key}: {entry['compute_type']}，threads={entry['cpu_threads']}，RTF {entry['rtf']:.3f}")
+    return host_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校准本机上最快的 Whisper 模型配置（离线）")
+    parser.add_argument("--models", nargs="+", default=["large-v3-turbo"], help="候选模型")
+    parser.add_argument("--compute-types", nargs="+", default=["int8", "int8_float32", "float32"],
+                        help="候选计算类型")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="候选线程数（0 为默认）")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--cache-dir", default="~/.cache/whisper")
+    parser.add_argument("--seconds", type=float, default=20.0, help="合成参考音频时长（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="合成参考音频的随机种子")
+    parser.add_argument("--clip", help="使用指定录音代替合成音频")
+    parser.add_argument("--repeats", type=int, default=3, help="每个组合解码次数（取中位数）")
+    parser.add_argument("--profile", default="accurate", help="解码档位")
+    parser.add_argument("--max-rss-mb", type=float, help="峰值内存上限（MB）")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # 子进程：测量一个组合，结果以 JSON 输出到最后一行
+        print(json.dumps(run_candidate(json.loads(args.worker))))
+        return
+
+    calibrate(
+        args.models, args.compute_types, args.threads,
+        device=args.device, cache_dir=args.cache_dir, seconds=args.seconds, seed=args.seed,
+        clip=args.clip, repeats=args.repeats, profile=args.profile, max_rss_mb=args.max_rss_mb
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+解码参数模块 - 延迟/准确率档位，按实测实时率（RTF）自动切换档位，以及自动语言检测的缓存
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 档位按从快到慢排列；auto 模式在相邻档位之间切换
+DECODING_PROFILES = {
+    "realtime": {
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": [0.0],  # 不做温度回退，解码失败也不重试
+        "condition_on_previous_text": False,
+    },
+    "balanced": {
+        "beam_size": 3,
+        "best_of": 3,
+        "temperature": [0.0, 0.4, 0.8],
+    },
+    "accurate": {
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+    },
+}
+PROFILE_ORDER = list(DECODING_PROFILES)
+
+
+class LatencyTuner:
+    """
+    根据最近几次识别的实测耗时在档位之间切换
+
+    最近 window 次识别的平均耗时超过 latency_target 时降一档；低于
+    latency_target * step_up_ratio，且按上一档的实测 RTF 估算升档后仍能达标时升一档。
+    切换后清空统计，避免用旧档位的数据连续切换。
+    """
+
+    def __init__(self, latency_target: float = 2.0, initial_profile: str = "balanced",
+                 window: int = 5, step_up_ratio: float = 0.5):
+        """
+        初始化
+
+        Args:
+            latency_target: 单次识别耗时目标（秒）
+            initial_profile: 初始档位
+            window: 统计最近多少次识别
+            step_up_ratio: 耗时低于目标的该比例时考虑升档
+        """
+        if initial_profile not in DECODING_PROFILES:
+            raise ValueError(f"未知的解码档位: {initial_profile}")
+        self.latency_target = latency_target
+        self.window = window
+        self.step_up_ratio = step_up_ratio
+        self.profile = initial_profile
+        self._samples = deque(maxlen=window)  # (耗时, 音频时长)
+        self._rtf = {}  # 各档位最近一次的平均 RTF
+
+    @property
+    def rtf(self) -> Optional[float]:
+        """当前档位最近几次识别的平均实时率"""
+        if not self._samples:
+            return None
+        return sum(elapsed for elapsed, _ in self._samples) / max(sum(d for _, d in self._samples), 1e-6)
+
+    def options(self) -> dict:
+        """当前档位的解码参数"""
+        return dict(DECODING_PROFILES[self.profile])
+
+    def record(self, elapsed: float, duration: float) -> Optional[str]:
+        """
+        记录一次识别的耗时
+
+        Args:
+            elapsed: 解码耗时（秒）
+            duration: 音频时长（秒）
+
+        Returns:
+            发生切换时返回新档位，否则返回 None
+        """
+        if duration <= 0:
+            return None
+        self._samples.append((elapsed, duration))
+        if len(self._samples) < self.window:
+            return None
+
+        latency = sum(elapsed for elapsed, _ in self._samples) / len(self._samples)
+        self._rtf[self.profile] = self.rtf
+        index = PROFILE_ORDER.index(self.profile)
+
+        if latency > self.latency_target and index > 0:
+            return self._switch(PROFILE_ORDER[index - 1], latency)
+
+        if latency < self.latency_target * self.step_up_ratio and index < len(PROFILE_ORDER) - 1:
+            slower = PROFILE_ORDER[index + 1]
+            known_rtf = self._rtf.get(slower)
+            if known_rtf is not None:
+                mean_duration = sum(d for _, d in self._samples) / len(self._samples)
+                if known_rtf * mean_duration > self.latency_target:
+                    # 上一档在同样长度的音频上已经被证明会超时
+                    return None
+            return self._switch(slower, latency)
+        return None
+
+    def _switch(self, profile: str, latency: float) -> str:
+        logger.info(
+            f"解码档位自动切换: {self.profile} -> {profile}"
+            f"（最近平均耗时 {latency:.2f}s，目标 {self.latency_target:.2f}s，RTF {self.rtf:.3f}）"
+        )
+        self.profile = profile
+        self._samples.clear()
+        return profile
+
+
+# 中日韩文字（假名、汉字、谚文）
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+_LATIN_PATTERN = re.compile(r"[A-Za-z]")
+_CJK_LANGUAGES = {"zh", "yue", "ja", "ko"}
+
+
+def _script_mismatch(language: str, text: str) -> bool:
+    """文字与语言明显不符（中文里夹英文术语是正常的，只看完全对不上的情况）"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    latin = len(_LATIN_PATTERN.findall(text))
+    if language in _CJK_LANGUAGES:
+        return cjk == 0 and latin >= 8
+    return cjk >= 4 and cjk > latin
+
+
+class LanguageCache:
+    """
+    language: auto 时的语言检测缓存
+
+    检测出的语言置信度足够高时在本次会话中沿用：解码时直接指定语言，跳过检测。
+    以下情况下一次识别重新检测：已沿用 recheck_every 次；距上次使用超过 session_seconds；
+    沿用语言解码出的结果平均对数概率过低，或文字与语言不符（疑似换了语言）。
+    """
+
+    def __init__(self, min_probability: float = 0.8, recheck_every: int = 20,
+                 session_seconds: float = 600.0, suspect_logprob: float = -1.0):
+        """
+        初始化
+
+        Args:
+            min_probability: 检测概率不低于该值才沿用
+            recheck_every: 沿用多少次后重新检测一次
+            session_seconds: 超过该时长未使用视为新会话，重新检测（秒）
+            suspect_logprob: 沿用语言解码的平均对数概率低于该值时怀疑换了语言
+        """
+        self.min_probability = min_probability
+        self.recheck_every = recheck_every
+        self.session_seconds = session_seconds
+        self.suspect_logprob = suspect_logprob
+        self.language: Optional[str] = None
+        self.probability = 0.0
+        self.detections = 0
+        self.hits = 0
+        self.resets = 0
+        self._detect_time = 0.0
+        self._detect_samples = 0
+        self._uses = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def lookup(self) -> Optional[Tuple[str, float]]:
+        """
+        取沿用的语言
+
+        Returns:
+            (语言, 检测时的概率)；需要重新检测时返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.language is None:
+                return None
+            if now - self._last_used > self.session_seconds:
+                self._reset("会话超时")
+                return None
+            if self._uses >= self.recheck_every:
+                self._reset(f"已沿用 {self._uses} 次，定期复查")
+                return None
+            self._uses += 1
+            self._last_used = now
+            self.hits += 1
+            return self.language, self.probability
+
+    def record_detection(self, language: str, probability: float):
+        """
+        记录一次语言检测的结果
+
+        Args:
+            language: 检测出的语言
+            probability: 检测概率
+        """
+        with self._lock:
+            self.detections += 1
+            if probability < self.min_probability:
+                self.language = None
+                logger.info(f"语言检测: {language}（概率 {probability:.2f} 不足），下次重新检测")
+                return
+            if language != self.language:
+                logger.info(f"语言检测: {language}（概率 {probability:.2f}），后续识别沿用")
+            self.language, self.probability = language, probability
+            self._uses = 0
+            self._last_used = time.monotonic()
+
+    def record_detect_time(self, elapsed: float):
+        """
+        记录一次实测的检测耗时（秒）
+
+        只计解码器上的 detect_language：未沿用时检测在解码中完成，复用解码第一个窗口的
+        编码器输出，沿用语言省下的也只有这一步。
+        """
+        with self._lock:
+            self._detect_time += elapsed
+            self._detect_samples += 1
+
+    def check_result(self, language: str, text: str, avg_logprob: float) -> Optional[str]:
+        """
+        检查沿用语言解码出的结果，疑似换了语言时放弃沿用
+
+        Args:
+            language: 解码时指定的语言
+            text: 识别文本
+            avg_logprob: 按时长加权的平均对数概率
+
+        Returns:
+            放弃沿用的原因，结果正常时返回 None
+        """
+        if not text.strip():
+            return None
+        if avg_logprob < self.suspect_logprob:
+            reason = f"avg_logprob={avg_logprob:.2f}"
+        elif _script_mismatch(language, text):
+            reason = "文字与语言不符"
+        else:
+            return None
+        with self._lock:
+            if self.language == language:
+                self._reset(f"疑似换了语言（{reason}）")
+        return reason
+
+    def stats(self) -> dict:
+        """
+        命中统计
+
+        按实测的平均检测耗时（detect_ms）估算：detect_seconds 为未沿用时检测花的时间，
+        saved_seconds 为沿用省下的时间；还没有测过检测耗时时两者为 0。
+        """
+        with self._lock:
+            mean_detect = self._detect_time / self._detect_samples if self._detect_samples else 0.0
+            total = self.hits + self.detections
+            return {
+                "language": self.language,
+                "detections": self.detections,
+                "hits": self.hits,
+                "resets": self.resets,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "detect_ms": round(mean_detect * 1000, 2),
+                "detect_seconds": round(self.detections * mean_detect, 3),
+                "saved_seconds": round(self.hits * mean_detect, 3),
+            }
+
+    def _reset(self, reason: str):
+        logger.info(f"不再沿用语言 {self.language}: {reason}")
+        self.language = None
+        self.resets += 1
@@ -2,7 +2,10 @@
 输入处理模块 - 自动粘贴文本到当前应用
 """
 import logging
+import queue
+import threading
 import time
+from typing import Optional
 import pyperclip
 from pynput.keyboard import Controller, Key
 
@@ -37,16 +40,7 @@ class InputHandler:
             except:
                 pass
             
-            # 将文本复制到剪贴板
-            pyperclip.copy(text)
-
-            # 等待一小段时间确保复制完成
-            time.sleep(0.12)
-
-            # 模拟 Cmd+V 粘贴
-            with self.keyboard.pressed(Key.cmd):
-                self.keyboard.press('v')
-                self.keyboard.release('v')
+            self._paste_via_clipboard(text)
             logger.info("已触发 Cmd+V")
             
             logger.info("文本已粘贴（已发送粘贴按键）")
@@ -63,6 +57,18 @@ class InputHandler:
             logger.error(f"粘贴失败: {e}")
             raise
     
+    def _paste_via_clipboard(self, text: str):
+        """复制到剪贴板并发送 Cmd+V（不恢复剪贴板）"""
+        pyperclip.copy(text)
+        
+        # 等待一小段时间确保复制完成
+        time.sleep(0.12)
+        
+        # 模拟 Cmd+V 粘贴
+        with self.keyboard.pressed(Key.cmd):
+            self.keyboard.press('v')
+            self.keyboard.release('v')
+    
     def type_text(self, text: str, interval: float = 0.01):
         """
         逐字符输入文本（较慢但更可靠）
@@ -106,6 +112,91 @@ class InputHandler:
             logger.error(f"清除失败: {e}")
 
 
+class IncrementalPaster:
+    """
+    增量粘贴：边收到文本边粘贴
+    
+    文本在后台线程中合并后粘贴：遇到句读符号，或距上次粘贴超过 min_interval 才粘贴一次，
+    避免每个 token 都触发一次剪贴板往返。剪贴板只在开始时保存、结束时恢复一次。
+    """
+    
+    _BOUNDARIES = set("。！？；，、,.!?;:：\n")
+    
+    def __init__(self, handler: InputHandler, min_interval: float = 0.3, initial_delay: float = 0.6):
+        """
+        初始化并启动粘贴线程
+        
+        Args:
+            handler: 输入处理器
+            min_interval: 两次粘贴的最小间隔（秒），句读处不受限制
+            initial_delay: 第一次粘贴前的等待（秒），等快捷键释放、焦点回到输入框
+        """
+        self.handler = handler
+        self.min_interval = min_interval
+        self.initial_delay = initial_delay
+        self.pasted = []
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="incremental-paste")
+        self._thread.start()
+    
+    def feed(self, delta: str):
+        """追加一段文本（立即返回）"""
+        if delta:
+            self._queue.put(delta)
+    
+    def close(self) -> str:
+        """粘贴剩余文本、恢复剪贴板，返回粘贴的全部文本"""
+        self._queue.put(None)
+        self._thread.join()
+        return "".join(self.pasted)
+    
+    def _run(self):
+        time.sleep(self.initial_delay)
+        original_clipboard = ""
+        try:
+            original_clipboard = pyperclip.paste()
+        except Exception:
+            pass
+        
+        buffer = ""
+        last_paste = 0.0
+        while True:
+            delta = self._queue.get()
+            if delta is None:
+                break
+            buffer += delta
+            # 队列里已经积压的增量一起合并
+            while not self._queue.empty():
+                delta = self._queue.get()
+                if delta is None:
+                    self._queue.put(None)
+                    break
+                buffer += delta
+            if buffer[-1] in self._BOUNDARIES or time.monotonic() - last_paste >= self.min_interval:
+                self._paste(buffer)
+                buffer = ""
+                last_paste = time.monotonic()
+        
+        if buffer:
+            self._paste(buffer)
+        if self.pasted:
+            # 等最后一次粘贴完成后再恢复剪贴板
+            time.sleep(1.0)
+        try:
+            pyperclip.copy(original_clipboard)
+        except Exception:
+            pass
+    
+    def _paste(self, text: str):
+        try:
+            self.handler._paste_via_clipboard(text)
+            self.pasted.append(text)
+            # 给目标应用读取剪贴板的时间，再放入下一段
+            time.sleep(0.05)
+        except Exception as e:
+            logger.error(f"增量粘贴失败: {e}")
+
+
 if __name__ == "__main__":
     # 测试代码
     logging.basicConfig(level=logging.INFO)
@@ -1,10 +1,18 @@
 """
 LLM 模块 - 支持 OpenRouter 和 Ollama API 进行文本润色
 """
+import difflib
 import os
+import json
 import logging
+import re
+import threading
+import time
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import Callable, Iterator, Optional
+
+from polish_cache import PolishCache, polish_key
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +24,8 @@ class LLMProcessor:
                  model: str = "anthropic/claude-3.5-sonnet",
                  ollama_base_url: str = "http://localhost:11434",
                  system_prompt: Optional[str] = None, max_tokens: int = 1000,
-                 temperature: float = 0.3, timeout: int = 30):
+                 temperature: float = 0.3, timeout: int = 30, pool_size: int = 2,
+                 residency: Optional[dict] = None, cache: Optional[dict] = None):
         """
         初始化 LLM 处理器
         
@@ -29,6 +38,10 @@ class LLMProcessor:
             max_tokens: 最大 token 数
             temperature: 温度参数
             timeout: 请求超时时间（秒）
+            pool_size: 保持的长连接数（预热与润色请求同时进行时需要 2 个）
+            residency: Ollama 模型驻留管理配置（见 OllamaResidency），None 表示不管理
+            cache: 润色结果缓存配置 {enabled, path, memory_entries, max_entries, ttl_days}；
+                启用时相同的识别文本（规范化后）直接返回上次的润色结果
         """
         self.provider = provider.lower()
         self.api_key = api_key
@@ -38,6 +51,15 @@ class LLMProcessor:
         self.temperature = temperature
         self.timeout = timeout
         
+        # 所有请求共用一个会话：连接保持复用，省去每次润色的 TCP/TLS 握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._prewarm_thread = None
+        self._prewarm_lock = threading.Lock()
+        self.residency = None
+        
         self.system_prompt = system_prompt or """你是一个专业的语音文本润色助手。用户会给你语音识别后的原始文本，你需要：
 1. 去除语气词（嗯、啊、那个、就是等）
 2. 去除重复和口吃片段
@@ -50,15 +72,67 @@ class LLMProcessor:
         # 设置 API URL
         if self.provider == "openrouter":
             self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+            self._prewarm_url = "https://openrouter.ai/api/v1/models"
             if not self.api_key:
                 logger.warning("OpenRouter provider 需要 API Key")
         elif self.provider == "ollama":
             self.api_url = f"{self.ollama_base_url}/api/chat"
+            self._prewarm_url = f"{self.ollama_base_url}/"
+            if residency:
+                self.residency = OllamaResidency(
+                    self.session, self.ollama_base_url, model,
+                    keep_alive=residency.get('keep_alive', "30m"),
+                    warm_up=residency.get('warm_up', True),
+                    cold_strategy=residency.get('cold_strategy', "wait"),
+                    fallback_model=residency.get('fallback_model') or None,
+                    cold_wait=residency.get('cold_wait', 1.0)
+                )
         else:
             raise ValueError(f"不支持的 provider: {provider}")
         
+        cache = cache or {}
+        self.cache: Optional[PolishCache] = None
+        if cache.get("enabled", False):
+            self.cache = PolishCache(
+                cache.get("path", "~/.cache/typeless/polish.sqlite3"),
+                memory_entries=cache.get("memory_entries", 256),
+                max_entries=cache.get("max_entries", 5000),
+                ttl_days=cache.get("ttl_days", 30)
+            )
+        
         logger.info(f"初始化 LLM 处理器: provider={provider}, model={model}")
     
+    def prewarm(self):
+        """
+        在后台建立到 API 的连接（发一个 HEAD 请求），用户还在说话时完成握手，
+        润色请求到来时直接复用。已有预热在进行时忽略；连接本来就空闲在池中时只是刷新一下。
+        管理 Ollama 模型驻留时改为查询模型是否已加载，未加载则开始加载。
+        """
+        with self._prewarm_lock:
+            if self._prewarm_thread is not None and self._prewarm_thread.is_alive():
+                return
+            self._prewarm_thread = threading.Thread(target=self._prewarm, daemon=True, name="llm-prewarm")
+            self._prewarm_thread.start()
+    
+    def _prewarm(self):
+        if self.residency is not None:
+            self.residency.warm_up()
+            return
+        started_at = time.perf_counter()
+        try:
+            # 任何状态码都说明连接已建立；HEAD 没有响应体，连接立即回到池中
+            self.session.head(self._prewarm_url, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"预连接失败: {e}")
+            return
+        logger.debug(f"LLM 连接已预热（{time.perf_counter() - started_at:.3f}s）")
+    
+    def close(self):
+        """关闭连接池和润色缓存"""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+    
     def polish(self, raw_text: str) -> dict:
         """
         润色文本
@@ -78,18 +152,27 @@ class LLMProcessor:
                 "usage": {}
             }
         
+        cache_key, cached = self._cached(raw_text)
+        if cached is not None:
+            return cached
+        
         try:
             logger.info(f"开始润色文本（长度: {len(raw_text)}）")
             logger.debug(f"原始文本: {raw_text}")
             
+            model = self._choose_model()
+            if model is None:
+                return self._skipped(raw_text)
+            
             if self.provider == "openrouter":
                 result = self._polish_openrouter(raw_text)
             elif self.provider == "ollama":
-                result = self._polish_ollama(raw_text)
+                result = self._polish_ollama(raw_text, model)
             else:
                 raise ValueError(f"不支持的 provider: {self.provider}")
             
             logger.info(f"润色完成: {result['polished_text']}")
+            self._note_success(result, cache_key)
             return result
             
         except requests.exceptions.Timeout:
@@ -114,29 +197,267 @@ class LLMProcessor:
                 "error": str(e)
             }
     
-    def _polish_openrouter(self, raw_text: str) -> dict:
-        """使用 OpenRouter API 润色"""
-        headers = {
+    def polish_stream(self, raw_text: str, on_delta: Optional[Callable[[str], None]] = None,
+                      incremental: bool = False) -> dict:
+        """
+        流式润色：模型每生成一段文本就通过 on_delta 交给调用方，不等整个回复结束
+        
+        出错时与 polish 相同地回退为原文；如果还没有产出任何文本，原文会作为一个增量
+        交给 on_delta，调用方总能拿到完整的输出。中途断开时已产出的部分只有在已经
+        增量输出（incremental）、无法撤回时才保留，并把原文中还没润色到的部分接在后面。
+        
+        Args:
+            raw_text: 原始识别文本
+            on_delta: 收到文本增量时的回调（在调用线程中执行）
+            incremental: on_delta 收到的文本是否已直接输出给用户（如增量粘贴）
+            
+        Returns:
+            与 polish 相同的字典，另含 first_char_seconds（首字耗时）
+        """
+        if not raw_text or not raw_text.strip():
+            logger.warning("输入文本为空，跳过润色")
+            return {
+                "polished_text": "",
+                "original_text": raw_text,
+                "model": self.model,
+                "usage": {}
+            }
+        
+        started_at = time.perf_counter()
+        cache_key, cached = self._cached(raw_text)
+        if cached is not None:
+            cached["first_char_seconds"] = time.perf_counter() - started_at
+            if on_delta is not None:
+                on_delta(cached["polished_text"])
+            return cached
+        
+        logger.info(f"开始流式润色文本（长度: {len(raw_text)}）")
+        result = {}
+        parts = []
+        try:
+            model = self._choose_model()
+            if model is None:
+                if on_delta is not None:
+                    on_delta(raw_text)
+                return self._skipped(raw_text)
+            for delta in self.iter_polish(raw_text, result, model):
+                if not parts:
+                    result["first_char_seconds"] = time.perf_counter() - started_at
+                    logger.info(f"润色首字耗时 {result['first_char_seconds']:.3f}s")
+                parts.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+        except Exception as e:
+            if isinstance(e, requests.exceptions.Timeout):
+                logger.error(f"请求超时（{self.timeout}秒）")
+                error = "timeout"
+            else:
+                logger.error(f"流式润色失败: {e}")
+                error = str(e)
+            if parts and incremental:
+                partial = "".join(parts)
+                remainder = _raw_remainder(raw_text, partial)
+                logger.warning(
+                    f"润色中途中断，保留已输出的 {len(partial)} 个字符，补上原文剩余的 {len(remainder)} 个字符"
+                )
+                if remainder and on_delta is not None:
+                    on_delta(remainder)
+                return {
+                    "polished_text": partial + remainder,
+                    "original_text": raw_text,
+                    "error": error
+                }
+            if parts:
+                logger.warning("润色中途中断，丢弃已产出的部分，回退为原文")
+            elif on_delta is not None:
+                on_delta(raw_text)
+            return {
+                "polished_text": raw_text,
+                "original_text": raw_text,
+                "error": error
+            }
+        
+        result["polished_text"] = "".join(parts)
+        self._note_success(result, cache_key)
+        logger.info(
+            f"润色完成（首字 {result.get('first_char_seconds', 0):.3f}s，"
+            f"总耗时 {time.perf_counter() - started_at:.3f}s）: {result['polished_text']}"
+        )
+        return result
+    
+    def iter_polish(self, raw_text: str, result: Optional[dict] = None,
+                    model: Optional[str] = None) -> Iterator[str]:
+        """
+        逐段产出润色文本（OpenRouter 为 SSE，Ollama 为 NDJSON），首尾空白已去掉
+        
+        Args:
+            raw_text: 原始识别文本
+            result: 传入时在结束后填入 {original_text, model, provider, usage}
+            model: 本次使用的 Ollama 模型（默认 self.model）
+            
+        Raises:
+            requests.exceptions.RequestException: 请求失败或服务端在流中报错
+        """
+        result = {} if result is None else result
+        model = model or self.model
+        if self.provider == "openrouter":
+            model = self.model
+            deltas = self._stream_openrouter(raw_text, result)
+        elif self.provider == "ollama":
+            deltas = self._stream_ollama(raw_text, result, model)
+        else:
+            raise ValueError(f"不支持的 provider: {self.provider}")
+        result.update(original_text=raw_text, model=model, provider=self.provider)
+        yield from _strip_stream(deltas)
+    
+    def _choose_model(self) -> Optional[str]:
+        """本次润色使用的模型；Ollama 模型未加载且配置了回退策略时可能换成小模型，None 表示直接输出原文"""
+        if self.residency is None:
+            return self.model
+        return self.residency.choose_model()
+    
+    def _cached(self, raw_text: str) -> tuple:
+        """
+        查询润色缓存
+        
+        Returns:
+            (缓存键, 命中时的结果字典)；未启用缓存时键为 None
+        """
+        if self.cache is None:
+            return None, None
+        started_at = time.perf_counter()
+        cache_key = polish_key(raw_text, self.provider, self.model, self.system_prompt, self.temperature)
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return cache_key, None
+        logger.info(
+            f"命中润色缓存（{(time.perf_counter() - started_at) * 1e6:.0f}µs，"
+            f"命中率 {self.cache.hit_rate:.0%}）: {entry['polished_text']}"
+        )
+        return cache_key, {
+            "polished_text": entry["polished_text"],
+            "original_text": raw_text,
+            "model": entry["model"],
+            "provider": self.provider,
+            "usage": {},
+            "cached": True
+        }
+    
+    def _note_success(self, result: dict, cache_key: Optional[str] = None):
+        # 只缓存主模型的结果：回退小模型的结果不应冒充主模型的输出
+        if result.get("model") != self.model:
+            return
+        if cache_key is not None and result["polished_text"]:
+            self.cache.put(cache_key, result["polished_text"], result["model"])
+        # 用主模型润色成功说明模型已在内存中（wait 策略下请求本身完成了加载）
+        if self.residency is not None:
+            self.residency.mark_loaded()
+    
+    def _skipped(self, raw_text: str) -> dict:
+        logger.info("LLM 模型未加载，跳过润色，直接输出识别原文")
+        return {
+            "polished_text": raw_text,
+            "original_text": raw_text,
+            "model": None,
+            "usage": {},
+            "skipped": "model_cold"
+        }
+    
+    def _ollama_payload(self, raw_text: str, model: Optional[str], stream: bool) -> dict:
+        payload = {
+            "model": model or self.model,
+            "messages": self._messages(raw_text),
+            "think": False,
+            "stream": stream,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens
+            }
+        }
+        if self.residency is not None:
+            # 每个请求都带上 keep_alive，否则 Ollama 按默认的 5 分钟重新计时
+            payload["keep_alive"] = self.residency.keep_alive
+        return payload
+    
+    def _openrouter_headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://github.com/typeless-mac",
             "X-Title": "Typeless Mac"
         }
-        
+    
+    def _messages(self, raw_text: str) -> list:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": raw_text}
+        ]
+    
+    def _stream_openrouter(self, raw_text: str, result: dict) -> Iterator[str]:
+        """OpenRouter 流式接口（SSE）：每个 data: 行是一个 chunk，最后一个 chunk 带用量"""
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": raw_text}
-            ],
+            "messages": self._messages(raw_text),
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True,
+            "usage": {"include": True}
+        }
+        result["usage"] = {}
+        with self.session.post(self.api_url, json=payload, headers=self._openrouter_headers(),
+                               timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                # 空行分隔事件，冒号开头的是注释（OpenRouter 处理中会发送保活注释）
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    # 不提前 break：读完整个响应体，连接才能回到池中复用
+                    continue
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise requests.exceptions.RequestException(
+                        f"OpenRouter 流式响应出错: {chunk['error'].get('message', chunk['error'])}"
+                    )
+                if chunk.get("usage"):
+                    result["usage"] = chunk["usage"]
+                for choice in chunk.get("choices", []):
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+    
+    def _stream_ollama(self, raw_text: str, result: dict, model: Optional[str] = None) -> Iterator[str]:
+        """Ollama 流式接口（NDJSON）：每行一个 JSON，done 为 true 的最后一行带用量"""
+        payload = self._ollama_payload(raw_text, model, stream=True)
+        result["usage"] = {}
+        with self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True) as response:
+            self._check_ollama_response(response, payload["model"])
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise requests.exceptions.RequestException(f"Ollama 流式响应出错: {chunk['error']}")
+                content = (chunk.get("message") or {}).get("content")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    result["usage"] = _ollama_usage(chunk)
+    
+    def _polish_openrouter(self, raw_text: str) -> dict:
+        """使用 OpenRouter API 润色"""
+        payload = {
+            "model": self.model,
+            "messages": self._messages(raw_text),
             "max_tokens": self.max_tokens,
             "temperature": self.temperature
         }
         
-        response = requests.post(
+        response = self.session.post(
             self.api_url,
             json=payload,
-            headers=headers,
+            headers=self._openrouter_headers(),
             timeout=self.timeout
         )
         
@@ -154,28 +475,31 @@ class LLMProcessor:
             "usage": usage
         }
     
-    def _polish_ollama(self, raw_text: str) -> dict:
+    def _polish_ollama(self, raw_text: str, model: Optional[str] = None) -> dict:
         """使用 Ollama API 润色"""
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": raw_text}
-            ],
-            "think": False,
-            "stream": False,
-            "options": {
-                "temperature": self.temperature,
-                "num_predict": self.max_tokens
-            }
-        }
+        payload = self._ollama_payload(raw_text, model, stream=False)
         
-        response = requests.post(
+        response = self.session.post(
             self.api_url,
             json=payload,
             timeout=self.timeout
         )
-
+        self._check_ollama_response(response, payload["model"])
+        data = response.json()
+        
+        polished_text = data["message"]["content"].strip()
+        
+        return {
+            "polished_text": polished_text,
+            "original_text": raw_text,
+            "model": payload["model"],
+            "provider": "ollama",
+            "usage": _ollama_usage(data)
+        }
+    
+    def _check_ollama_response(self, response: requests.Response, model: Optional[str] = None):
+        """Ollama 返回错误状态码时抛出带说明的 HTTPError"""
+        model = model or self.model
         if response.status_code >= 400:
             error_detail = ""
             try:
@@ -185,7 +509,7 @@ class LLMProcessor:
 
             if response.status_code == 404 and "not found" in error_detail.lower():
                 raise requests.exceptions.HTTPError(
-                    f"Ollama 模型不存在: {self.model}。请先运行 `ollama pull {self.model}`，"
+                    f"Ollama 模型不存在: {model}。请先运行 `ollama pull {model}`，"
                     f"或改用已安装模型（`ollama list`）。",
                     response=response
                 )
@@ -194,22 +518,6 @@ class LLMProcessor:
                 f"Ollama API 返回 {response.status_code}: {error_detail or response.reason}",
                 response=response
             )
-
-        data = response.json()
-        
-        polished_text = data["message"]["content"].strip()
-        
-        return {
-            "polished_text": polished_text,
-            "original_text": raw_text,
-            "model": self.model,
-            "provider": "ollama",
-            "usage": {
-                "prompt_tokens": data.get("prompt_eval_count", 0),
-                "completion_tokens": data.get("eval_count", 0),
-                "total_tokens": data.get("prompt_eval_count", 0) + data.get("eval_count", 0)
-            }
-        }
     
     def test_connection(self) -> bool:
         """测试 API 连接"""
@@ -220,7 +528,393 @@ class LLMProcessor:
             return False
 
 
+class OllamaResidency:
+    """
+    Ollama 模型驻留管理
+    
+    Ollama 默认在模型空闲 5 分钟后把它卸出内存，之后第一次润色要先花几秒加载模型。
+    这里给每个请求带上 keep_alive 延长驻留时间；启动时和按下快捷键时通过 /api/ps 查询
+    模型是否已加载，未加载就在后台发送一个空的生成请求来加载。润色时沿用已知的状态：
+    最近一次加载或主模型请求成功后的 keep_alive 时长内、或 /api/ps 确认已加载后的
+    state_ttl 秒内不再查询，其余情况（未加载、状态过期）才重新查询。模型仍未加载时按
+    cold_strategy 处理：wait 照常请求（等待加载），fallback_model 改用已加载的小模型，
+    raw 直接输出识别原文（后台加载完成后恢复正常润色）。
+    """
+    
+    def __init__(self, session: requests.Session, base_url: str, model: str,
+                 keep_alive="30m", warm_up: bool = True, cold_strategy: str = "wait",
+                 fallback_model: Optional[str] = None, cold_wait: float = 1.0,
+                 load_timeout: float = 120.0, state_ttl: float = 60.0):
+        """
+        初始化
+        
+        Args:
+            session: LLMProcessor 的 HTTP 会话（共用连接池）
+            base_url: Ollama API 地址
+            model: 润色模型
+            keep_alive: 模型在内存中保留的时长（如 "30m"、秒数，-1 表示一直驻留）
+            warm_up: 预热时是否加载模型（False 时只查询状态）
+            cold_strategy: 模型未加载时的策略（wait / fallback_model / raw）
+            fallback_model: cold_strategy 为 fallback_model 时改用的模型（须已加载，否则输出原文）
+            cold_wait: 后台加载正在进行时，润色最多等待多久（秒）
+            load_timeout: 加载模型请求的超时时间（秒）
+            state_ttl: /api/ps 查到已加载后，多少秒内润色不再查询（别的客户端可能用更短的
+                keep_alive 请求过这个模型，查到的状态不能按 keep_alive 信任）
+        """
+        if cold_strategy not in ("wait", "fallback_model", "raw"):
+            raise ValueError(f"不支持的 cold_strategy: {cold_strategy}")
+        if fallback_model and _same_model(fallback_model, model):
+            logger.warning(f"fallback_model 与润色模型相同（{model}），不使用回退模型")
+            fallback_model = None
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.keep_alive = keep_alive
+        self.warm_up_enabled = warm_up
+        self.cold_strategy = cold_strategy
+        self.fallback_model = fallback_model
+        self.cold_wait = cold_wait
+        self.load_timeout = load_timeout
+        self.state_ttl = state_ttl
+        self.state = "unknown"  # unknown / cold / loading / loaded / unavailable
+        self.state_queries = 0
+        self._trusted_until = 0.0  # 在此之前（time.monotonic）loaded 状态无需重新查询
+        self.loads = 0
+        self.last_load_seconds = None
+        self.cold_polishes = 0
+        self.fallback_polishes = 0
+        self.raw_polishes = 0
+        self._load_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def loaded_models(self) -> Optional[list]:
+        """
+        查询 /api/ps
+        
+        Returns:
+            已加载的模型名列表；Ollama 不可用时返回 None
+        """
+        self.state_queries += 1
+        try:
+            response = self.session.get(f"{self.base_url}/api/ps", timeout=2.0)
+            response.raise_for_status()
+            return [entry.get("name") or entry.get("model") for entry in response.json().get("models", [])]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"查询 Ollama 已加载模型失败: {e}")
+            return None
+    
+    def refresh(self, loaded: Optional[list] = None) -> str:
+        """根据 /api/ps 更新并返回驻留状态"""
+        if loaded is None:
+            loaded = self.loaded_models()
+        with self._lock:
+            if loaded is None:
+                self.state = "unavailable"
+            elif any(_same_model(name, self.model) for name in loaded):
+                self.state = "loaded"
+                self._trust(self.state_ttl)
+            elif self._load_thread is not None and self._load_thread.is_alive():
+                self.state = "loading"
+            else:
+                self.state = "cold"
+            return self.state
+    
+    def warm_up(self):
+        """查询模型状态，未加载时在后台加载（立即返回）"""
+        state = self.refresh()
+        if state == "cold" and self.warm_up_enabled:
+            self._start_load()
+    
+    def choose_model(self) -> Optional[str]:
+        """
+        决定本次润色使用的模型
+        
+        Returns:
+            模型名；None 表示跳过润色直接输出原文
+        """
+        with self._lock:
+            if self.state == "loaded" and time.monotonic() < self._trusted_until:
+                return self.model
+        loaded = self.loaded_models()
+        state = self.refresh(loaded)
+        if state in ("loaded", "unavailable"):
+            # Ollama 不可用时照常请求，由润色的错误处理回退为原文
+            return self.model
+        
+        load_thread = self._load_thread
+        if state == "loading" and self.cold_wait > 0:
+            load_thread.join(self.cold_wait)
+            loaded = self.loaded_models()
+            if self.refresh(loaded) == "loaded":
+                return self.model
+        
+        self.cold_polishes += 1
+        if self.cold_strategy == "wait":
+            logger.info(f"Ollama 模型 {self.model} 未加载，本次润色需等待模型加载")
+            return self.model
+        # 小模型或原文先顶上，同时在后台加载，下一次润色恢复正常
+        self._start_load()
+        if self.cold_strategy == "fallback_model" and self.fallback_model \
+                and any(_same_model(name, self.fallback_model) for name in loaded or []):
+            self.fallback_polishes += 1
+            logger.info(f"Ollama 模型 {self.model} 未加载，本次改用 {self.fallback_model}")
+            return self.fallback_model
+        self.raw_polishes += 1
+        return None
+    
+    def mark_loaded(self):
+        """用主模型的请求成功后调用（请求带的 keep_alive 重新计算了驻留时间）"""
+        with self._lock:
+            self.state = "loaded"
+            self._trust(_keep_alive_seconds(self.keep_alive))
+    
+    def stats(self) -> dict:
+        """驻留统计"""
+        return {
+            "model": self.model,
+            "state": self.state,
+            "loads": self.loads,
+            "last_load_seconds": self.last_load_seconds,
+            "cold_polishes": self.cold_polishes,
+            "fallback_polishes": self.fallback_polishes,
+            "raw_polishes": self.raw_polishes,
+            "state_queries": self.state_queries,
+        }
+    
+    def _start_load(self):
+        with self._lock:
+            if self._load_thread is not None and self._load_thread.is_alive():
+                return
+            self.state = "loading"
+            self._load_thread = threading.Thread(target=self._load, daemon=True, name="ollama-load")
+            self._load_thread.start()
+    
+    def _load(self):
+        logger.info(f"Ollama 模型 {self.model} 未加载，开始后台加载")
+        started_at = time.perf_counter()
+        try:
+            # 不带 prompt 的生成请求只加载模型
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": self.keep_alive},
+                timeout=self.load_timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Ollama 模型加载失败: {e}")
+            with self._lock:
+                self.state = "cold"
+            return
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            self.state = "loaded"
+            self._trust(_keep_alive_seconds(self.keep_alive))
+            self.loads += 1
+            self.last_load_seconds = round(elapsed, 2)
+        logger.info(f"Ollama 模型 {self.model} 已加载，耗时 {elapsed:.2f}s")
+    
+    def _trust(self, seconds: Optional[float]):
+        # 调用方持有锁；None 表示一直驻留
+        self._trusted_until = float("inf") if seconds is None else time.monotonic() + seconds
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _keep_alive_seconds(keep_alive) -> Optional[float]:
+    """
+    把 keep_alive（秒数或 "30m"、"1h30m" 这样的时长）换算成秒
+    
+    Returns:
+        秒数；负数（一直驻留）时返回 None，无法解析时返回 0（每次都重新查询）
+    """
+    if isinstance(keep_alive, (int, float)):
+        return None if keep_alive < 0 else float(keep_alive)
+    text = str(keep_alive).strip()
+    if text.startswith("-"):
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts or "".join(value + unit for value, unit in parts) != text:
+        return 0.0
+    return sum(float(value) * _DURATION_UNITS[unit] for value, unit in parts)
+
+
+def _same_model(name: Optional[str], model: str) -> bool:
+    """Ollama 的模型名省略标签时即 :latest"""
+    if not name:
+        return False
+    return name == model or name == f"{model}:latest" or f"{name}:latest" == model
+
+
+def _ollama_usage(data: dict) -> dict:
+    """把 Ollama 的计数换成与 OpenRouter 相同的用量格式"""
+    return {
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "completion_tokens": data.get("eval_count", 0),
+        "total_tokens": data.get("prompt_eval_count", 0) + data.get("eval_count", 0)
+    }
+
+
+def _raw_remainder(raw_text: str, partial: str) -> str:
+    """
+    流式润色中断时原文中还没润色到的部分：取与已输出文本最后一处相同的片段，返回原文中其后的内容。
+    
+    润色会删掉语气词、改写标点，已输出文本与原文前缀长度不一定相同，所以按字符对齐而不是按长度截取；
+    单个字符的相同（多是补上的标点）可能对到原文后面去，只用至少两个字符的片段对齐。
+    """
+    blocks = [block for block in difflib.SequenceMatcher(None, raw_text, partial, autojunk=False)
+              .get_matching_blocks() if block.size >= 2]
+    if not blocks:
+        return raw_text[len(partial):]
+    last = blocks[-1]
+    return raw_text[last.a + last.size:]
+
+
+def _strip_stream(deltas: Iterator[str]) -> Iterator[str]:
+    """去掉流式文本的首尾空白：开头的空白丢弃，结尾的空白等到后面还有内容时才产出"""
+    started = False
+    pending = ""
+    for delta in deltas:
+        if not started:
+            delta = delta.lstrip()
+            if not delta:
+                continue
+            started = True
+        text = pending + delta
+        stripped = text.rstrip()
+        pending = text[len(stripped):]
+        if stripped:
+            yield stripped
+
+
+def _benchmark_transport(count: int = 50, rtt_ms: float = 20.0, tls: bool = False):
+    """
+    用本地 HTTP 服务模拟 Ollama 接口，对比每次新建连接、长连接池、按下快捷键时预连接三种情况的润色延迟。
+    
+    本机回环上握手几乎没有开销，所以服务端用 rtt_ms 模拟网络往返：新连接先等握手
+    （TCP 1 个往返，--tls 时再加 1 个 TLS 1.3 往返），之后每个请求 1 个往返。
+    """
+    import shutil
+    import ssl
+    import subprocess
+    import tempfile
+    import urllib3
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    rtt = rtt_ms / 1000
+    body = json.dumps({
+        "message": {"content": "我明天想去公园散步。"}, "done": True,
+        "prompt_eval_count": 60, "eval_count": 10
+    }, ensure_ascii=False).encode("utf-8")
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 保持连接
+        disable_nagle_algorithm = True  # 响应头和响应体分两次写出，避免与延迟 ACK 叠加出 40ms 停顿
+        
+        def setup(self):
+            time.sleep(rtt * (2 if tls else 1))
+            super().setup()
+        
+        def do_HEAD(self):
+            time.sleep(rtt)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(rtt)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if tls:
+        if not shutil.which("openssl"):
+            raise RuntimeError("--tls 需要 openssl 命令生成自签名证书")
+        cert_dir = tempfile.mkdtemp(prefix="typeless_llm_bench_")
+        cert, key = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+            check=True, capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    llm = LLMProcessor(provider="ollama", model="stand-in",
+                       ollama_base_url=f"{scheme}://127.0.0.1:{server.server_address[1]}")
+    llm.session.verify = False
+    llm.session.trust_env = False  # 不让环境变量中的 CA 证书、代理设置覆盖上面的设置
+    text = "嗯，那个，我明天想要去，去公园散步"
+    
+    def measure(before_each) -> list:
+        latencies = []
+        for _ in range(count):
+            before_each()
+            started_at = time.perf_counter()
+            result = llm.polish(text)
+            latencies.append(time.perf_counter() - started_at)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+        return latencies
+    
+    def prewarmed():
+        # 按下快捷键时连接池是空的（例如服务端已关闭空闲连接），预连接在说话期间完成
+        llm.session.close()
+        llm.prewarm()
+        llm._prewarm_thread.join()
+    
+    llm.polish(text)
+    results = {
+        "每次新建连接": measure(llm.session.close),
+        "长连接池": measure(lambda: None),
+        "快捷键预连接": measure(prewarmed),
+    }
+    server.shutdown()
+    llm.close()
+    
+    print(f"本地模拟服务: {scheme}，模拟往返 {rtt_ms:.0f}ms，每种 {count} 次请求")
+    print(f"{'':<12} {'平均':>8} {'p50':>8} {'p95':>8}")
+    for name, latencies in results.items():
+        latencies = sorted(latencies)
+        mean = sum(latencies) / len(latencies)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        print(f"{name:<12} {mean * 1000:>6.1f}ms {p50 * 1000:>6.1f}ms {p95 * 1000:>6.1f}ms")
+
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="LLM 润色测试")
+    parser.add_argument("--benchmark", action="store_true", help="用本地模拟服务对比新建连接与长连接池的延迟")
+    parser.add_argument("--requests", type=int, default=50, help="基准测试每种情况的请求数")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="基准测试模拟的网络往返时间（毫秒）")
+    parser.add_argument("--tls", action="store_true", help="基准测试使用 HTTPS（自签名证书，需要 openssl）")
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        logging.basicConfig(level=logging.WARNING)
+        _benchmark_transport(args.requests, args.rtt_ms, args.tls)
+        raise SystemExit(0)
+    
     # 测试代码
     logging.basicConfig(level=logging.INFO)
     
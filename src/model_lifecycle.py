@@ -0,0 +1,155 @@
+"""
+模型生命周期模块 - 空闲或超出内存预算时卸载 Whisper 模型，需要时提前重新加载并预热
+"""
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    当前进程的常驻内存（MB）
+
+    Returns:
+        无法获取时返回 None
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+        # macOS 没有 /proc，resource.getrusage 只能拿到峰值，这里用 ps 读取当前值
+        output = subprocess.run(
+            ["ps", "-o", "rss=", "-p", str(os.getpid())],
+            capture_output=True, text=True, timeout=2
+        ).stdout
+        return int(output.strip()) / 1024
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+class ModelLifecycleManager:
+    """
+    ASR 模型生命周期管理
+
+    后台线程定期检查：模型空闲超过 idle_timeout，或进程常驻内存超过 memory_budget_mb
+    （且最近 grace_seconds 内没有使用）时卸载模型。prewarm() 在后台重新加载并预热，
+    供按下快捷键时调用，录音结束前模型通常已经就绪。
+    """
+
+    def __init__(self, engine, idle_timeout: float = 0, memory_budget_mb: float = 0,
+                 check_interval: float = 30.0, grace_seconds: float = 10.0):
+        """
+        初始化
+
+        Args:
+            engine: ASREngine
+            idle_timeout: 空闲多少秒后卸载（0 表示不按空闲卸载）
+            memory_budget_mb: 进程常驻内存预算（MB，0 表示不限制）
+            check_interval: 检查间隔（秒）
+            grace_seconds: 按内存预算卸载时，要求模型至少已空闲的时长（秒）
+        """
+        self.engine = engine
+        self.idle_timeout = idle_timeout
+        self.memory_budget_mb = memory_budget_mb
+        if idle_timeout > 0:
+            check_interval = min(check_interval, max(idle_timeout / 2, 1.0))
+        self.check_interval = check_interval
+        self.grace_seconds = grace_seconds
+        self.unload_count = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._prewarm_thread: Optional[threading.Thread] = None
+        self._prewarm_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_timeout > 0 or self.memory_budget_mb > 0
+
+    def start(self):
+        """启动后台检查线程（未配置卸载条件时不启动）"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="asr-lifecycle")
+        self._thread.start()
+        logger.info(
+            f"模型生命周期管理已启动: 空闲卸载 {self.idle_timeout:.0f}s，"
+            f"内存预算 {self.memory_budget_mb:.0f}MB"
+        )
+
+    def stop(self):
+        """停止后台检查线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def prewarm(self):
+        """
+        模型未加载时在后台加载并预热（立即返回）
+
+        在按下快捷键开始录音时调用：加载与录音并行，停止录音时通常已经就绪。
+        """
+        self.engine.last_used = time.monotonic()
+        if self.engine.is_loaded:
+            return
+        with self._prewarm_lock:
+            if self._prewarm_thread is not None and self._prewarm_thread.is_alive():
+                return
+            logger.info("模型未加载，开始后台预加载")
+            self._prewarm_thread = threading.Thread(
+                target=self._load, daemon=True, name="asr-prewarm"
+            )
+            self._prewarm_thread.start()
+
+    def check(self) -> Optional[str]:
+        """
+        检查一次卸载条件，需要时卸载模型
+
+        Returns:
+            卸载原因，未卸载时返回 None
+        """
+        engine = self.engine
+        small = engine.small_engine
+        if not engine.is_loaded and (small is None or not small.is_loaded):
+            return None
+        if self._prewarm_thread is not None and self._prewarm_thread.is_alive():
+            return None
+
+        idle = time.monotonic() - engine.last_used
+        reason = None
+        if self.idle_timeout > 0 and idle >= self.idle_timeout:
+            reason = f"空闲 {idle:.0f}s"
+        elif self.memory_budget_mb > 0 and idle >= self.grace_seconds:
+            rss = current_rss_mb()
+            if rss is not None and rss > self.memory_budget_mb:
+                reason = f"常驻内存 {rss:.0f}MB 超过预算 {self.memory_budget_mb:.0f}MB"
+
+        if reason and engine.unload_model():
+            self.unload_count += 1
+            rss = current_rss_mb()
+            logger.info(f"卸载 ASR 模型（{reason}），当前常驻内存 {rss or 0:.0f}MB")
+            return reason
+        return None
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"模型生命周期检查失败: {e}")
+
+    def _load(self):
+        started_at = time.perf_counter()
+        try:
+            self.engine.load_model()
+            logger.info(f"模型预加载完成，耗时 {time.perf_counter() - started_at:.2f}s")
+        except Exception as e:
+            logger.warning(f"模型预加载失败，将在识别时重试: {e}")
@@ -0,0 +1,260 @@
+"""
+润色结果缓存模块 - 常说的短句（"好的，收到"、"稍后回复你"）不必每次都请求 LLM
+
+两级缓存：内存 LRU 命中只是一次字典查找（微秒级），未命中再查磁盘上的 SQLite，
+命中后提升到内存。键由规范化后的识别文本和 provider、模型、系统提示词哈希、温度组成，
+换模型或改提示词后旧结果自然失效。条目超过 ttl_days 未使用即过期，总条数超过上限时
+淘汰最久未使用的条目。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化识别文本：全角/半角统一（NFKC）、忽略大小写、合并空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def polish_key(text: str, provider: str, model: str, system_prompt: str, temperature: float) -> str:
+    """
+    计算缓存键
+
+    Args:
+        text: 原始识别文本
+        provider: LLM 后端
+        model: 模型名称
+        system_prompt: 系统提示词（只取哈希）
+        temperature: 温度参数
+
+    Returns:
+        32 位十六进制字符串
+    """
+    prompt_hash = hashlib.blake2b(system_prompt.encode("utf-8"), digest_size=16).hexdigest()
+    payload = json.dumps({
+        "version": CACHE_VERSION,
+        "text": normalize_text(text),
+        "provider": provider,
+        "model": model,
+        "prompt": prompt_hash,
+        "temperature": temperature,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PolishCache:
+    """润色结果两级缓存（线程安全）"""
+
+    def __init__(self, path: str = "~/.cache/typeless/polish.sqlite3", memory_entries: int = 256,
+                 max_entries: int = 5000, ttl_days: float = 30.0):
+        """
+        初始化
+
+        Args:
+            path: SQLite 数据库路径
+            memory_entries: 内存 LRU 的条数
+            max_entries: 磁盘上最多保存的条数
+            ttl_days: 条目多少天未使用后过期（0 表示不过期）
+        """
+        self.path = os.path.expanduser(path)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 86400
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # 键 -> (润色结果, 模型, 最近使用时间)
+        self._touched = {}  # 内存命中后尚未写回磁盘的最近使用时间
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS polish ("
+            "key TEXT PRIMARY KEY, polished TEXT NOT NULL, model TEXT, "
+            "created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS polish_used ON polish (used)")
+        with self._lock:
+            self._expire()
+            entries = self._count()
+        logger.info(f"润色缓存: {entries} 条（{self.path}）")
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        查询缓存
+
+        Returns:
+            {polished_text, model}；未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self.ttl and now - entry[2] > self.ttl:
+                    self._memory.pop(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self._memory[key] = (entry[0], entry[1], now)
+                    self._touched[key] = now
+                    self.memory_hits += 1
+                    return {"polished_text": entry[0], "model": entry[1]}
+
+            row = self._db.execute(
+                "SELECT polished, model, used FROM polish WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[2] > self.ttl):
+                if row is not None:
+                    self._db.execute("DELETE FROM polish WHERE key = ?", (key,))
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE polish SET used = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1], now)
+            self.disk_hits += 1
+            return {"polished_text": row[0], "model": row[1]}
+
+    def put(self, key: str, polished_text: str, model: Optional[str] = None):
+        """
+        保存一条润色结果，超出上限时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键（polish_key）
+            polished_text: 润色结果
+            model: 产生结果的模型
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO polish (key, polished, model, created, used) VALUES (?, ?, ?, ?, ?)",
+                    (key, polished_text, model, now, now)
+                )
+                self._flush_touched()
+                self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"写入润色缓存失败: {e}")
+            self._remember(key, polished_text, model, now)
+            self.stores += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率（不查询数据库，可在命中路径上调用）"""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        """命中统计"""
+        with self._lock:
+            return {
+                "entries": self._count(),
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hit_rate, 3),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def close(self):
+        """写回内存命中的使用时间并关闭数据库"""
+        with self._lock:
+            try:
+                self._flush_touched()
+            except sqlite3.Error as e:
+                logger.warning(f"写回润色缓存失败: {e}")
+            self._db.close()
+
+    def _remember(self, key: str, polished_text: str, model: Optional[str], used: float):
+        # 调用方持有锁
+        self._memory[key] = (polished_text, model, used)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            self._touched.pop(evicted, None)
+
+    def _flush_touched(self):
+        # 内存命中不写磁盘（保持微秒级），磁盘上的使用时间在下次写入或关闭时批量更新，
+        # 否则常用条目会因为磁盘上的时间陈旧而被先淘汰
+        if self._touched:
+            self._db.executemany(
+                "UPDATE polish SET used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        excess = self._count() - self.max_entries
+        if excess <= 0:
+            return
+        victims = [row[0] for row in self._db.execute(
+            "SELECT key FROM polish ORDER BY used LIMIT ?", (excess,)
+        )]
+        self._db.executemany("DELETE FROM polish WHERE key = ?", [(key,) for key in victims])
+        for key in victims:
+            self._memory.pop(key, None)
+        self.evictions += len(victims)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cursor = self._db.execute("DELETE FROM polish WHERE used < ?", (time.time() - self.ttl,))
+        self.expirations += cursor.rowcount
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM polish").fetchone()[0]
+
+
+if __name__ == "__main__":
+    # 测量两级命中的耗时
+    import tempfile
+
+    logging.basicConfig(level=logging.WARNING)
+    cache = PolishCache(os.path.join(tempfile.mkdtemp(prefix="typeless_polish_"), "polish.sqlite3"),
+                        memory_entries=128, max_entries=1000)
+    phrases = [f"好的，收到，第 {i} 条" for i in range(500)]
+    keys = [polish_key(text, "ollama", "qwen3:0.6b", "提示词", 0.3) for text in phrases]
+    for key, text in zip(keys, phrases):
+        cache.put(key, text.replace("，", "。"), "qwen3:0.6b")
+
+    rounds = 20000
+    started_at = time.perf_counter()
+    for i in range(rounds):
+        polish_key(phrases[-1], "ollama", "qwen3:0.6b", "提示词", 0.3)
+    key_us = (time.perf_counter() - started_at) / rounds * 1e6
+
+    started_at = time.perf_counter()
+    for i in range(rounds):
+        cache.get(keys[-1 - i % 64])
+    memory_us = (time.perf_counter() - started_at) / rounds * 1e6
+
+    disk_keys = keys[:300]  # 已被挤出内存 LRU
+    started_at = time.perf_counter()
+    for key in disk_keys:
+        cache.get(key)
+        cache._memory.pop(key)
+    disk_us = (time.perf_counter() - started_at) / len(disk_keys) * 1e6
+
+    print(f"计算缓存键: {key_us:.1f}µs，内存命中: {memory_us:.1f}µs，SQLite 命中: {disk_us:.1f}µs")
+    print(cache.stats())
+    cache.close()
@@ -0,0 +1,275 @@
+"""
+本地预润色模块 - 在 ASR 和 LLM 之间做确定性的文本清理，干净的短句不再请求 LLM
+
+系统提示词要求的大部分工作（去语气词、去口吃重复、加标点）可以用规则在几十微秒内完成：
+- 语气词：独立成句（前后是句读）的 嗯、啊、那个、就是 等，以及句首粘连的 嗯、呃
+- 重复：句首的"我，我觉得"、"我今天，我今天想要"，连续三次以上的"我我我"（叠字词保留两个），英文的"I I"
+- 标点：按识别片段之间的停顿补逗号/句号，句末补句号（"吗"、"哪"结尾补问号）
+清理后给出 0~1 的评分，表示文本还需要 LLM 的程度（改口、疑似口吃、长句无标点等）。
+评分低于阈值时直接使用清理结果，跳过 LLM。
+
+用法:
+    python src/prepolish.py                     # 内置示例的跳过率和单次耗时
+    python src/prepolish.py --corpus lines.txt  # 统计自己的识别记录（每行一条）的跳过率
+"""
+import re
+from typing import List, NamedTuple, Optional
+
+_CJK = "一-鿿"
+_CLAUSE_PUNCT = "，。！？、；：,.!?;:"
+_SENTENCE_END = "。！？.!?"
+_BOUNDARY = rf"(?:^|(?<=[{_CLAUSE_PUNCT}\s]))"
+
+# 前后都是句读时才算语气词（"那个文件"、"就是这样"不受影响）；长的放前面，优先匹配
+DEFAULT_FILLERS = ("就是说", "那个", "这个", "就是", "嗯", "啊", "呃", "额", "唔", "哦", "哎")
+# 句首紧贴正文也可以直接去掉的语气词（"嗯我觉得"）；"啊"、"哦"常是实词开头，不在此列
+_LEADING_INTERJECTIONS = "嗯呃额唔"
+_LATIN_FILLERS = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|uhm+)\b[,，]?\s*", re.IGNORECASE)
+
+# 句首重复："我，我觉得"、"我今天，我今天想要"
+_SEPARATED_REPEAT = re.compile(rf"{_BOUNDARY}([{_CJK}]{{1,4}})(?:[，、,\s]+\1)+")
+# 同一单元连续出现三次以上："我我我想"、"我想我想我想"。单元取能整除这段重复的最短单元，
+# "谢谢谢谢"按单字"谢"处理；常见叠字词的字只收成两个（"谢谢"、"好好"、"对对"），笑声不动
+_REPEAT_RUN = re.compile(rf"([{_CJK}]{{1,2}}?)\1{{2,}}")
+_LAUGHTER = set("哈呵嘿嘻")
+_REDUPLICATED = set("谢好对是行嗯看想试走等慢快常天刚明渐人个家妈爸哥姐弟妹奶爷宝星")
+_LATIN_REPEAT = re.compile(r"\b([A-Za-z']+)(?:[\s,]+\1\b)+", re.IGNORECASE)
+_LATIN_KEEP_REPEATS = {"that", "had"}
+
+# 清理后的收尾：多余的逗号、句读前的空白、开头的句读
+_COMMA_RUN = re.compile(r"[，、,]\s*(?=[，、,。！？.!?])|(?<=[。！？.!?])\s*[，、,]")
+_REPEATED_PUNCT = re.compile(r"([，、。！？；：])\1+")
+_SPACE_BEFORE_PUNCT = re.compile(rf"\s+(?=[{_CLAUSE_PUNCT}])")
+_LEADING_PUNCT = re.compile(rf"^[{_CLAUSE_PUNCT}\s]+")
+_MULTI_SPACE = re.compile(r"[ \t]{2,}")
+
+# 需要 LLM 理解语义才能处理的情况
+_CORRECTION = re.compile(
+    r"不对|不是不是|我是说|我的意思是|我想说的是|应该是|重新说|说错了|改成|算了"
+    r"|\b(?:i mean|no wait|sorry|scratch that|actually)\b",
+    re.IGNORECASE
+)
+# 前一句的结尾和后一句的开头相同："想要去，去公园"（也可能是"喜欢你，你喜欢我"，交给 LLM 判断）
+_ECHO = re.compile(rf"([{_CJK}]{{1,3}})[，、,]\s*\1")
+_UNPUNCTUATED_RUN = re.compile(rf"[^{_CLAUSE_PUNCT}]{{25,}}")
+_QUESTION_ENDING = re.compile(r"(?:吗|么|哪|哪里|哪儿)$")
+
+
+class PrePolishResult(NamedTuple):
+    """预润色结果"""
+
+    text: str
+    score: float  # 0~1，越高越需要 LLM
+    needs_llm: bool
+    edits: int  # 删除的语气词和重复的次数
+
+
+class PrePolisher:
+    """规则预润色"""
+
+    def __init__(self, fillers: Optional[List[str]] = None, threshold: float = 0.35,
+                 sentence_gap: float = 0.8, long_text_chars: int = 60):
+        """
+        初始化
+
+        Args:
+            fillers: 语气词列表（默认 DEFAULT_FILLERS）
+            threshold: needs_llm 的评分阈值（0 表示总是交给 LLM）
+            sentence_gap: 片段间停顿超过多少秒补句号（否则补逗号）
+            long_text_chars: 达到这个长度的文本评分中长度一项取满分
+        """
+        fillers = sorted(fillers or DEFAULT_FILLERS, key=len, reverse=True)
+        alternation = "|".join(f"(?:{re.escape(word)})+" for word in fillers)
+        self._standalone_fillers = re.compile(
+            rf"{_BOUNDARY}(?:{alternation})(?:[，、,\s]+|(?=[{_SENTENCE_END}]|$))"
+        )
+        self._leading_interjections = re.compile(
+            rf"{_BOUNDARY}[{_LEADING_INTERJECTIONS}]+(?=[{_CJK}])"
+        )
+        self.threshold = threshold
+        self.sentence_gap = sentence_gap
+        self.long_text_chars = long_text_chars
+
+    def process(self, text: str, segments: Optional[list] = None) -> PrePolishResult:
+        """
+        清理识别文本并评分
+
+        Args:
+            text: 原始识别文本
+            segments: 识别片段 [{start, end, text}]（提供时按片段间停顿补标点）
+
+        Returns:
+            PrePolishResult
+        """
+        if segments:
+            punctuated = self.punctuate(segments)
+            if punctuated:
+                text = punctuated
+        cleaned, edits = self.clean(text)
+        cleaned = _terminate(cleaned)
+        score = self.score(text, cleaned, edits)
+        return PrePolishResult(cleaned, score, self.threshold <= 0 or score >= self.threshold, edits)
+
+    def clean(self, text: str) -> tuple:
+        """
+        去掉语气词和重复
+
+        Returns:
+            (清理后的文本, 修改次数)
+        """
+        text = text.strip()
+        edits = 0
+        for pattern, replacement in (
+            (self._standalone_fillers, ""),
+            (self._leading_interjections, ""),
+            (_LATIN_FILLERS, ""),
+            (_SEPARATED_REPEAT, r"\1"),
+        ):
+            text, count = pattern.subn(replacement, text)
+            edits += count
+        collapsed = _REPEAT_RUN.sub(_collapse_repeat, text)
+        if collapsed != text:
+            edits += 1
+            text = collapsed
+        text, count = _LATIN_REPEAT.subn(_collapse_latin, text)
+        edits += count
+
+        text = _COMMA_RUN.sub("", text)
+        text = _REPEATED_PUNCT.sub(r"\1", text)
+        text = _SPACE_BEFORE_PUNCT.sub("", text)
+        text = _LEADING_PUNCT.sub("", text)
+        text = _MULTI_SPACE.sub(" ", text)
+        return text.strip(), edits
+
+    def punctuate(self, segments: list) -> str:
+        """按片段边界拼接文本：片段末尾没有标点时，停顿长补句号，否则补逗号"""
+        text = ""
+        previous_end = None
+        for segment in segments:
+            part = segment["text"].strip()
+            if not part:
+                continue
+            if text:
+                if text[-1] not in _CLAUSE_PUNCT:
+                    gap = segment.get("start", 0.0) - previous_end if previous_end is not None else 0.0
+                    text += _sentence_mark(text) if gap >= self.sentence_gap else _comma(text)
+                if _is_latin(text[-1]) or _is_latin(part[0]) or text[-1] in ",.!?;:":
+                    text += " "
+            text += part
+            previous_end = segment.get("end")
+        return text
+
+    def score(self, raw: str, cleaned: str, edits: int = 0) -> float:
+        """
+        评估清理后的文本还需要 LLM 的程度
+
+        Returns:
+            0~1 的评分
+        """
+        if not cleaned:
+            return 0.0
+        score = 0.0
+        if _CORRECTION.search(cleaned):
+            # 改口只有理解语义才能处理
+            score += 0.6
+        if _ECHO.search(cleaned):
+            score += 0.4
+        if _UNPUNCTUATED_RUN.search(cleaned):
+            score += 0.3
+        # 删得越多说明口语越乱，规则没覆盖到的问题也越可能存在
+        removed = max(len(raw.strip()) - len(cleaned), 0) / max(len(raw.strip()), 1)
+        if removed > 0.3 or edits >= 4:
+            score += 0.2
+        score += min(len(cleaned) / self.long_text_chars, 1.0) * 0.3
+        return round(min(score, 1.0), 3)
+
+
+def _collapse_repeat(match: "re.Match") -> str:
+    unit = match.group(1)
+    if set(unit) & _LAUGHTER:
+        return match.group(0)
+    if len(unit) == 1 and unit in _REDUPLICATED:
+        return unit * 2
+    return unit
+
+
+def _collapse_latin(match: "re.Match") -> str:
+    if match.group(1).lower() in _LATIN_KEEP_REPEATS:
+        return match.group(0)
+    return match.group(1)
+
+
+def _is_latin(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _comma(text: str) -> str:
+    return "," if _is_latin(text[-1]) else "，"
+
+
+def _sentence_mark(text: str) -> str:
+    if _is_latin(text[-1]):
+        return "."
+    return "？" if _QUESTION_ENDING.search(text) else "。"
+
+
+def _terminate(text: str) -> str:
+    """句末没有标点时补上"""
+    if not text or text[-1] in _SENTENCE_END or text[-1] in "”\"')）":
+        return text
+    if text[-1] in "，、,；;：:":
+        text = text[:-1]
+        if not text:
+            return text
+    return text + _sentence_mark(text)
+
+
+# 基准测试的默认输入（规则的正确性由 tests/test_prepolish.py 校验）
+_SAMPLE_LINES = [
+    "好的，收到",
+    "稍后回复你",
+    "嗯，好的",
+    "那个，我晚点给你打电话",
+    "嗯，那个，明天开会吗",
+    "我我我想一下",
+    "谢谢谢谢",
+    "这个，这个方案不错",
+    "um, sounds good",
+    "我们周三，不对，周四下午开会",
+    "我明天想要去，去公园散步",
+    "嗯，那个，我今天，就是，我今天想要，不对，我想说的是我明天想要去，去公园散步",
+    "关于下个季度的预算我觉得我们需要重新评估一下各个部门的投入产出比然后再决定是否追加",
+]
+
+
+def _benchmark(polisher: PrePolisher, lines: List[str], rounds: int = 200):
+    """统计跳过率和单次耗时"""
+    import time
+
+    results = [polisher.process(line) for line in lines]
+    bypassed = sum(1 for result in results if not result.needs_llm)
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            polisher.process(line)
+    per_call = (time.perf_counter() - started_at) / (rounds * len(lines))
+    mean_chars = sum(len(line) for line in lines) / len(lines)
+    print(
+        f"{len(lines)} 条（平均 {mean_chars:.0f} 字），跳过 LLM {bypassed} 条（{bypassed / len(lines):.0%}），"
+        f"阈值 {polisher.threshold}，单次 {per_call * 1e6:.1f}µs"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地预润色：跳过率与耗时基准测试")
+    parser.add_argument("--corpus", help="识别文本文件（每行一条），默认使用内置示例")
+    parser.add_argument("--threshold", type=float, default=0.35, help="needs_llm 评分阈值")
+    args = parser.parse_args()
+
+    lines = _SAMPLE_LINES
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+    _benchmark(PrePolisher(threshold=args.threshold), lines)
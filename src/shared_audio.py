@@ -0,0 +1,112 @@
+"""
+共享音频模块 - 进程间传递音频数组，不经过序列化
+
+音频放进 multiprocessing.shared_memory，对方按名称映射同一块内存；已转存到磁盘的
+录音（完整的 np.memmap）直接传文件路径，由对方自己映射，连一次复制都不需要。
+"""
+import logging
+import os
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def share_audio(audio: np.ndarray) -> Tuple[Optional[SharedMemory], dict]:
+    """
+    把音频放到可跨进程访问的位置
+
+    Args:
+        audio: 音频数组
+
+    Returns:
+        (共享内存块, 描述符)。共享内存由调用方在对方用完后 release_audio(shm, unlink=True)；
+        音频是完整的磁盘映射时共享内存为 None
+    """
+    if is_whole_file_memmap(audio):
+        return None, {
+            "kind": "memmap",
+            "path": audio.filename,
+            "offset": int(audio.offset),
+            "shape": list(audio.shape),
+            "dtype": audio.dtype.str,
+        }
+
+    audio = np.ascontiguousarray(audio)
+    shm = SharedMemory(create=True, size=max(audio.nbytes, 1))
+    np.ndarray(audio.shape, dtype=audio.dtype, buffer=shm.buf)[...] = audio
+    return shm, {
+        "kind": "shm",
+        "name": shm.name,
+        "tracker": _tracker_id(),
+        "shape": list(audio.shape),
+        "dtype": audio.dtype.str,
+    }
+
+
+def open_shared_audio(descriptor: dict) -> Tuple[Optional[SharedMemory], np.ndarray]:
+    """
+    按描述符映射对方共享的音频（零拷贝）
+
+    Args:
+        descriptor: share_audio 返回的描述符
+
+    Returns:
+        (共享内存块, 音频数组)。用完后先丢弃数组，再 release_audio(shm)
+    """
+    shape = tuple(descriptor["shape"])
+    dtype = np.dtype(descriptor["dtype"])
+    if descriptor["kind"] == "memmap":
+        audio = np.memmap(descriptor["path"], dtype=dtype, mode="r",
+                          offset=descriptor["offset"], shape=shape)
+        return None, audio
+
+    try:
+        shm = SharedMemory(name=descriptor["name"], track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数：映射方不能登记，否则退出时会把对方的共享内存删掉。
+        # 与创建方共用同一个 resource tracker 时（同一进程，或 spawn 出的子进程）登记的
+        # 是创建方那一份，不能注销
+        shm = SharedMemory(name=descriptor["name"])
+        if descriptor.get("tracker") != _tracker_id():
+            resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def release_audio(shm: Optional[SharedMemory], unlink: bool = False):
+    """关闭（创建方同时删除）共享内存块"""
+    if shm is None:
+        return
+    try:
+        shm.close()
+    except BufferError:
+        logger.warning(f"共享内存仍被引用，稍后由系统回收: {shm.name}")
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def is_whole_file_memmap(audio: np.ndarray) -> bool:
+    """音频是否是覆盖整个文件数据区的 np.memmap（切片、部分数据返回 False）"""
+    # np.memmap 的切片保留原数组的 offset，只有覆盖到文件末尾的完整映射才能按路径传递
+    if not isinstance(audio, np.memmap) or not audio.filename or not audio.flags.c_contiguous:
+        return False
+    try:
+        return audio.offset + audio.nbytes == os.path.getsize(audio.filename)
+    except OSError:
+        return False
+
+
+def _tracker_id() -> Optional[int]:
+    # 用 resource tracker 管道的 inode 区分 tracker：spawn 出的子进程继承同一个管道
+    fd = resource_tracker.getfd()
+    if fd is None:
+        return None
+    try:
+        return os.fstat(fd).st_ino
+    except OSError:
+        return None
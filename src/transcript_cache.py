@@ -0,0 +1,196 @@
+"""
+识别结果缓存模块 - 按音频内容和解码参数寻址，同一段音频重试或重新处理时不必再跑一遍 Whisper
+
+键是 blake2b(音频字节 + 模型/解码参数)，每条结果是缓存目录下的一个 JSON 文件，保存完整的
+片段列表。总大小超过上限时按最近使用时间（文件 mtime，命中时刷新）淘汰最旧的条目。
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+_HASH_BLOCK = 1 << 20  # 分块哈希，np.memmap 不会被整体读入内存
+
+
+def audio_digest(audio, params: dict) -> str:
+    """
+    计算缓存键
+
+    Args:
+        audio: 音频文件路径或 NumPy 数组
+        params: 影响识别结果的参数（模型、计算类型、语言、解码参数等）
+
+    Returns:
+        32 位十六进制字符串
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True, default=str).encode("utf-8"))
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    h.update(f"{audio.dtype.str}{audio.shape}".encode("ascii"))
+    row_bytes = max(audio.itemsize * audio.size // max(len(audio), 1), 1)
+    rows = max(_HASH_BLOCK // row_bytes, 1)
+    for start in range(0, len(audio), rows):
+        # 连续数组的切片不复制
+        h.update(np.ascontiguousarray(audio[start:start + rows]).data)
+    return h.hexdigest()
+
+
+class TranscriptCache:
+    """识别结果磁盘缓存（线程安全）"""
+
+    def __init__(self, cache_dir: str = "~/.cache/typeless/transcripts", max_mb: float = 50.0):
+        """
+        初始化
+
+        Args:
+            cache_dir: 缓存目录
+            max_mb: 缓存总大小上限（MB）
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = int(max_mb * 2**20)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}  # 键 -> (大小, 最近使用时间)
+        self._total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        查询缓存
+
+        Returns:
+            {language, language_probability, duration, segments}；未命中时返回 None
+        """
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            # 被共用缓存目录的其他进程淘汰了
+            self._discard(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"识别缓存条目损坏，丢弃: {path}: {e}")
+            self._discard(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key] = (self._index[key][0], time.time())
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        """
+        保存一条结果（原子写入），超出上限时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            entry: {language, language_probability, duration, segments}
+        """
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"写入识别缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            previous = self._index.get(key)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._index[key] = (len(payload), time.time())
+            self._total_bytes += len(payload)
+            self.stores += 1
+            victims = self._select_victims()
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "size_mb": round(self._total_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _select_victims(self) -> list:
+        # 调用方持有锁
+        victims = []
+        if self._total_bytes <= self.max_bytes:
+            return victims
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            del self._index[key]
+            self._total_bytes -= size
+            self.evictions += 1
+            victims.append(key)
+        return victims
+
+    def _discard(self, key: str):
+        with self._lock:
+            size, _ = self._index.pop(key, (0, 0))
+            self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _scan(self):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self._index[name[:-5]] = (stat.st_size, stat.st_mtime)
+            self._total_bytes += stat.st_size
+        logger.info(
+            f"识别缓存: {len(self._index)} 条，{self._total_bytes / 2**20:.1f}MB（{self.cache_dir}）"
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
@@ -0,0 +1,5 @@
+"""测试配置 - 与 test.py 相同，模块按 src 下的平铺方式导入"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
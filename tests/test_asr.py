@@ -0,0 +1,13 @@
+"""ASR 引擎（src/asr.py）模型卸载测试"""
+from asr import ASREngine
+
+
+def test_unload_releases_small_model_when_large_model_is_not_loaded():
+    engine = ASREngine(model_size="large-v3-turbo", routing={"small_model": "tiny"},
+                       use_host_profile=False)
+    # 只用过小模型：大模型未加载（或已被卸载）
+    engine.small_engine.model = object()
+
+    assert engine.unload_model()
+    assert engine.small_engine.model is None
+    assert not engine.unload_model()
@@ -0,0 +1,42 @@
+"""ASR 服务客户端（src/asr_client.py）超时测试"""
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from asr_client import ASRClient
+
+
+def test_stalled_server_times_out_without_retry():
+    # 服务接受连接、读完请求后一直不响应（如卡住的一批解码）
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="typeless_test_"), "asr.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen()
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            accepted.append(conn)
+
+    threading.Thread(target=serve, daemon=True).start()
+    client = ASRClient(socket_path, request_timeout=0.2)
+    try:
+        started_at = time.monotonic()
+        with pytest.raises(TimeoutError):
+            client.request({"op": "ping"})
+        assert time.monotonic() - started_at < 1.0
+        assert len(accepted) == 1
+        # 超时的连接已关闭，下一次请求重新连接
+        assert getattr(client._local, "sock", None) is None
+    finally:
+        listener.close()
+        for conn in accepted:
+            conn.close()
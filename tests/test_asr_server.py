@@ -0,0 +1,75 @@
+"""常驻 ASR 服务（src/asr_server.py）批量解码与共享内存释放测试"""
+import logging
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+from asr import TranscriptionSegment
+from asr_server import ASRServer
+from shared_audio import release_audio, share_audio
+
+
+class FakeEngine:
+    """只实现服务用到的接口，批量解码立即返回"""
+
+    model_size = "fake"
+    is_loaded = True
+    language_cache = None
+    transcript_cache = None
+
+    def __init__(self):
+        self.decoded = []
+
+    def can_batch(self, audio, options):
+        return isinstance(audio, np.ndarray)
+
+    def transcribe_batch(self, audios, **options):
+        self.decoded.extend(weakref.ref(audio) for audio in audios)
+        return [
+            ([TranscriptionSegment(0.0, len(audio) / 16000, "好的", -0.1, 0.01)],
+             {"language": "zh", "language_probability": 0.99, "duration": len(audio) / 16000})
+            for audio in audios
+        ]
+
+
+def test_batched_shared_memory_requests_release_cleanly(caplog, monkeypatch):
+    closed = []
+
+    def checked_release(shm, unlink=False):
+        # 服务端关闭映射时不能还有对共享内存的引用（否则 BufferError）
+        if shm is not None:
+            shm.close()
+            closed.append(shm.name)
+
+    monkeypatch.setattr("asr_server.release_audio", checked_release)
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="typeless_test_"), "asr.sock")
+    engine = FakeEngine()
+    server = ASRServer(engine, socket_path, max_batch=2, max_wait_ms=500)
+    shared = [share_audio(np.zeros(16000, dtype=np.float32)) for _ in range(2)]
+    responses = []
+
+    def request(descriptor):
+        responses.append(server.handle_request({"op": "transcribe", "audio": descriptor}))
+
+    try:
+        with caplog.at_level(logging.WARNING):
+            threads = [threading.Thread(target=request, args=(descriptor,)) for _, descriptor in shared]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5.0)
+
+        assert [response["ok"] for response in responses] == [True, True], responses
+        assert [response["result"]["timing"]["batch_size"] for response in responses] == [2, 2]
+        assert len(closed) == 2
+        assert "共享内存仍被引用" not in caplog.text
+        # 批处理线程等待下一批时不再持有上一批共享内存上的音频
+        assert len(engine.decoded) == 2
+        assert all(ref() is None for ref in engine.decoded)
+    finally:
+        server.batcher.stop()
+        for shm, _ in shared:
+            release_audio(shm, unlink=True)
@@ -0,0 +1,27 @@
+"""录音缓冲区（src/audio_buffer.py）的测试"""
+import numpy as np
+
+from audio_buffer import RingBuffer
+
+
+def test_recording_buffer_keeps_the_head_when_full():
+    buffer = RingBuffer(1000, overwrite=False)
+    audio = np.arange(1500, dtype=np.int16).reshape(-1, 1)
+
+    assert buffer.write(audio[:600]) == 600
+    assert buffer.write(audio[600:1200]) == 400
+    assert buffer.write(audio[1200:]) == 0
+
+    assert buffer.full and not buffer.wrapped
+    np.testing.assert_array_equal(buffer.view(), audio[:1000])
+
+
+def test_preroll_buffer_keeps_the_tail():
+    buffer = RingBuffer(1000)
+    audio = np.arange(1500, dtype=np.int16).reshape(-1, 1)
+
+    buffer.write(audio[:600])
+    buffer.write(audio[600:])
+
+    assert buffer.wrapped
+    np.testing.assert_array_equal(buffer.view(), audio[500:])
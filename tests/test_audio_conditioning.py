@@ -0,0 +1,40 @@
+"""音频整理（src/audio_conditioning.py）的测试"""
+import numpy as np
+
+from audio_conditioning import condition_audio
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 160
+
+
+def recording_labels(seconds: float, speech: list) -> np.ndarray:
+    """整段录音的逐帧标签，speech 为 [(开始秒, 结束秒)]"""
+    labels = np.zeros(int(seconds * SAMPLE_RATE) // FRAME_SIZE, dtype=bool)
+    for start, end in speech:
+        labels[int(start * SAMPLE_RATE) // FRAME_SIZE:int(end * SAMPLE_RATE) // FRAME_SIZE] = True
+    return labels
+
+
+def assert_pieces_inside(audio: np.ndarray, conditioned: np.ndarray, timestamp_map):
+    total = 0
+    for cond_start, orig_start, length in timestamp_map.pieces:
+        assert length > 0
+        assert 0 <= orig_start and orig_start + length <= len(audio)
+        np.testing.assert_array_equal(conditioned[cond_start:cond_start + length],
+                                      audio[orig_start:orig_start + length])
+        total += length
+    assert total == len(conditioned)
+
+
+def test_truncated_peek_ignores_labels_past_the_audio():
+    # 提前识别只取到前 2 秒，标签却已覆盖 4 秒（第二段语音还在后面）
+    recording = np.arange(4 * SAMPLE_RATE, dtype=np.float32)
+    audio = recording[:2 * SAMPLE_RATE]
+    labels = recording_labels(4, [(0.5, 1.0), (2.5, 3.0)])
+
+    conditioned, timestamp_map, applied = condition_audio(audio, labels, FRAME_SIZE)
+
+    assert applied
+    assert timestamp_map.pieces == [(0, 4800, 14400)]
+    assert_pieces_inside(audio, conditioned, timestamp_map)
+
@@ -0,0 +1,54 @@
+"""录音器（src/audio_recorder.py）保存与缓冲区测试"""
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from audio_buffer import SpillBuffer
+
+try:
+    from audio_recorder import AudioRecorder
+except OSError as e:
+    # sounddevice 在导入时加载 PortAudio
+    pytest.skip(f"无法加载 PortAudio: {e}", allow_module_level=True)
+
+
+def spilled_recording(directory) -> np.ndarray:
+    buffer = SpillBuffer(1000, dtype="int16", directory=str(directory), grow_frames=1000)
+    buffer.write(np.arange(3000, dtype=np.int16).reshape(-1, 1))
+    assert buffer.spilled
+    return buffer.finalize()
+
+
+def test_save_whole_spill_recording_reuses_the_file(tmp_path):
+    audio = spilled_recording(tmp_path)
+
+    assert AudioRecorder().save_audio(audio) == audio.filename
+
+
+def test_save_slice_of_spill_recording_writes_only_the_slice(tmp_path):
+    audio = spilled_recording(tmp_path)
+    target = str(tmp_path / "head.wav")
+
+    assert AudioRecorder().save_audio(audio[:1200], target) == target
+
+    # 转存文件保持原样，保存的只是切出的部分
+    assert os.path.exists(audio.filename)
+    with wave.open(target, "rb") as wf:
+        assert wf.getnframes() == 1200
+        saved = np.frombuffer(wf.readframes(1200), dtype=np.int16)
+    np.testing.assert_array_equal(saved, np.arange(1200, dtype=np.int16))
+
+
+@pytest.mark.parametrize("max_duration", [0, None])
+def test_unlimited_max_duration_records_without_a_limit(tmp_path, max_duration):
+    recorder = AudioRecorder(max_duration=max_duration, spill_dir=str(tmp_path))
+    buffer = recorder._create_buffer()
+    audio = np.zeros((16000 * 90, 1), dtype=np.int16)
+
+    # 超过内存中保留的时长后转存到磁盘，录音不会写满
+    assert buffer.write(audio) == len(audio)
+    assert buffer.spilled and not buffer.full
+    recorder._buffer = buffer
+    recorder._discard_spill_file()
@@ -0,0 +1,69 @@
+"""流式润色（src/llm.py）中途断开时的回退测试"""
+import json
+
+import requests
+
+from llm import LLMProcessor
+
+RAW_TEXT = "嗯今天天气不错我们下午去公园散步吧"
+
+
+class BrokenStream:
+    """产出几行 NDJSON 后连接断开的 Ollama 流式响应"""
+
+    status_code = 200
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self):
+        for content in self.contents:
+            yield json.dumps({"message": {"content": content}, "done": False}).encode("utf-8")
+        raise requests.exceptions.ChunkedEncodingError("Connection broken: IncompleteRead")
+
+
+def broken_processor(monkeypatch, contents):
+    processor = LLMProcessor(provider="ollama", model="qwen2.5:7b")
+    monkeypatch.setattr(processor.session, "post", lambda *args, **kwargs: BrokenStream(contents))
+    return processor
+
+
+def test_broken_stream_falls_back_to_raw_text(monkeypatch):
+    processor = broken_processor(monkeypatch, ["今天天气不错，", "我们"])
+    received = []
+
+    result = processor.polish_stream(RAW_TEXT, on_delta=received.append)
+
+    assert result["polished_text"] == RAW_TEXT
+    assert "error" in result
+    # 未增量输出时已产出的部分只是展示用，不再追加原文
+    assert received == ["今天天气不错，", "我们"]
+
+
+def test_broken_stream_before_first_delta_passes_raw_text(monkeypatch):
+    processor = broken_processor(monkeypatch, [])
+    received = []
+
+    result = processor.polish_stream(RAW_TEXT, on_delta=received.append, incremental=True)
+
+    assert result["polished_text"] == RAW_TEXT
+    assert "error" in result
+    assert received == [RAW_TEXT]
+
+
+def test_broken_stream_after_incremental_output_appends_raw_remainder(monkeypatch):
+    processor = broken_processor(monkeypatch, ["今天天气不错，", "我们下午"])
+    received = []
+
+    result = processor.polish_stream(RAW_TEXT, on_delta=received.append, incremental=True)
+
+    assert result["polished_text"] == "今天天气不错，我们下午去公园散步吧"
+    assert "error" in result
+    # 已粘贴的部分无法撤回，只补上原文中还没润色到的内容
+    assert "".join(received) == result["polished_text"]
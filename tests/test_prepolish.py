@@ -0,0 +1,86 @@
+"""本地预润色（src/prepolish.py）的语料测试"""
+import pytest
+
+from prepolish import PrePolisher
+
+# (原始识别文本, 片段, 期望的清理结果（None 表示不检查）, 期望是否需要 LLM)
+CORPUS = [
+    ("好的，收到", None, "好的，收到。", False),
+    ("稍后回复你", None, "稍后回复你。", False),
+    ("嗯，好的", None, "好的。", False),
+    ("嗯好的没问题", None, "好的没问题。", False),
+    ("谢谢", None, "谢谢。", False),
+    ("收到，马上处理。", None, "收到，马上处理。", False),
+    ("好的，，马上。。", None, "好的，马上。", False),
+    ("那个，我晚点给你打电话", None, "我晚点给你打电话。", False),
+    ("嗯，那个，明天开会吗", None, "明天开会吗？", False),
+    ("我，我觉得可以", None, "我觉得可以。", False),
+    ("这个，这个方案不错", None, "这个方案不错。", False),
+    ("就是，我们下周再聊吧", None, "我们下周再聊吧。", False),
+    ("就是说我们下周再聊吧", None, "就是说我们下周再聊吧。", False),
+    ("那个文件发我一下", None, "那个文件发我一下。", False),
+    ("就是这样", None, "就是这样。", False),
+    ("啊，对，没错", None, "对，没错。", False),
+    ("um, sounds good", None, "sounds good.", False),
+    ("I I will send it tomorrow", None, "I will send it tomorrow.", False),
+    ("OK thanks", None, "OK thanks.", False),
+    ("嗯，那个，就是，呃，我觉得，就是，嗯，还行吧", None, "我觉得，还行吧。", False),
+    # 连续重复与叠字词
+    ("我我我想一下", None, "我想一下。", False),
+    ("我想我想我想一下", None, "我想一下。", False),
+    ("谢谢谢谢", None, "谢谢。", False),
+    ("谢谢谢谢谢谢", None, "谢谢。", False),
+    ("好好好好", None, "好好。", False),
+    ("对对对，就是这个", None, "对对，就是这个。", False),
+    ("好好学习", None, "好好学习。", False),
+    ("研究研究再说", None, "研究研究再说。", False),
+    ("哈哈哈太好笑了", None, "哈哈哈太好笑了。", False),
+    # 按片段边界补标点
+    ("好的", [{"start": 0.0, "end": 0.6, "text": "好的"}], "好的。", False),
+    ("今天下午三点开会记得带电脑",
+     [{"start": 0.0, "end": 1.4, "text": "今天下午三点开会"}, {"start": 1.6, "end": 2.5, "text": "记得带电脑"}],
+     "今天下午三点开会，记得带电脑。", False),
+    ("我到了你在哪",
+     [{"start": 0.0, "end": 0.8, "text": "我到了"}, {"start": 2.0, "end": 2.8, "text": "你在哪"}],
+     "我到了。你在哪？", False),
+    # 需要 LLM
+    ("嗯，那个，我今天，就是，我今天想要，不对，我想说的是我明天想要去，去公园散步", None, None, True),
+    ("我们周三，不对，周四下午开会", None, None, True),
+    ("把这个改成红色，算了还是蓝色吧", None, None, True),
+    ("我明天想要去，去公园散步", None, None, True),
+    ("关于下个季度的预算我觉得我们需要重新评估一下各个部门的投入产出比然后再决定是否追加", None, None, True),
+    ("I mean we should probably ship it next week", None, None, True),
+    ("嗯，那个，就是我们这个项目呢，嗯，下周，下周要交，然后那个，测试还没做完，呃，估计要延期", None, None, True),
+]
+
+
+@pytest.fixture(scope="module")
+def polisher():
+    return PrePolisher()
+
+
+@pytest.mark.parametrize("raw, segments, expected_text, expected_llm", CORPUS)
+def test_corpus(polisher, raw, segments, expected_text, expected_llm):
+    result = polisher.process(raw, segments)
+    if expected_text is not None:
+        assert result.text == expected_text
+    assert result.needs_llm == expected_llm, f"评分 {result.score}"
+
+
+@pytest.mark.parametrize("raw", ["嗯", "那个", "这个这个这个", "嗯，那个，呃", "um, uh"])
+def test_filler_only_becomes_empty(polisher, raw):
+    # 调用方据此按"未识别到内容"处理
+    result = polisher.process(raw)
+    assert result.text == ""
+    assert result.score == 0.0
+
+
+def test_zero_threshold_always_needs_llm():
+    assert PrePolisher(threshold=0).process("好的，收到").needs_llm
+
+
+def test_custom_fillers():
+    polisher = PrePolisher(fillers=["然后"])
+    assert polisher.process("然后，我们走吧").text == "我们走吧。"
+    assert polisher.process("嗯，我们走吧").text == "嗯，我们走吧。"  # 自定义列表替换默认列表
+    assert polisher.process("嗯我们走吧").text == "我们走吧。"  # 句首粘连的语气词规则不受影响